@@ -1,9 +1,21 @@
 import os
+import json
 import time
 import httpx
 import asyncio
+from collections import deque
 from logger import setup_module_logger
 import database as db
+import lease_lock
+from lease_lock import LeaseLock, PIPELINE_LOCK
+from analysis_writer import AnalysisBatchWriter
+from http_session import HttpSession
+from rate_limiter import AdaptiveLimiter
+from retry_policy import RetryPolicy
+import streaming
+from streaming import partial_analyses
+from analysis_scheduler import DeadlineScheduler
+from env_config import env_bool, env_float, env_int
 
 # 创建日志记录器 - 用于记录分析模块的日志信息
 logger = setup_module_logger('analysis_async')
@@ -23,17 +35,132 @@ HEADERS = {
     "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
 }
 
-async def analyze_hot_topic(topic: str, hot_value: str, client: httpx.AsyncClient):
+# 分析器与爬虫竞争同一把租约锁；爬虫持有时最多等待 ANALYZER_LOCK_WAIT 秒
+analyzer_lock = LeaseLock.from_env(PIPELINE_LOCK, 'analyzer')
+ANALYZER_LOCK_WAIT = env_float('ANALYZER_LOCK_WAIT', 10)
+
+# 所有分析请求共用的限流器：速率预算加自适应并发上限
+limiter = AdaptiveLimiter.from_env()
+# 每次请求预留的 token 数（提示词约200加上 max_tokens），响应返回后按实际用量退还
+ESTIMATED_TOKENS = 700
+# 收到 429 后按 Retry-After 等待并重试的次数
+THROTTLE_RETRIES = env_int('ANALYSIS_THROTTLE_RETRIES', 3)
+# 单话题分析是否以 SSE 流式请求（批量请求不使用流式）
+STREAM = env_bool('ANALYSIS_STREAM', False)
+# 每个请求合并分析的话题数，1 表示逐个请求；批量请求为每个话题预留的最大输出 token 数
+BATCH_SIZE = max(1, env_int('ANALYSIS_BATCH_SIZE', 1))
+BATCH_TOKENS_PER_TOPIC = 300
+# 分析接口的请求次数和 token 用量，以及批量请求合并/回退的话题数
+usage_stats = {
+    'requests': 0,
+    'prompt_tokens': 0,
+    'completion_tokens': 0,
+    'batch_requests': 0,
+    'batched_topics': 0,
+    'batch_fallbacks': 0,
+}
+# 按排名调度分析任务，并统计各排名区间的分析延迟
+rank_scheduler = DeadlineScheduler.from_env()
+# 分析失败的话题按指数退避重试，超过最大尝试次数后转为死信
+retry_policy = RetryPolicy.from_env()
+
+
+def create_analysis_session():
+    """
+    创建调用 DeepSeek 接口的长连接HTTP会话。
+
+    会话在 wait_for_initialization、one_time_analysis_mode、continuous_analysis_mode 的各轮分析
+    以及分析流水线之间共享，由 main.py 负责在退出时关闭，每轮分析不再重新建立连接。
+    连接池、保活和 HTTP/2 等参数可通过 ANALYSIS_HTTP_* 环境变量调整；连接池上限默认不低于分析并发数。
+    """
+    return HttpSession.from_env(
+        'deepseek', 'ANALYSIS_HTTP', timeout=60.0,
+        max_connections=max(20, limiter.max_concurrency), max_keepalive_connections=10, keepalive_expiry=90.0,
+    )
+
+
+class AnalysisError(Exception):
+    """分析接口调用失败或响应无法解析，该话题稍后按重试策略重新分析。"""
+
+async def _chat_completion(payload: dict, client: HttpSession, label: str, estimated_tokens: int,
+                           stream=False, partial_key=None):
+    """
+    发送一次对话补全请求，返回回复内容；429 时按限流器的暂停时间等待后重试。
+
+    参数:
+        stream (bool): 是否以 SSE 流式请求。
+        partial_key (tuple): 流式请求时把生成中的内容按 (榜单, 标题) 登记到 streaming.partial_analyses，
+            供爬虫在发布截止时先发布截断的分析。
+
+    异常:
+        AnalysisError: 请求失败、返回错误状态码或响应无法解析。
+    """
+    start_time = time.time()
+    content = None
+    try:
+        for attempt in range(THROTTLE_RETRIES + 1):
+            # 限流器控制并发和速率；429 时它会按 Retry-After 暂停后续请求，这里等待后重试
+            async with limiter.permit(estimated_tokens) as permit:
+                if not stream:
+                    # 超时使用会话的设置（ANALYSIS_HTTP_TIMEOUT）
+                    response = await client.post(API_URL, headers=HEADERS, json=payload)
+                    permit.observe(response)
+                else:
+                    # 流式请求的超时作用于相邻两个数据块之间，生成较长的内容不会超时
+                    streamed = dict(payload, stream=True, stream_options={"include_usage": True})
+                    async with client.stream('POST', API_URL, headers=HEADERS, json=streamed) as response:
+                        if response.status_code != 200:
+                            await response.aread()
+                            permit.observe(response)
+                        else:
+                            with partial_analyses.track(partial_key) as progress:
+                                content, usage = await streaming.read_sse(response, progress.append)
+                            permit.observe(response, usage.get('total_tokens'))
+            if response.status_code != 429 or attempt == THROTTLE_RETRIES:
+                break
+            logger.warning(f"{label} 的分析请求被限流，第 {attempt + 1} 次重试。")
+        elapsed = time.time() - start_time
+        
+        logger.debug(f"{label} API响应状态码: {response.status_code}，耗时: {elapsed:.2f}秒")
+        response.raise_for_status()
+        
+        if content is None:
+            result = response.json()
+            usage = result.get('usage') or {}
+            content = result['choices'][0]['message']['content']
+        usage_stats['requests'] += 1
+        usage_stats['prompt_tokens'] += usage.get('prompt_tokens', 0)
+        usage_stats['completion_tokens'] += usage.get('completion_tokens', 0)
+        if not content.strip():
+            raise ValueError("回复内容为空")
+        return content.strip()
+    except httpx.HTTPStatusError as e:
+        logger.error(f"API返回错误状态码 ({label}): {e.response.status_code}")
+        raise AnalysisError(f"API返回状态码 {e.response.status_code}") from e
+    except httpx.RequestError as e:
+        logger.error(f"API调用失败 ({label}): {e!r}")
+        raise AnalysisError(f"API调用失败: {e!r}") from e
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        logger.error(f"解析API响应失败 ({label}): {e}", exc_info=True)
+        if not stream:
+            logger.error(f"失败的响应内容: {response.text}")
+        raise AnalysisError("无法解析API响应") from e
+
+async def analyze_hot_topic(topic: str, hot_value: int, client: HttpSession, board: str = None):
     """
     使用DeepSeek API异步分析单个热搜话题。
 
     参数:
         topic (str): 热搜话题标题。
-        hot_value (str): 热搜热度值。
-        client (httpx.AsyncClient): 用于发送请求的HTTP客户端。
+        hot_value (int): 热搜热度值。
+        client (HttpSession): 分析接口的共享会话（也可以直接传入 httpx.AsyncClient）。
+        board (str): 话题所在榜单；ANALYSIS_STREAM 开启时用于登记生成中的分析，以便提前发布。
 
     返回值:
-        str: 分析结果，如果失败则返回错误信息。
+        str: 分析结果。
+
+    异常:
+        AnalysisError: 请求失败、返回错误状态码或响应无法解析。
     """
     logger.info(f"开始分析热搜话题: {topic}，热度: {hot_value}")
     
@@ -52,41 +179,156 @@ async def analyze_hot_topic(topic: str, hot_value: str, client: httpx.AsyncClien
         "max_tokens": 500
     }
 
-    start_time = time.time()
+    analysis = await _chat_completion(
+        payload, client, f"话题 '{topic}'", ESTIMATED_TOKENS,
+        stream=STREAM, partial_key=(board, topic) if board else None,
+    )
+    logger.info(f"话题 '{topic}' 分析完成，内容长度: {len(analysis)}字符")
+    return analysis
+
+def parse_batch_response(content: str, count: int):
+    """
+    解析批量分析返回的JSON。
+
+    参数:
+        content (str): 模型回复，应为 {"results": [{"id": 序号, "analysis": 分析内容}, ...]}。
+        count (int): 请求中的话题数量，序号从1开始。
+
+    返回值:
+        dict: {话题下标(从0开始): 分析内容}；格式不对、序号越界或内容为空的条目不包含在内。
+    """
+    # 模型偶尔会在JSON外面包一层代码块
+    start, end = content.find('{'), content.rfind('}')
+    if start < 0 or end < start:
+        return {}
     try:
-        # 增加超时以避免长时间等待
-        response = await client.post(API_URL, headers=HEADERS, json=payload, timeout=60.0)
-        elapsed = time.time() - start_time
-        
-        logger.debug(f"话题 '{topic}' API响应状态码: {response.status_code}，耗时: {elapsed:.2f}秒")
-        response.raise_for_status()
-        
-        result = response.json()
-        analysis = result['choices'][0]['message']['content'].strip()
-        
-        logger.info(f"话题 '{topic}' 分析完成，内容长度: {len(analysis)}字符")
-        return analysis
-    except httpx.RequestError as e:
-        logger.error(f"API调用失败 (话题: {topic}): {e}", exc_info=True)
-        return f"分析失败: {str(e)}"
-    except (KeyError, IndexError) as e:
-        logger.error(f"解析API响应失败 (话题: {topic}): {e}", exc_info=True)
-        logger.error(f"失败的响应内容: {response.text}")
-        return "分析失败: 无法解析API响应"
+        data = json.loads(content[start:end + 1])
+    except ValueError:
+        return {}
+    items = data.get('results') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return {}
+    results = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        index, text = item.get('id'), item.get('analysis')
+        if isinstance(index, str) and index.strip().isdigit():
+            index = int(index)
+        if (isinstance(index, int) and not isinstance(index, bool) and 1 <= index <= count
+                and isinstance(text, str) and text.strip()):
+            results[index - 1] = text.strip()
+    return results
+
+async def analyze_hot_topics_batch(topics: list, client: HttpSession):
+    """
+    在一个请求中分析多个热搜话题，要求模型以JSON返回每个话题的分析。
+
+    参数:
+        topics (list): [(话题标题, 热度值), ...]
+        client (HttpSession): 分析接口的共享会话（也可以直接传入 httpx.AsyncClient）。
+
+    返回值:
+        dict: {话题下标: 分析内容}，只包含解析成功的话题。
+
+    异常:
+        AnalysisError: 请求失败或返回错误状态码。
+    """
+    lines = '\n'.join(f"{i}. 热搜话题：{topic}；热度值：{hot_value}" for i, (topic, hot_value) in enumerate(topics, 1))
+    prompt = f"""请对以下 {len(topics)} 个微博热搜话题分别进行分析，简要解释每个话题的背景、关注原因以及社会影响。
+每个话题的分析控制在100字左右，不要有开头问候或结尾总结，直接给出分析内容。
+
+{lines}
+
+请只输出一个JSON对象，格式为 {{"results": [{{"id": 话题序号, "analysis": "分析内容"}}]}}，每个话题一项："""
+
+    payload = {
+        "model": "deepseek-chat",
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.7,
+        "max_tokens": min(8000, BATCH_TOKENS_PER_TOPIC * len(topics)),
+        "response_format": {"type": "json_object"},
+    }
+
+    label = f"{len(topics)} 个话题的批量请求"
+    content = await _chat_completion(payload, client, label, ESTIMATED_TOKENS * len(topics))
+    results = parse_batch_response(content, len(topics))
+    usage_stats['batch_requests'] += 1
+    usage_stats['batched_topics'] += len(results)
+    logger.info(f"{label}完成，解析出 {len(results)}/{len(topics)} 条分析。")
+    return results
+
+async def analyze_changes(changes: list, client: HttpSession):
+    """
+    分析一组变更的话题：多于一个时合并成一个批量请求，批量请求失败或解析不出的话题再逐个单独请求。
+
+    参数:
+        changes (list): 变更记录（需要有 title、hot_value 属性），数量不超过 BATCH_SIZE。
+        client (HttpSession): 分析接口的共享会话（也可以直接传入 httpx.AsyncClient）。
+
+    返回值:
+        list: 与 changes 一一对应的分析内容，失败的位置为异常对象。
+    """
+    results = {}
+    if len(changes) > 1:
+        try:
+            results = await analyze_hot_topics_batch([(c.title, c.hot_value) for c in changes], client)
+        except AnalysisError as e:
+            logger.warning(f"批量分析请求失败，改为逐个分析 {len(changes)} 个话题: {e}")
+    missing = [i for i in range(len(changes)) if i not in results]
+    if len(changes) > 1:
+        usage_stats['batch_fallbacks'] += len(missing)
+    single = await asyncio.gather(
+        *(analyze_hot_topic(changes[i].title, changes[i].hot_value, client, getattr(changes[i], 'board', None))
+          for i in missing),
+        return_exceptions=True,
+    )
+    results.update(zip(missing, single))
+    for i, change in enumerate(changes):
+        if not isinstance(results[i], BaseException):
+            partial_analyses.settle((getattr(change, 'board', None), change.title), failed=False)
+    return [results[i] for i in range(len(changes))]
+
+async def record_failure(writer, change, error):
+    """
+    按重试策略记录一次分析失败，交给批量写入器写库。
 
-async def process_unanalyzed_topics(max_concurrent_tasks=10):
+    参数:
+        writer (AnalysisBatchWriter): 批量写入器。
+        change: 分析失败的变更记录（需要有 id、board、title、attempt_count 属性）。
+        error (Exception): 失败原因。
+
+    返回值:
+        tuple: (写入完成的 Future, 下一次重试时间；转为死信时为None)
+    """
+    attempts = (change.attempt_count or 0) + 1
+    is_dead, next_retry_at = retry_policy.on_failure(attempts)
+    if is_dead:
+        logger.error(f"话题 '{change.title}' 已连续分析失败 {attempts} 次，转为死信: {error}")
+    else:
+        logger.warning(
+            f"话题 '{change.title}' 第 {attempts} 次分析失败，将于 {next_retry_at:%H:%M:%S} 重试: {error}"
+        )
+    future = await writer.add_failure(change, str(error) or type(error).__name__, attempts, next_retry_at)
+    partial_analyses.settle((change.board, change.title), failed=True)
+    return future, next_retry_at
+
+async def process_unanalyzed_topics(max_concurrent_tasks=10, session: HttpSession = None):
     """
     使用asyncio并发处理所有未分析的热搜话题。
 
+    话题按排名从前到后交给 max_concurrent_tasks 个工作协程依次分析，靠前的话题先占用分析接口的并发名额。
+
     参数:
         max_concurrent_tasks (int): 最大并发任务数。
+        session (HttpSession): 跨轮次共享的分析会话；为None时本轮临时创建一个。
 
     返回值:
-        int: 成功处理的热搜话题数量。
+        int: 成功分析的热搜话题数量（失败的话题按重试策略安排下一次分析，不计入）。
     """
     logger.info(f"开始处理未分析的热搜话题，最大并发数: {max_concurrent_tasks}")
     
-    if not await db.acquire_analyzer_lock():
+    if not await analyzer_lock.acquire(timeout=ANALYZER_LOCK_WAIT):
         logger.info("无法获取分析锁，爬虫程序可能正在运行，跳过本次分析")
         return 0
 
@@ -101,58 +343,108 @@ async def process_unanalyzed_topics(max_concurrent_tasks=10):
         topic_count = len(topics_to_analyze)
         logger.info(f"找到 {topic_count} 条需要分析的热搜话题")
         
-        # 使用信号量控制并发数量
-        semaphore = asyncio.Semaphore(max_concurrent_tasks)
+        # 并发数由限流器根据延迟和限流响应在 [ANALYSIS_MIN_CONCURRENCY, max_concurrent_tasks] 之间调整
+        limiter.cap(max_concurrent_tasks)
         
-        async def analyze_and_update(change, client):
-            """获取信号量，执行分析并更新数据库。"""
-            async with semaphore:
+        round_start = time.monotonic()
+
+        async def analyze_and_update(group, client, writer):
+            """分析一组话题并把结果交给批量写入器，失败的话题记录重试状态，返回分析成功的数量。"""
+            for change in group:
                 logger.info(f"工作协程开始分析排名 {change.rank_num} 的话题: {change.title}")
-                start_time = time.time()
-                analysis_result = await analyze_hot_topic(change.title, change.hot_value, client)
-                await db.mark_change_processed(change.id, analysis_result)
+            start_time = time.time()
+            started = time.monotonic()
+            try:
+                results = await analyze_changes(group, client)
+            except Exception as e:
+                logger.error(f"分析 {len(group)} 个话题时发生异常: {e}", exc_info=True)
+                results = [e] * len(group)
+            finished = time.monotonic()
+            succeeded = 0
+            for change, result in zip(group, results):
+                rank_scheduler.observe(change.rank_num, finished - started)
+                if isinstance(result, BaseException):
+                    if not isinstance(result, AnalysisError):
+                        logger.error(f"分析话题 {change.title} 时发生异常: {result}", exc_info=result)
+                    await record_failure(writer, change, result)
+                    continue
+                await writer.add(change, result)
+                rank_scheduler.record_latency(change.rank_num, (finished - round_start) * 1000)
+                succeeded += 1
                 elapsed = time.time() - start_time
                 logger.info(f"话题 '{change.title}' 处理完成，用时: {elapsed:.2f}秒")
+            return succeeded
 
-        async with httpx.AsyncClient() as client:
-            tasks = [analyze_and_update(change, client) for change in topics_to_analyze]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+        # 每 BATCH_SIZE 个话题合并成一个请求，按排名顺序放入待分析队列
+        ordered = sorted(topics_to_analyze, key=lambda c: (c.attempt_count or 0, rank_scheduler.priority(c.rank_num), c.id))
+        groups = deque(ordered[i:i + BATCH_SIZE] for i in range(0, topic_count, BATCH_SIZE))
 
-            for i, result in enumerate(results):
-                if isinstance(result, Exception):
-                    logger.error(f"处理话题 {topics_to_analyze[i].title} 时发生异常: {result}", exc_info=result)
-                else:
-                    processed_count += 1
+        async def worker(client, writer):
+            succeeded = 0
+            while groups:
+                group = groups.popleft()
+                try:
+                    succeeded += await analyze_and_update(group, client, writer)
+                except Exception as e:
+                    logger.error(f"处理话题 {group[0].title} 等 {len(group)} 个话题时发生异常: {e}", exc_info=True)
+            return succeeded
+
+        own_session = session is None
+        if own_session:
+            session = create_analysis_session()
+        try:
+            # 分析结果由写入器合并后批量写库；退出时写入剩余结果，保证释放锁之前结果已全部落库
+            async with AnalysisBatchWriter.from_env() as writer:
+                workers = min(max_concurrent_tasks, len(groups))
+                processed_count = sum(await asyncio.gather(*(worker(session, writer) for _ in range(workers))))
+        finally:
+            if own_session:
+                await session.aclose()
         
-        logger.info(f"并发分析完成，成功处理 {processed_count}/{topic_count} 条热搜话题")
+        logger.info(
+            f"并发分析完成，成功处理 {processed_count}/{topic_count} 条热搜话题。"
+            f"各排名区间的分析延迟: {rank_scheduler.metrics()}，接口用量: {usage_stats}，"
+            f"流式统计: {partial_analyses.metrics()}，限流器状态: {limiter.metrics()}，"
+            f"HTTP连接: {session.stats()}"
+        )
 
     finally:
-        await db.release_analyzer_lock()
-        
+        await analyzer_lock.release()
+        logger.debug(f"分析器锁竞争统计: {analyzer_lock.metrics()}")
+
     return processed_count
 
-async def continuous_analysis_mode(max_concurrent_tasks=10):
+async def continuous_analysis_mode(max_concurrent_tasks=10, session: HttpSession = None):
     """
     以持续模式运行，定期检查并分析新的热搜话题。
+
+    参数:
+        session (HttpSession): 跨轮次共享的分析会话；为None时在本循环内创建并负责关闭。
     """
+    if session is None:
+        async with create_analysis_session() as own_session:
+            return await continuous_analysis_mode(max_concurrent_tasks, own_session)
+
     logger.info(f"启动连续分析模式，最大并发数: {max_concurrent_tasks}")
     
+    last_backlog = None
     while True:
         try:
-            status = await db.get_system_status()
-            if status and status.is_updating:
-                logger.info("爬虫程序正在运行，等待其完成后再分析...")
-                await asyncio.sleep(3)
-                continue
-                
-            processed_count = await process_unanalyzed_topics(max_concurrent_tasks)
+            processed_count = await process_unanalyzed_topics(max_concurrent_tasks, session)
             
             if processed_count > 0:
-                logger.info(f"本轮分析完成，共处理 {processed_count} 条热搜话题")
+                logger.info(f"本轮分析完成，共处理 {processed_count} 条热搜话题。锁竞争统计: {analyzer_lock.metrics()}")
+
+            # 重试积压有变化时记录一次，已到重试时间的话题会在下一轮与新话题一起取出
+            backlog = await db.get_retry_backlog()
+            if (backlog['waiting'], backlog['dead']) != last_backlog:
+                logger.info(f"分析重试队列: {backlog}")
+                last_backlog = (backlog['waiting'], backlog['dead'])
             
-            check_interval = 5  # 每5秒检查一次
-            logger.debug(f"等待 {check_interval} 秒后再次检查...")
-            await asyncio.sleep(check_interval)
+            # 爬虫写入新话题后释放锁时会立即唤醒这里，否则最多等待5秒后再次检查
+            check_interval = 5
+            logger.debug(f"等待爬虫释放锁或 {check_interval} 秒后再次检查...")
+            await lease_lock.wait_released(PIPELINE_LOCK, check_interval)
             
         except asyncio.CancelledError:
             logger.info("分析任务被用户中断")
@@ -162,13 +454,16 @@ async def continuous_analysis_mode(max_concurrent_tasks=10):
             logger.info("等待30秒后重试...")
             await asyncio.sleep(30)
 
-async def one_time_analysis_mode(max_concurrent_tasks=10):
+async def one_time_analysis_mode(max_concurrent_tasks=10, session: HttpSession = None):
     """
     一次性分析所有未处理的热搜话题，然后退出。
+
+    参数:
+        session (HttpSession): 共享的分析会话；为None时临时创建一个。
     """
     logger.info(f"启动一次性分析模式，最大并发数: {max_concurrent_tasks}")
     try:
-        processed_count = await process_unanalyzed_topics(max_concurrent_tasks)
+        processed_count = await process_unanalyzed_topics(max_concurrent_tasks, session)
         logger.info(f"分析完成，共处理 {processed_count} 条热搜话题")
         
         if processed_count > 0:
@@ -182,10 +477,17 @@ async def one_time_analysis_mode(max_concurrent_tasks=10):
         logger.error(f"分析过程中发生错误: {e}", exc_info=True)
         return 0
 
-async def wait_for_initialization(max_concurrent_tasks=10):
+async def wait_for_initialization(max_concurrent_tasks=10, session: HttpSession = None):
     """
     持续分析，直到所有初始化时爬取的热搜都已处理完毕。
+
+    参数:
+        session (HttpSession): 各轮分析共享的会话；为None时在本函数内创建并负责关闭。
     """
+    if session is None:
+        async with create_analysis_session() as own_session:
+            return await wait_for_initialization(max_concurrent_tasks, own_session)
+
     logger.info(f"等待热搜初始化分析完成，最大并发数: {max_concurrent_tasks}")
     
     while True:
@@ -200,7 +502,7 @@ async def wait_for_initialization(max_concurrent_tasks=10):
         
         logger.info(f"还有 {unprocessed_count} 条热搜等待分析...")
         
-        processed_this_round = await process_unanalyzed_topics(max_concurrent_tasks)
+        processed_this_round = await process_unanalyzed_topics(max_concurrent_tasks, session)
         if processed_this_round == 0:
             logger.warning("本轮未处理任何热搜，但仍有未处理项，等待10秒后重试")
             await asyncio.sleep(10)
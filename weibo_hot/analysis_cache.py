@@ -0,0 +1,167 @@
+"""
+分析缓存模块
+话题掉出榜单后再次上榜时，按规范化标题从 analysis_cache 表中取回之前的分析，
+不再写入变更表等待分析，节省一次分析接口调用
+
+- 缓存条目在分析结果写库时一并写入（见 db.mark_changes_processed）
+- 精确匹配未命中时，在内存中的近似标题索引（见 near_duplicate）里查找改写过的同一话题；
+  默认只记录近似匹配供核查（ANALYSIS_CACHE_NEAR_DUP 开启后才复用其分析），避免把其他话题的分析当作本话题发布
+- 生成时间超过有效期的条目不再复用；条目数超过上限时淘汰最久未使用的条目
+- 统计查询次数、命中率和节省的接口调用次数
+"""
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from logger import setup_module_logger
+import database as db
+from env_config import env_bool, env_float, env_int
+from near_duplicate import MinHashIndex
+from topic_key import title_key
+
+# 创建日志记录器 - 用于记录分析缓存模块的日志信息
+logger = setup_module_logger('analysis_cache')
+
+
+class TopicAnalysisCache:
+    """
+    爬虫在写入变更表之前查询的分析缓存。
+
+    lookup() 返回命中的标题及其缓存的分析；查询失败时当作全部未命中，不影响榜单同步。
+    近似标题索引在每次查询前从数据库增量加载新写入的缓存条目，并移除超过有效期的条目。
+    """
+
+    def __init__(self, ttl_hours=24.0, max_entries=5000, enabled=True, near_duplicates=False, min_similarity=0.8,
+                 audit_size=20):
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.enabled = enabled
+        # 近似标题索引总是维护；near_duplicates 为False时只记录匹配结果，不复用分析
+        self.near_duplicates = near_duplicates
+        self.index = MinHashIndex(min_similarity) if enabled else None
+        self._indexed_at = {}      # 缓存键 -> 分析时间，用于移除过期的索引条目
+        self._watermark = None     # 已加载到索引中的最新分析时间
+
+        self.lookups = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.near_matches = 0
+        self.recent_near = deque(maxlen=audit_size)  # 最近的近似匹配，供上线复用前人工核查
+        self.errors = 0
+        self.total_query_us = 0.0
+        self.max_query_us = 0.0
+        self.queries = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建分析缓存。
+
+        ANALYSIS_CACHE: 是否启用分析缓存
+        ANALYSIS_CACHE_TTL_HOURS: 缓存的分析在生成后多少小时内可以复用
+        ANALYSIS_CACHE_MAX_ENTRIES: 缓存条目数上限
+        ANALYSIS_CACHE_NEAR_DUP: 是否复用近似标题的分析（关闭时只记录近似匹配）
+        ANALYSIS_CACHE_SIMILARITY: 判定为近似标题的最低 Jaccard 相似度
+        """
+        return cls(
+            ttl_hours=env_float('ANALYSIS_CACHE_TTL_HOURS', 24),
+            max_entries=env_int('ANALYSIS_CACHE_MAX_ENTRIES', 5000),
+            enabled=env_bool('ANALYSIS_CACHE', True),
+            near_duplicates=env_bool('ANALYSIS_CACHE_NEAR_DUP', False),
+            min_similarity=env_float('ANALYSIS_CACHE_SIMILARITY', 0.8),
+        )
+
+    async def lookup(self, titles):
+        """
+        查询一组新上榜话题的缓存分析，先精确匹配，未命中的再查找近似标题。
+
+        返回值:
+            dict: {标题: {'analysis_content', 'analysis_time'}}，只包含命中的标题。
+        """
+        if not self.enabled or not titles:
+            return {}
+        self.lookups += len(titles)
+        try:
+            hits = await db.lookup_analysis_cache({title: title_key(title) for title in titles}, self.ttl_seconds)
+            misses = [title for title in titles if title not in hits]
+            if misses and self.index is not None:
+                hits.update(await self._lookup_near(misses))
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"查询分析缓存失败，本次按未命中处理: {e}", exc_info=True)
+            return {}
+        self.hits += len(hits)
+        return hits
+
+    async def _lookup_near(self, titles):
+        await self._refresh_index()
+        matches = {}
+        for title in titles:
+            start = time.perf_counter()
+            match = self.index.query(title, exclude=title_key(title))
+            query_us = (time.perf_counter() - start) * 1e6
+            self.queries += 1
+            self.total_query_us += query_us
+            self.max_query_us = max(self.max_query_us, query_us)
+            if match:
+                key, similarity, matched_title = match
+                self.near_matches += 1
+                self.recent_near.append({
+                    'title': title, 'matched': matched_title,
+                    'similarity': round(similarity, 3), 'reused': self.near_duplicates,
+                })
+                if self.near_duplicates:
+                    matches[title] = key
+                    logger.info(f"话题 '{title}' 与已分析的 '{matched_title}' 近似（相似度 {similarity:.2f}），复用其分析。")
+                else:
+                    logger.info(f"话题 '{title}' 与已分析的 '{matched_title}' 近似（相似度 {similarity:.2f}），未开启复用，仅记录。")
+        if not matches:
+            return {}
+        hits = await db.lookup_analysis_cache(matches, self.ttl_seconds)
+        self.near_hits += len(hits)
+        return hits
+
+    async def _refresh_index(self):
+        """把新写入的缓存条目加入索引，并移除超过有效期的条目。"""
+        expire_before = datetime.now() - timedelta(seconds=self.ttl_seconds)
+        for key, analysis_time in list(self._indexed_at.items()):
+            if analysis_time < expire_before:
+                self.index.remove(key)
+                del self._indexed_at[key]
+        since = self._watermark if self._watermark and self._watermark > expire_before else expire_before
+        for key, title, analysis_time in await db.load_analysis_cache_titles(since):
+            # 重新分析后缓存键不变，先移除旧条目再按新标题加入
+            self.index.remove(key)
+            self.index.add(key, title)
+            self._indexed_at[key] = analysis_time
+            self._watermark = analysis_time
+
+    async def prune(self):
+        """删除过期条目，并把条目数控制在上限以内。"""
+        if not self.enabled:
+            return 0
+        return await db.prune_analysis_cache(self.ttl_seconds, self.max_entries)
+
+    def stats(self):
+        """
+        返回查询次数、命中次数（其中近似命中的次数）、命中率、节省的分析接口调用次数和近似查询耗时；
+        near_matches 和 recent_near 是近似匹配的次数和最近的匹配明细（无论是否复用），用于核查误匹配。
+        """
+        return {
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'near_hits': self.near_hits,
+            'near_reuse': self.near_duplicates,
+            'near_matches': self.near_matches,
+            'recent_near': list(self.recent_near),
+            'hit_ratio': round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+            'saved_api_calls': self.hits,
+            'indexed': len(self.index) if self.index is not None else 0,
+            'avg_near_query_us': round(self.total_query_us / self.queries, 1) if self.queries else 0.0,
+            'max_near_query_us': round(self.max_query_us, 1),
+            'errors': self.errors,
+        }
+
+
+# 爬虫进程内共享的缓存实例
+analysis_cache = TopicAnalysisCache.from_env()
@@ -0,0 +1,120 @@
+"""
+分析任务调度模块
+按排名决定分析顺序，并根据观测到的分析耗时判断能否在爬虫发布最终表之前完成：
+
+- 排名越靠前越先分析；同一排名区间的分析耗时用指数滑动平均估计
+- 任务带有发布截止时间时，前 protected_ranks 名总是按时分析；其余任务如果预计完成时间晚于截止时间，
+  不再计入本轮发布并排到其他新话题之后，爬虫不必为它们等到超时
+- 按排名区间统计从入队到分析完成的延迟分位数
+"""
+from collections import deque
+
+from env_config import env_float, env_int
+
+# 统计延迟的排名区间：(起始排名, 结束排名)
+RANK_BANDS = [(1, 5), (6, 10), (11, 20), (21, 50)]
+
+
+def rank_band(rank):
+    """排名所在区间的名称，例如 '1-5'；超出最后一个区间时为 '51+'。"""
+    for low, high in RANK_BANDS:
+        if low <= (rank or 0) <= high:
+            return f"{low}-{high}"
+    return f"{RANK_BANDS[-1][1] + 1}+"
+
+
+def percentiles(samples):
+    """返回样本的 p50、p95 和最大值（保留一位小数）。"""
+    if not samples:
+        return {'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    ordered = sorted(samples)
+    return {
+        'p50': round(ordered[len(ordered) // 2], 1),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+        'max': round(ordered[-1], 1),
+    }
+
+
+class DeadlineScheduler:
+    """
+    排名优先、考虑发布截止时间的分析调度器。
+
+    observe() 记录每次分析请求的耗时，用于估计同一排名区间的任务还需要多久；
+    should_defer() 判断一个任务在截止时间之前是否来得及完成；
+    record_latency() 记录从入队到分析完成的延迟，metrics() 输出各排名区间的分位数。
+    """
+
+    def __init__(self, protected_ranks=5, safety_factor=1.2, smoothing=0.3, max_samples=500):
+        self.protected_ranks = protected_ranks
+        self.safety_factor = safety_factor
+        self.smoothing = smoothing
+        self._service_s = {}   # 排名区间 -> 分析耗时的滑动平均（秒）
+        self._overall_s = None
+        self._latency_ms = {}  # 排名区间 -> 入队到分析完成的延迟样本
+        self._max_samples = max_samples
+        self.deferred = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建调度器。
+
+        ANALYSIS_PROTECTED_RANKS: 排名在此之内的话题不会因截止时间被推迟
+        ANALYSIS_DEADLINE_SAFETY: 估计完成时间时对平均耗时乘上的安全系数
+        """
+        return cls(
+            protected_ranks=env_int('ANALYSIS_PROTECTED_RANKS', 5),
+            safety_factor=env_float('ANALYSIS_DEADLINE_SAFETY', 1.2),
+        )
+
+    @staticmethod
+    def priority(rank):
+        """队列中的排序键：排名越靠前越先分析，没有排名的排在最后。"""
+        return rank if rank else 1_000_000
+
+    def observe(self, rank, seconds):
+        """记录一次分析请求的耗时。"""
+        band = rank_band(rank)
+        previous = self._service_s.get(band)
+        self._service_s[band] = seconds if previous is None else previous + self.smoothing * (seconds - previous)
+        previous = self._overall_s
+        self._overall_s = seconds if previous is None else previous + self.smoothing * (seconds - previous)
+
+    def estimate(self, rank):
+        """估计分析该排名的话题需要的秒数；还没有任何观测时返回None。"""
+        return self._service_s.get(rank_band(rank), self._overall_s)
+
+    def should_defer(self, rank, deadline, now):
+        """
+        判断任务是否赶不上截止时间、应当推迟。
+
+        参数:
+            rank (int): 话题排名。
+            deadline (float): 发布截止时间（time.monotonic()），为None表示没有截止时间。
+            now (float): 当前时间（time.monotonic()）。
+        """
+        if deadline is None or now >= deadline or (rank or 0) <= self.protected_ranks:
+            return False
+        estimate = self.estimate(rank)
+        if estimate is None:
+            return False
+        return now + estimate * self.safety_factor > deadline
+
+    def record_latency(self, rank, ms):
+        """记录从入队到分析完成的延迟（毫秒）。"""
+        band = rank_band(rank)
+        if band not in self._latency_ms:
+            self._latency_ms[band] = deque(maxlen=self._max_samples)
+        self._latency_ms[band].append(ms)
+
+    def metrics(self):
+        """返回各排名区间的延迟分位数、估计的分析耗时和被推迟的任务数。"""
+        bands = [f"{low}-{high}" for low, high in RANK_BANDS] + [rank_band(RANK_BANDS[-1][1] + 1)]
+        return {
+            'latency_ms': {
+                band: dict(percentiles(self._latency_ms[band]), n=len(self._latency_ms[band]))
+                for band in bands if band in self._latency_ms
+            },
+            'estimate_s': {band: round(value, 2) for band, value in self._service_s.items()},
+            'deferred': self.deferred,
+        }
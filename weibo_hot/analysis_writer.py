@@ -0,0 +1,212 @@
+"""
+分析结果批量写入模块
+缓冲已完成的分析结果，达到数量或时间阈值时在一个事务中批量写入数据库
+"""
+import asyncio
+import time
+from datetime import datetime
+
+import database as db
+from logger import setup_module_logger
+from env_config import env_float, env_int
+
+# 创建日志记录器 - 用于记录批量写入模块的日志信息
+logger = setup_module_logger('analysis_writer')
+
+
+def _resolve(item, written):
+    """通知等待该结果的调用方写入是否成功。"""
+    if not item['future'].done():
+        item['future'].set_result(written)
+
+
+class AnalysisBatchWriter:
+    """
+    合并分析结果写入的异步批量写入器。
+
+    并发的分析协程调用 add() 只是把结果放进缓冲区；后台任务在缓冲区达到 max_batch_size
+    或最早的结果已等待 max_delay 秒时，调用 db.mark_changes_processed 一次性写入。
+    分析失败的重试状态通过 add_failure() 加入同一个缓冲区，与分析结果在同一个事务中写入。
+    写入失败的结果会放回缓冲区重试，连续失败 max_attempts 次后放弃（变更保持未处理状态，之后会被重新分析）。
+    """
+
+    def __init__(self, max_batch_size=20, max_delay=1.0, max_attempts=3):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self._pending = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+
+        self.flush_count = 0
+        self.written = 0
+        self.dropped = 0
+        self.max_batch = 0
+        self.total_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_queue_ms = 0.0  # 结果从加入缓冲区到写入完成的累计等待时间
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建批量写入器。
+
+        ANALYSIS_WRITE_BATCH: 达到该数量时立即写入
+        ANALYSIS_WRITE_DELAY: 结果在缓冲区中最长等待的秒数
+        """
+        return cls(
+            max_batch_size=env_int('ANALYSIS_WRITE_BATCH', 20),
+            max_delay=env_float('ANALYSIS_WRITE_DELAY', 1.0),
+        )
+
+    def start(self):
+        """启动后台写入任务。"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def add(self, change, analysis):
+        """
+        加入一条分析结果。
+
+        参数:
+            change: 被分析的变更记录（需要有 id、board、title 属性）。
+            analysis (str): 分析内容。
+
+        返回值:
+            asyncio.Future: 结果写入数据库后完成，值为是否写入成功。
+        """
+        return self._append(change, analysis=analysis, analysis_time=datetime.now(), error=None)
+
+    async def add_failure(self, change, error, attempt_count, next_retry_at):
+        """
+        加入一条分析失败记录。
+
+        参数:
+            change: 分析失败的变更记录（需要有 id、board、title 属性）。
+            error (str): 失败原因。
+            attempt_count (int): 包括本次在内已尝试的次数。
+            next_retry_at (datetime): 下一次重试时间，为None表示转为死信。
+
+        返回值:
+            asyncio.Future: 记录写入数据库后完成，值为是否写入成功。
+        """
+        return self._append(
+            change, error=error, attempt_count=attempt_count,
+            next_retry_at=next_retry_at, is_dead=next_retry_at is None,
+        )
+
+    def _append(self, change, **fields):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append({
+            'change_id': change.id,
+            'board': change.board,
+            'title': change.title,
+            **fields,
+            'added_at': time.monotonic(),
+            'attempts': 0,
+            'future': future,
+        })
+        # 缓冲区由空变为非空时唤醒后台任务开始计时，达到批大小时唤醒它立即写入
+        if len(self._pending) == 1 or len(self._pending) >= self.max_batch_size:
+            self._wakeup.set()
+        return future
+
+    async def _run(self):
+        while not self._closing:
+            if not self._pending:
+                await self._wakeup.wait()
+            else:
+                # 从最早一条结果加入时开始计时，到期或数量达到阈值时写入
+                remaining = self._pending[0]['added_at'] + self.max_delay - time.monotonic()
+                if remaining > 0 and len(self._pending) < self.max_batch_size:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+            self._wakeup.clear()
+            if self._closing:
+                break
+            if self._pending and (len(self._pending) >= self.max_batch_size
+                                  or time.monotonic() - self._pending[0]['added_at'] >= self.max_delay):
+                if not await self.flush():
+                    # 写入失败时等待一段时间再重试，避免连续失败时空转
+                    await asyncio.sleep(self.max_delay)
+
+    async def flush(self):
+        """立即写入缓冲区中的所有结果，返回是否全部写入成功。"""
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:len(batch)]
+            start = time.monotonic()
+            try:
+                await db.mark_changes_processed(
+                    [item for item in batch if item['error'] is None],
+                    [item for item in batch if item['error'] is not None],
+                )
+            except Exception as e:
+                logger.error(f"批量写入 {len(batch)} 条分析结果失败: {e}", exc_info=True)
+                retry = []
+                for item in batch:
+                    item['attempts'] += 1
+                    if item['attempts'] < self.max_attempts:
+                        retry.append(item)
+                    else:
+                        self.dropped += 1
+                        _resolve(item, False)
+                        logger.error(f"分析结果写入多次失败，已放弃: {item['title']}（变更ID {item['change_id']}）")
+                self._pending[:0] = retry
+                return False
+            end = time.monotonic()
+            flush_ms = (end - start) * 1000
+            self.flush_count += 1
+            self.written += len(batch)
+            self.max_batch = max(self.max_batch, len(batch))
+            self.total_flush_ms += flush_ms
+            self.max_flush_ms = max(self.max_flush_ms, flush_ms)
+            self.total_queue_ms += sum((end - item['added_at']) * 1000 for item in batch)
+            for item in batch:
+                _resolve(item, True)
+        return True
+
+    def stats(self):
+        """返回写入次数、批大小和写入耗时统计。"""
+        flushes = self.flush_count
+        return {
+            'flushes': flushes,
+            'written': self.written,
+            'dropped': self.dropped,
+            'pending': len(self._pending),
+            'avg_batch': round(self.written / flushes, 1) if flushes else 0.0,
+            'max_batch': self.max_batch,
+            'avg_flush_ms': round(self.total_flush_ms / flushes, 1) if flushes else 0.0,
+            'max_flush_ms': round(self.max_flush_ms, 1),
+            'avg_queue_ms': round(self.total_queue_ms / self.written, 1) if self.written else 0.0,
+        }
+
+    async def aclose(self):
+        """停止后台任务并写入剩余的结果。"""
+        if self._task is not None:
+            # 不直接取消任务，避免中断正在进行的写入；等它结束当前写入后退出
+            self._closing = True
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for _ in range(self.max_attempts):
+            if not self._pending:
+                break
+            await self.flush()
+        if self._pending:
+            self.dropped += len(self._pending)
+            logger.error(f"关闭时仍有 {len(self._pending)} 条分析结果未能写入，已放弃。")
+            for item in self._pending:
+                _resolve(item, False)
+            self._pending.clear()
+        logger.info(f"分析结果批量写入统计: {self.stats()}")
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
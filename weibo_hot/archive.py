@@ -0,0 +1,100 @@
+"""
+热搜页面存档模块
+将抓取到的原始HTML按时间压缩存档，供离线回放使用
+
+存档目录结构：
+    <根目录>/<榜单>/<YYYYMMDD>/<HHMMSS_微秒>.html.gz
+文件路径本身即时间索引，按路径排序就是按抓取时间排序。
+"""
+import gzip
+import heapq
+import os
+from datetime import datetime
+
+from logger import setup_module_logger
+
+# 创建日志记录器 - 用于记录存档模块的日志信息
+logger = setup_module_logger('archive')
+
+_DAY_FORMAT = '%Y%m%d'
+_FILE_FORMAT = '%H%M%S_%f'
+_SUFFIX = '.html.gz'
+
+
+class SnapshotArchive:
+    """按榜单和时间组织的压缩页面存档。"""
+
+    def __init__(self, root, compress_level=6):
+        self.root = root
+        self.compress_level = compress_level
+
+    def record(self, board, html, fetch_time=None):
+        """
+        存档一个页面。
+
+        参数:
+            board (str): 榜单标识。
+            html (str): 页面HTML。
+            fetch_time (datetime): 抓取时间，默认当前时间。
+
+        返回值:
+            str: 存档文件路径。
+        """
+        fetch_time = fetch_time or datetime.now()
+        day_dir = os.path.join(self.root, board, fetch_time.strftime(_DAY_FORMAT))
+        os.makedirs(day_dir, exist_ok=True)
+        path = os.path.join(day_dir, fetch_time.strftime(_FILE_FORMAT) + _SUFFIX)
+        # 先写临时文件再改名，避免回放时读到写了一半的文件
+        tmp_path = path + '.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=self.compress_level) as f:
+            f.write(html)
+        os.replace(tmp_path, path)
+        logger.debug(f"[{board}] 页面已存档: {path}")
+        return path
+
+    def boards(self):
+        """列出存档中包含的榜单。"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def _board_entries(self, board, start=None, end=None):
+        """按时间顺序遍历单个榜单的存档文件，返回 (抓取时间, 榜单, 路径)。"""
+        board_dir = os.path.join(self.root, board)
+        if not os.path.isdir(board_dir):
+            logger.warning(f"存档中没有榜单 {board} 的数据。")
+            return
+        for day in sorted(os.listdir(board_dir)):
+            day_dir = os.path.join(board_dir, day)
+            if not os.path.isdir(day_dir):
+                continue
+            for name in sorted(os.listdir(day_dir)):
+                if not name.endswith(_SUFFIX):
+                    continue
+                try:
+                    fetch_time = datetime.strptime(day + name[:-len(_SUFFIX)], _DAY_FORMAT + _FILE_FORMAT)
+                except ValueError:
+                    logger.warning(f"忽略无法识别时间的存档文件: {os.path.join(day_dir, name)}")
+                    continue
+                if start and fetch_time < start:
+                    continue
+                if end and fetch_time > end:
+                    return
+                yield fetch_time, board, os.path.join(day_dir, name)
+
+    def iter_entries(self, boards=None, start=None, end=None):
+        """
+        按抓取时间顺序遍历多个榜单的存档条目（不读取内容）。
+
+        参数:
+            boards (list): 榜单列表，默认全部。
+            start / end (datetime): 时间范围（含边界）。
+        """
+        streams = [self._board_entries(board, start, end) for board in (boards or self.boards())]
+        return heapq.merge(*streams)
+
+    @staticmethod
+    def load(path):
+        """读取并解压单个存档文件。"""
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return f.read()
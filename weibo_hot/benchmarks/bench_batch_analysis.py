@@ -0,0 +1,137 @@
+"""
+逐个分析与批量分析的耗时和 token 用量对比
+
+取 fixtures 页面（或 --archive 存档中最新一页）的话题，对每个批大小 K 分别分析一遍：
+K=1 为原来的逐个请求，K>1 时每 K 个话题合并成一个 JSON 请求，解析不出的话题回退到逐个请求。
+请求经过与正式运行相同的限流器（DEEPSEEK_RPS 等环境变量同样生效），输出总耗时、请求数、
+prompt/completion token 数以及回退的话题数。
+
+默认调用真实的 DeepSeek 接口（需要 DEEPSEEK_API_KEY，会产生费用）；--mock 时使用模拟接口：
+每次请求耗时 = 固定开销 + 输出 token 数 × 每 token 耗时，token 数按字符数估算，
+--mock-drop 指定批量回复中随机缺失条目的比例，用于检验回退路径。
+
+用法:
+    python benchmarks/bench_batch_analysis.py --mock [--batch-sizes 1,5,10] [--topics 50]
+    python benchmarks/bench_batch_analysis.py --batch-sizes 1,5 --topics 20
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import re
+import sys
+import time
+from types import SimpleNamespace
+
+# 添加上级目录到系统路径，以便导入项目模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(current_dir)
+if project_dir not in sys.path:
+    sys.path.append(project_dir)
+
+import httpx  # noqa: E402
+
+import hot_parser  # noqa: E402
+from archive import SnapshotArchive  # noqa: E402
+
+
+def load_topics(archive_dir, limit):
+    """读取存档中最新一页或 fixtures 页面的话题，返回 [(标题, 热度值), ...]。"""
+    if archive_dir:
+        archive = SnapshotArchive(archive_dir)
+        entries = list(archive.iter_entries())
+        pages = [archive.load(entries[-1][2])] if entries else []
+    else:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(project_dir, 'fixtures', '*.html'))):
+            with open(path, encoding='utf-8') as f:
+                pages.append(f.read())
+    topics = {}
+    for html in pages:
+        for title, info in hot_parser.parse_hot_list(html).items():
+            topics.setdefault(title, info['热度'] or 0)
+    return list(topics.items())[:limit]
+
+
+def mock_transport(overhead, per_token, drop, seed):
+    """模拟的对话补全接口：按输出 token 数计算耗时，批量请求时按比例随机缺失条目。"""
+    rng = random.Random(seed)
+    analysis_text = '该话题因事件进展引发网友广泛讨论，' * 6
+
+    async def handler(request):
+        payload = json.loads(request.content)
+        prompt = payload['messages'][0]['content']
+        # 中文约每1.5个字符一个 token
+        prompt_tokens = int(len(prompt) / 1.5)
+        if 'response_format' in payload:
+            count = len(re.findall(r'^\d+\. 热搜话题', prompt, re.M))
+            items = [{'id': i, 'analysis': analysis_text} for i in range(1, count + 1) if rng.random() >= drop]
+            content = json.dumps({'results': items}, ensure_ascii=False)
+        else:
+            content = analysis_text
+        completion_tokens = int(len(content) / 1.5)
+        await asyncio.sleep(overhead + completion_tokens * per_token)
+        return httpx.Response(200, json={
+            'choices': [{'message': {'content': content}}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        })
+
+    return httpx.MockTransport(handler)
+
+
+async def run_once(analysis, topics, batch_size, transport):
+    for key in analysis.usage_stats:
+        analysis.usage_stats[key] = 0
+    changes = [SimpleNamespace(title=title, hot_value=hot_value) for title, hot_value in topics]
+    groups = [changes[i:i + batch_size] for i in range(0, len(changes), batch_size)]
+    start = time.perf_counter()
+    async with httpx.AsyncClient(transport=transport, timeout=60.0) as client:
+        results = await asyncio.gather(*(analysis.analyze_changes(group, client) for group in groups))
+    elapsed = time.perf_counter() - start
+    ok = sum(1 for group in results for result in group if not isinstance(result, BaseException))
+    return elapsed, ok, dict(analysis.usage_stats)
+
+
+async def main_async(args):
+    if args.mock:
+        os.environ.setdefault('DEEPSEEK_API_KEY', 'mock')
+    elif not os.environ.get('DEEPSEEK_API_KEY'):
+        print("调用真实接口需要设置 DEEPSEEK_API_KEY，或使用 --mock。")
+        return 1
+    import analysis
+
+    topics = load_topics(args.archive, args.topics)
+    if not topics:
+        print("没有可用的话题。")
+        return 1
+    transport = mock_transport(args.mock_overhead, args.mock_per_token, args.mock_drop, args.seed) if args.mock else None
+
+    print(f"话题数: {len(topics)}（{'模拟接口' if args.mock else '真实接口'}）")
+    print(f"{'K':>4}{'耗时(s)':>10}{'成功':>6}{'请求数':>8}{'prompt':>10}{'completion':>12}{'总token':>10}{'回退':>6}")
+    for batch_size in (int(k) for k in args.batch_sizes.split(',')):
+        elapsed, ok, usage = await run_once(analysis, topics, batch_size, transport)
+        total = usage['prompt_tokens'] + usage['completion_tokens']
+        print(f"{batch_size:>4}{elapsed:>10.2f}{ok:>6}{usage['requests']:>8}{usage['prompt_tokens']:>10}"
+              f"{usage['completion_tokens']:>12}{total:>10}{usage['batch_fallbacks']:>6}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="逐个分析与批量分析的耗时和 token 用量对比")
+    parser.add_argument('--archive', metavar='DIR', help="页面存档目录，默认使用 fixtures/*.html")
+    parser.add_argument('--topics', type=int, default=50, help="参与测试的话题数")
+    parser.add_argument('--batch-sizes', default='1,5,10', help="逗号分隔的批大小 K")
+    parser.add_argument('--mock', action='store_true', help="使用模拟接口，不调用 DeepSeek")
+    parser.add_argument('--mock-overhead', type=float, default=0.8, help="模拟接口每次请求的固定耗时（秒）")
+    parser.add_argument('--mock-per-token', type=float, default=0.02, help="模拟接口每个输出 token 的耗时（秒）")
+    parser.add_argument('--mock-drop', type=float, default=0.05, help="模拟批量回复中缺失条目的比例")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    return asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
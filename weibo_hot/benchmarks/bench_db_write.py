@@ -0,0 +1,126 @@
+"""
+主表写入路径基准测试（ORM vs Core）
+
+模拟连续的爬取周期，每个周期榜单有一部分话题被替换、其余话题排名和热度变化，
+分别用两种方式写入 hot_top50：
+1. orm  - 删除该榜单全部行后用 session.add_all 逐个ORM对象重新插入（旧的全量重写方式）
+2. core - 用一条 DELETE 删除掉榜话题，再用一条多行 upsert 写入新增和变化的行（当前方式）
+
+测试只读写 board='bench' 的行，结束后自动清理，不影响真实榜单的数据。
+
+用法:
+    python benchmarks/bench_db_write.py [--cycles 50] [--churn 0.1] [--url 数据库连接字符串]
+    python benchmarks/bench_db_write.py --url sqlite+aiosqlite:///bench.db
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+# 添加上级目录到系统路径，以便导入项目模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(current_dir)
+if project_dir not in sys.path:
+    sys.path.append(project_dir)
+
+from sqlalchemy import delete  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+
+import database as db  # noqa: E402
+import snapshot_diff  # noqa: E402
+
+BENCH_BOARD = 'bench'
+
+
+def make_boards(cycles, size, churn, seed=42):
+    """生成每个周期的榜单：按比例替换话题、打乱部分排名并改变热度。"""
+    rng = random.Random(seed)
+    next_id = size
+    titles = [f"基准话题{i}" for i in range(size)]
+    boards = []
+    for _ in range(cycles):
+        for _ in range(int(size * churn)):
+            titles[rng.randrange(size)] = f"基准话题{next_id}"
+            next_id += 1
+        i, j = rng.randrange(size), rng.randrange(size)
+        titles[i], titles[j] = titles[j], titles[i]
+        boards.append({
+            title: {'热度': rng.randint(10000, 5000000), '标签': None, '链接': f"https://s.weibo.com/weibo?q={title}"}
+            for title in titles
+        })
+    return boards
+
+
+async def write_orm(session, rows, plan):
+    """旧方式：删除榜单全部行后用ORM对象重新插入。"""
+    await session.execute(delete(db.HotTop50).where(db.HotTop50.board == BENCH_BOARD))
+    session.add_all([db.HotTop50(**row) for row in rows])
+
+
+async def write_core(session, rows, plan):
+    """当前方式：一条 DELETE 删除掉榜话题，一条多行 upsert 写入新增和变化的行。"""
+    inserts, updates, deletes = plan
+    table = db.HotTop50.__table__
+    if deletes:
+        await session.execute(delete(table).where(table.c.board == BENCH_BOARD, table.c.title.in_(deletes)))
+    await db.upsert_hot_topics(session, inserts + updates)
+
+
+async def run(session_factory, write, boards):
+    """依次写入每个周期的榜单，返回每个周期的耗时（毫秒）。"""
+    async with session_factory() as session:
+        await session.execute(delete(db.HotTop50).where(db.HotTop50.board == BENCH_BOARD))
+        await session.commit()
+
+    timings = []
+    previous = {}
+    for all_news in boards:
+        rows = snapshot_diff.build_snapshot(all_news, datetime.now(), BENCH_BOARD)
+        events = snapshot_diff.diff_snapshots(previous, rows)
+        plan = snapshot_diff.plan_writes(events, rows)
+        start = time.perf_counter()
+        async with session_factory() as session:
+            await write(session, rows, plan)
+            await session.commit()
+        timings.append((time.perf_counter() - start) * 1000)
+        previous = snapshot_diff.snapshot_from_rows(rows)
+    return timings
+
+
+async def main_async(args):
+    engine = db.make_async_engine(args.url)
+    session_factory = lambda: AsyncSession(engine, expire_on_commit=False)  # noqa: E731
+    async with engine.begin() as conn:
+        await conn.run_sync(db.Base.metadata.create_all)
+
+    boards = make_boards(args.cycles, args.size, args.churn)
+    print(f"数据库: {engine.dialect.name}，周期数: {args.cycles}，榜单长度: {args.size}，每周期替换比例: {args.churn}")
+    print(f"{'写入方式':<8}{'平均(ms)':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'总计(ms)':>12}")
+    try:
+        for name, write in (('orm', write_orm), ('core', write_core)):
+            timings = sorted(await run(session_factory, write, boards))
+            p50 = timings[len(timings) // 2]
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(f"{name:<8}{sum(timings) / len(timings):>10.2f}{p50:>10.2f}{p95:>10.2f}{sum(timings):>12.1f}")
+    finally:
+        async with session_factory() as session:
+            await session.execute(delete(db.HotTop50).where(db.HotTop50.board == BENCH_BOARD))
+            await session.commit()
+        await engine.dispose()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="hot_top50 写入路径基准测试（ORM vs Core）")
+    parser.add_argument('--cycles', type=int, default=50, help="模拟的爬取周期数")
+    parser.add_argument('--size', type=int, default=50, help="榜单长度")
+    parser.add_argument('--churn', type=float, default=0.1, help="每个周期被替换的话题比例")
+    parser.add_argument('--url', default=db.ASYNC_DATABASE_URL, help="数据库连接字符串，默认使用 DB_BACKEND / DB_* 环境变量配置的数据库")
+    return asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+近似重复话题检测的准确率/召回率评估
+
+从存档（--archive，python main.py --record 录制的目录）或 fixtures 页面中取出所有不同的标题建立索引，然后：
+1. 正样本：对每个标题按微博常见的改写方式生成一个变体（加后缀、加前缀、加标点、调换两个词的顺序），
+   查询结果为原标题即为命中
+2. 负样本：用每个原标题查询其他标题组成的索引，匹配到任何标题都算误判
+   （存档中不同的标题偶尔确实是同一事件，所以这里的误判率是上限）
+
+对不同的相似度阈值输出准确率、召回率、负样本误判率和单次查询耗时。
+
+用法:
+    python benchmarks/bench_near_duplicates.py [--archive DIR] [--thresholds 0.5,0.6,0.7,0.8]
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+
+# 添加上级目录到系统路径，以便导入项目模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(current_dir)
+if project_dir not in sys.path:
+    sys.path.append(project_dir)
+
+import hot_parser  # noqa: E402
+from archive import SnapshotArchive  # noqa: E402
+from near_duplicate import MinHashIndex  # noqa: E402
+from topic_key import title_key  # noqa: E402
+
+SUFFIXES = ['最新回应', '引热议', '后续来了', '官方通报', '现场视频', '了']
+PREFIXES = ['突发', '网传', '刚刚']
+PUNCTUATION = ['！', '？', '...', '！！']
+
+
+def load_titles(archive_dir):
+    """读取存档或 fixtures 中出现过的所有不同标题。"""
+    titles = set()
+    if archive_dir:
+        archive = SnapshotArchive(archive_dir)
+        for _, _, path in archive.iter_entries():
+            titles.update(hot_parser.parse_hot_list(archive.load(path)))
+    else:
+        for path in glob.glob(os.path.join(project_dir, 'fixtures', '*.html')):
+            with open(path, encoding='utf-8') as f:
+                titles.update(hot_parser.parse_hot_list(f.read()))
+    return sorted(titles)
+
+
+def make_variant(title, rng):
+    """按一种随机选择的改写方式生成标题变体，返回 (改写方式, 变体)。"""
+    kind = rng.choice(['suffix', 'prefix', 'punct', 'reorder'])
+    if kind == 'reorder' and len(title) >= 6:
+        i = rng.randrange(0, len(title) - 3)
+        return kind, title[:i] + title[i + 2:i + 4] + title[i:i + 2] + title[i + 4:]
+    if kind == 'prefix':
+        return kind, rng.choice(PREFIXES) + title
+    if kind == 'punct':
+        # 只加标点时规范化后与原标题相同，由精确匹配处理；这里同时加一个后缀
+        return kind, title + rng.choice(SUFFIXES) + rng.choice(PUNCTUATION)
+    return 'suffix', title + rng.choice(SUFFIXES)
+
+
+def evaluate(titles, variants, threshold):
+    index = MinHashIndex(min_similarity=threshold)
+    for title in titles:
+        index.add(title_key(title), title)
+
+    timings = []
+    true_pos = wrong = missed = 0
+    per_kind = {}
+    for title, (kind, variant) in zip(titles, variants):
+        start = time.perf_counter()
+        match = index.query(variant, exclude=title_key(variant))
+        timings.append((time.perf_counter() - start) * 1e6)
+        hit = match is not None and match[0] == title_key(title)
+        if hit:
+            true_pos += 1
+        elif match is not None:
+            wrong += 1
+        else:
+            missed += 1
+        stats = per_kind.setdefault(kind, [0, 0])
+        stats[0] += hit
+        stats[1] += 1
+
+    false_pos = 0
+    for title in titles:
+        start = time.perf_counter()
+        match = index.query(title, exclude=title_key(title))
+        timings.append((time.perf_counter() - start) * 1e6)
+        if match is not None:
+            false_pos += 1
+
+    predicted = true_pos + wrong + false_pos
+    timings.sort()
+    return {
+        'precision': true_pos / predicted if predicted else 1.0,
+        'recall': true_pos / len(titles),
+        'negative_fp_rate': false_pos / len(titles),
+        'avg_us': sum(timings) / len(timings),
+        'p99_us': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        'per_kind': {kind: hits / total for kind, (hits, total) in per_kind.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近似重复话题检测的准确率/召回率评估")
+    parser.add_argument('--archive', metavar='DIR', help="页面存档目录，默认使用 fixtures/*.html")
+    parser.add_argument('--thresholds', default='0.5,0.6,0.7,0.8', help="逗号分隔的 Jaccard 相似度阈值")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    titles = load_titles(args.archive)
+    if len(titles) < 2:
+        print("标题数量不足，无法评估。")
+        return 1
+    rng = random.Random(args.seed)
+    variants = [make_variant(title, rng) for title in titles]
+
+    print(f"标题数: {len(titles)}（{'存档 ' + args.archive if args.archive else 'fixtures'}）")
+    print(f"{'阈值':<6}{'准确率':>8}{'召回率':>8}{'负样本误判':>12}{'平均(us)':>10}{'p99(us)':>10}  各改写方式召回率")
+    for threshold in (float(t) for t in args.thresholds.split(',')):
+        r = evaluate(titles, variants, threshold)
+        kinds = ' '.join(f"{kind}={value:.2f}" for kind, value in sorted(r['per_kind'].items()))
+        print(f"{threshold:<6.2f}{r['precision']:>8.3f}{r['recall']:>8.3f}{r['negative_fp_rate']:>12.3f}"
+              f"{r['avg_us']:>10.1f}{r['p99_us']:>10.1f}  {kinds}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+解析执行器对事件循环影响的基准测试
+
+模拟一个爬取周期中连续解析多个页面，同时运行事件循环延迟监控器，
+比较 inline / thread / process 三种执行方式下：
+1. 事件循环的最大延迟和卡顿次数（解析是否阻塞了同一循环中的其他任务）
+2. 解析全部页面的总耗时
+
+用法:
+    python benchmarks/bench_parse_executor.py [--pages 20] [--backend bs4] [--workers 2]
+"""
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import time
+
+# 添加上级目录到系统路径，以便导入项目模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(current_dir)
+if project_dir not in sys.path:
+    sys.path.append(project_dir)
+
+from loop_monitor import LoopLagMonitor  # noqa: E402
+from parse_pool import MODES, ParseExecutor  # noqa: E402
+
+
+async def run_mode(mode, htmls, backend, workers):
+    """在监控器运行的情况下用指定执行方式解析所有页面，返回 (总耗时毫秒, 延迟指标)。"""
+    executor = ParseExecutor(mode, workers=workers, backend=backend)
+    try:
+        # 预热：进程池的启动开销不计入测量
+        await executor.parse(htmls[0])
+        monitor = LoopLagMonitor(interval=0.005, stall_threshold_ms=50, report_interval=3600)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        start = time.perf_counter()
+        for html in htmls:
+            await executor.parse(html)
+        elapsed = (time.perf_counter() - start) * 1000
+        await asyncio.sleep(0.05)
+        metrics = monitor.metrics()
+        await monitor.stop()
+        return elapsed, metrics
+    finally:
+        executor.shutdown()
+
+
+async def main_async(args):
+    paths = sorted(glob.glob(os.path.join(project_dir, 'fixtures', '*.html')))
+    if not paths:
+        print("没有找到可用于测试的页面。")
+        return 1
+    pages = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            pages.append(f.read())
+    htmls = [pages[i % len(pages)] for i in range(args.pages)]
+
+    print(f"解析后端: {args.backend}，页面数: {len(htmls)}，工作者数: {args.workers}")
+    print(f"{'执行方式':<10}{'总耗时(ms)':>12}{'最大延迟(ms)':>14}{'p99延迟(ms)':>13}{'卡顿次数':>10}")
+    for mode in MODES:
+        elapsed, metrics = await run_mode(mode, htmls, args.backend, args.workers)
+        print(f"{mode:<10}{elapsed:>12.1f}{metrics['max_ms']:>14.1f}{metrics['p99_ms']:>13.1f}{metrics['stalls']:>10}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析执行器对事件循环延迟的影响")
+    parser.add_argument('--pages', type=int, default=20, help="模拟解析的页面数")
+    parser.add_argument('--backend', default='bs4', help="解析后端，默认使用最慢的 bs4 以放大差异")
+    parser.add_argument('--workers', type=int, default=2, help="线程池/进程池的工作者数量")
+    return asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
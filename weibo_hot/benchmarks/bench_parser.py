@@ -0,0 +1,76 @@
+"""
+热搜页面解析基准测试
+
+对 fixtures 目录中保存的热搜页面，依次使用每个解析后端进行解析：
+1. 校验各后端的输出与参考实现（bs4）完全一致
+2. 统计每个后端解析单个页面的耗时
+
+用法:
+    python benchmarks/bench_parser.py [--repeat 50] [页面文件 ...]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+# 添加上级目录到系统路径，以便导入项目模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(current_dir)
+if project_dir not in sys.path:
+    sys.path.append(project_dir)
+
+import hot_parser  # noqa: E402
+
+REFERENCE_BACKEND = 'bs4'
+
+
+def bench_page(path, repeat):
+    """对单个页面运行所有后端，返回 {后端: 平均毫秒}，输出不一致时抛出 AssertionError。"""
+    with open(path, encoding='utf-8') as f:
+        html = f.read()
+
+    expected = hot_parser.parse_hot_list(html, REFERENCE_BACKEND)
+    results = {}
+    for name in hot_parser.BACKENDS:
+        output = hot_parser.parse_hot_list(html, name)
+        assert output == expected, f"后端 {name} 在 {os.path.basename(path)} 上的输出与参考实现不一致"
+        assert list(output) == list(expected), f"后端 {name} 在 {os.path.basename(path)} 上的排名顺序与参考实现不一致"
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            hot_parser.parse_hot_list(html, name)
+        results[name] = (time.perf_counter() - start) * 1000 / repeat
+    return len(html), len(expected), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热搜页面解析后端基准测试")
+    parser.add_argument('pages', nargs='*', help="要测试的HTML页面，默认使用 fixtures/*.html")
+    parser.add_argument('--repeat', type=int, default=50, help="每个后端重复解析的次数")
+    args = parser.parse_args()
+
+    pages = args.pages or sorted(glob.glob(os.path.join(project_dir, 'fixtures', '*.html')))
+    if not pages:
+        print("没有找到可用于测试的页面。")
+        return 1
+
+    backends = list(hot_parser.BACKENDS)
+    print(f"{'页面':<24}{'大小':>8}{'条数':>6}" + ''.join(f"{name + '(ms)':>14}" for name in backends))
+    totals = {name: 0.0 for name in backends}
+    for path in pages:
+        size, count, results = bench_page(path, args.repeat)
+        for name, elapsed in results.items():
+            totals[name] += elapsed
+        print(f"{os.path.basename(path):<24}{size:>8}{count:>6}" + ''.join(f"{results[name]:>14.3f}" for name in backends))
+
+    reference = totals[REFERENCE_BACKEND] / len(pages)
+    print("\n所有后端输出与参考实现一致。平均每页耗时:")
+    for name in backends:
+        average = totals[name] / len(pages)
+        print(f"  {name:<8}{average:>10.3f} ms  (相对 {REFERENCE_BACKEND}: {reference / average:.1f}x)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
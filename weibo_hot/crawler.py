@@ -1,210 +1,552 @@
+import os
 import httpx
-from bs4 import BeautifulSoup
 import time
 import asyncio
 from datetime import datetime, timedelta
 from logger import setup_module_logger
+from http_session import HttpSession
+from env_config import env_float, env_int
+from parse_pool import ParseExecutor
+from fingerprint import PageFingerprint
+import snapshot_diff
+from scheduler import AdaptiveScheduler
+from archive import SnapshotArchive
+from lease_lock import LeaseLock, PIPELINE_LOCK
+from analysis_cache import analysis_cache
+from streaming import partial_analyses
 import database as db
 
 # 创建日志记录器 - 用于记录爬虫模块的日志信息
 logger = setup_module_logger('crawler_async')
 
-async def crawl_weibo_hot():
+WEIBO_HOT_URL = 'https://s.weibo.com/top/summary/'
+
+# 可抓取的微博榜单：榜单标识 -> 页面地址
+BOARD_URLS = {
+    'realtime': WEIBO_HOT_URL,
+    'social': 'https://s.weibo.com/top/summary?cate=socialevent',
+    'entertainment': 'https://s.weibo.com/top/summary?cate=entrank',
+    'sport': 'https://s.weibo.com/top/summary?cate=sport',
+    'game': 'https://s.weibo.com/top/summary?cate=game',
+}
+
+
+# 未指定解析执行器时使用：在事件循环中直接解析
+_INLINE_PARSER = ParseExecutor('inline')
+
+
+def get_enabled_boards():
     """
-    异步爬取微博热搜页面并返回解析结果。
+    从环境变量 WEIBO_BOARDS 读取需要抓取的榜单（逗号分隔），默认只抓取实时热搜榜。
 
     返回值:
-        dict: 一个包含热搜话题的字典，如果爬取失败则为None。
+        list: 榜单标识列表，未知的标识会被忽略。
+    """
+    names = [name.strip() for name in os.environ.get('WEIBO_BOARDS', db.DEFAULT_BOARD).split(',') if name.strip()]
+    boards = []
+    for name in names:
+        if name not in BOARD_URLS:
+            logger.warning(f"未知的榜单 '{name}'，可选值: {', '.join(BOARD_URLS)}。")
+        elif name not in boards:
+            boards.append(name)
+    if not boards:
+        logger.warning(f"没有可用的榜单配置，将只抓取 {db.DEFAULT_BOARD}。")
+        boards = [db.DEFAULT_BOARD]
+    return boards
+
+
+class BoardState:
+    """单个榜单在连续爬取过程中的状态。"""
+
+    def __init__(self, name):
+        self.name = name
+        self.url = BOARD_URLS[name]
+        self.fingerprint = PageFingerprint()
+        # 上一次成功同步的榜单快照，None 表示需要从数据库重新加载
+        self.previous_snapshot = None
+        # 上一次发布最终表时是否仍有分析未完成（等待超时），为真时即使榜单未变也需要重新发布
+        self.final_table_stale = False
+        self.board_size = 0
+
+
+def create_crawler_session():
+    """
+    创建爬虫使用的长连接HTTP会话。
+
+    会话在 initialize_system 和 continuous_crawling_mode 的各个周期之间共享，
+    由 main.py 负责在退出时关闭。连接池、超时等参数可通过 CRAWLER_* 环境变量调整。
     """
     # 注意：此处的Cookie是硬编码的，可能会过期。
     # 为了长期使用，建议采用更健壮的Cookie管理方案。
-    url = 'https://s.weibo.com/top/summary/'
     cookie = ''
     headers = {
         'Cookie': cookie,
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
+    return HttpSession.from_env('crawler', 'CRAWLER', headers=headers, max_connections=8, max_keepalive_connections=4)
+
 
-    logger.info(f"正在请求微博热搜: {url}")
+async def fetch_weibo_hot_html(session: HttpSession, board: str = db.DEFAULT_BOARD):
+    """
+    抓取微博热搜页面的原始HTML。
+
+    参数:
+        session (HttpSession): 共享的爬虫会话。
+        board (str): 榜单标识。
+
+    返回值:
+        str: 页面HTML，如果请求失败则为None。
+    """
+    url = BOARD_URLS[board]
+    logger.info(f"[{board}] 正在请求微博热搜: {url}")
     start_time = time.time()
-    
-    async with httpx.AsyncClient(trust_env=False) as client:
-        try:
-            response = await client.get(url, headers=headers)
-            elapsed = time.time() - start_time
-            logger.info(f"请求状态码: {response.status_code}, 耗时: {elapsed:.2f}秒")
-            response.raise_for_status()
-            html = response.text
-            logger.info(f"获取HTML内容长度: {len(html)}")
-        except httpx.RequestError as e:
-            logger.error(f"请求微博热搜页面失败: {e}", exc_info=True)
-            return None
-
-    # 解析逻辑是CPU密集型的，同步执行即可
-    logger.debug("正在解析HTML内容...")
-    soup = BeautifulSoup(html, 'html.parser')
-    all_news = {}
-    items = soup.find_all('td', class_='td-02')
-    logger.debug(f"找到 {len(items) - 1} 个热搜项目。")
-
-    for news in items[1:]:  # 跳过表头
-        try:
-            text = news.text.split('\n')[1].strip()
-            link = news.find('a')['href'] if news.find('a') else ''
-            if not link.startswith('http'):
-                link = 'https://s.weibo.com' + link
-            
-            hot_parts = news.text.split('\n')
-            if len(hot_parts) < 3 or not hot_parts[2].strip():
-                continue
-            
-            hot_text = hot_parts[2].strip()
-            hot = hot_text if hot_text[0].isdigit() else hot_text[2:]
 
-            all_news[text] = {'热度': hot, '链接': link}
-        except (IndexError, KeyError) as e:
-            logger.warning(f"解析某个热搜项失败: {e}。 原始文本: {news.text.strip()}")
-            continue
+    try:
+        response = await session.get(url)
+        elapsed = time.time() - start_time
+        logger.info(f"[{board}] 请求状态码: {response.status_code}, 耗时: {elapsed:.2f}秒")
+        response.raise_for_status()
+        html = response.text
+        logger.info(f"[{board}] 获取HTML内容长度: {len(html)}")
+        return html
+    except httpx.RequestError as e:
+        logger.error(f"[{board}] 请求微博热搜页面失败: {e}", exc_info=True)
+        return None
 
-    logger.info(f"成功解析 {len(all_news)} 条热搜。")
+
+async def parse_weibo_hot(html, board: str = db.DEFAULT_BOARD, parser: ParseExecutor = None):
+    """
+    解析热搜页面HTML，返回 {标题: {'热度': ..., '标签': ..., '链接': ...}}。
+
+    解析是CPU密集型的，指定 parser 时交给进程池/线程池执行，避免阻塞事件循环；
+    为None时在事件循环中直接解析。具体解析后端由 hot_parser 决定。
+    """
+    logger.debug(f"[{board}] 正在解析HTML内容...")
+    parse_start = time.perf_counter()
+    all_news = await (parser or _INLINE_PARSER).parse(html)
+    logger.debug(f"[{board}] 解析耗时: {(time.perf_counter() - parse_start) * 1000:.1f}毫秒")
+
+    logger.info(f"[{board}] 成功解析 {len(all_news)} 条热搜。")
     return all_news
 
 
-async def initialize_system():
-    """初始化系统：初始化数据库、清空数据表并使用最新的爬取数据填充。"""
+async def crawl_weibo_hot(session: HttpSession = None, board: str = db.DEFAULT_BOARD, parser: ParseExecutor = None):
+    """
+    异步爬取微博热搜页面并返回解析结果。
+
+    参数:
+        session (HttpSession): 共享的爬虫会话；为None时临时创建一个。
+        board (str): 榜单标识。
+        parser (ParseExecutor): 解析执行器；为None时在事件循环中解析。
+
+    返回值:
+        dict: 一个包含热搜话题的字典，如果爬取失败则为None。
+    """
+    if session is None:
+        async with create_crawler_session() as temp_session:
+            return await crawl_weibo_hot(temp_session, board, parser)
+
+    html = await fetch_weibo_hot_html(session, board)
+    if html is None:
+        return None
+    return await parse_weibo_hot(html, board, parser)
+
+
+async def sync_snapshot(board, previous_snapshot, all_news, fetch_time=None):
+    """
+    将某个榜单的新数据与上一次的快照比较，并只把差异写入数据库。
+
+    参数:
+        board (str): 榜单标识。
+        previous_snapshot (dict): {标题: 行数据}，上一次成功同步的快照。
+        all_news (dict): 本次解析得到的热搜。
+        fetch_time (datetime): 抓取时间，默认当前时间；回放时使用存档时间。
+
+    返回值:
+        tuple: (新快照, 事件列表, 新上榜待分析的话题列表（附带变更ID）)
+    """
+    fetch_time = fetch_time or datetime.now()
+    new_rows = snapshot_diff.build_snapshot(all_news, fetch_time, board)
+    events = snapshot_diff.diff_snapshots(previous_snapshot, new_rows)
+    inserts, updates, deletes = snapshot_diff.plan_writes(events, new_rows)
+    # 留在榜单上的话题保留原有分析；新上榜的话题先查分析缓存，掉榜后重新上榜的话题直接复用之前的分析
+    cached = await analysis_cache.lookup([row['title'] for row in inserts])
+    changes_to_log = [row for row in inserts if row['title'] not in cached]
+
+    changes_to_log = await db.apply_snapshot_diff(board, inserts, updates, deletes, changes_to_log, cached)
+    logger.info(f"[{board}] 快照差异: {snapshot_diff.summarize(events)}")
+    # 历史记录是附加数据，写入失败不影响主表同步
+    try:
+        await db.record_history(board, new_rows, fetch_time)
+    except Exception as e:
+        logger.error(f"[{board}] 写入榜单历史失败: {e}", exc_info=True)
+    return snapshot_diff.snapshot_from_rows(new_rows), events, changes_to_log
+
+
+async def initialize_system(session: HttpSession = None, parser: ParseExecutor = None):
+    """初始化系统：初始化数据库、清空数据表并使用所有已启用榜单的最新数据填充。"""
     logger.info("正在初始化系统...")
     
     await db.init_db()
     await db.clear_all_tables()
-    
-    all_news = await crawl_weibo_hot()
-    if not all_news:
-        logger.error("爬取热搜失败，系统初始化失败。")
+
+    boards = get_enabled_boards()
+    results = await asyncio.gather(*(crawl_weibo_hot(session, board, parser) for board in boards))
+
+    synced_boards = 0
+    written = 0
+    queued = 0
+    for board, all_news in zip(boards, results):
+        if not all_news:
+            logger.error(f"[{board}] 爬取热搜失败。")
+            continue
+        # 初始化时表已清空，所有话题都是新话题；命中分析缓存的话题直接写入分析内容，不进入变更表
+        _, events, changes_to_log = await sync_snapshot(board, {}, all_news)
+        synced_boards += 1
+        written += len(all_news)
+        queued += len(changes_to_log)
+
+    # 分析缓存不随初始化清空，所有话题都命中缓存时变更表为空，按同步成功的榜单数判断是否成功
+    if not synced_boards:
+        logger.error("所有榜单爬取失败，系统初始化失败。")
         return False
 
-    current_time = datetime.now()
-    topics_to_insert = []
-    changes_to_log = []
-
-    for i, (news, info) in enumerate(all_news.items(), 1):
-        topic_data = {
-            'rank_num': i,
-            'title': news,
-            'hot_value': info['热度'],
-            'link': info['链接'],
-            'fetch_time': current_time,
-        }
-        # 初始化时，所有话题都是新话题
-        topics_to_insert.append(topic_data)
-        changes_to_log.append(topic_data)
-
-    await db.atomic_resync_hot_topics(topics_to_insert, changes_to_log)
     await db.update_final_table()
-
-    logger.info(f"初始化完成。已向主表和变更表插入 {len(topics_to_insert)} 条话题。")
+    logger.info(
+        f"初始化完成。{synced_boards} 个榜单已向主表插入 {written} 条话题，"
+        f"其中 {written - queued} 条复用缓存分析，{queued} 条写入变更表等待分析。"
+    )
     return True
-    
 
-async def continuous_crawling_mode():
-    """连续爬取微博热搜的异步主循环。"""
-    logger.info("启动连续爬取模式...")
-    cycle_minutes = 1
+
+async def _fetch_board(state: BoardState, session: HttpSession, semaphore: asyncio.Semaphore,
+                       archive: SnapshotArchive = None, parser: ParseExecutor = None):
+    """
+    在信号量限制下抓取并解析单个榜单，并用两级指纹判断是否变化。
+    指定 archive 时，每个抓取到的页面都会被压缩存档。
+
+    返回值:
+        tuple: (榜单状态, 结果字典)。结果包含 ok、changed、all_news 以及两级指纹。
+    """
+    result = {'ok': False, 'changed': False, 'all_news': None, 'page_digest': None, 'list_digest': None}
+    try:
+        async with semaphore:
+            html = await fetch_weibo_hot_html(session, state.name)
+        if not html:
+            return state, result
+        if archive is not None:
+            await asyncio.to_thread(archive.record, state.name, html)
+
+        unchanged, result['page_digest'] = state.fingerprint.html_unchanged(html)
+        if unchanged:
+            logger.info(f"[{state.name}] 热搜页面与上一轮相同，跳过解析和数据库同步。")
+            result['ok'] = True
+            return state, result
+
+        all_news = await parse_weibo_hot(html, state.name, parser)
+    except Exception as e:
+        # 单个榜单的异常（如HTTP错误状态码）不影响其他榜单
+        logger.error(f"[{state.name}] 抓取或解析榜单失败: {e}", exc_info=True)
+        return state, result
+    if not all_news:
+        logger.error(f"[{state.name}] 解析热搜失败。")
+        return state, result
+
+    result['ok'] = True
+    unchanged, result['list_digest'] = state.fingerprint.board_unchanged(all_news)
+    if unchanged:
+        logger.info(f"[{state.name}] 解析后的榜单与上一轮相同，跳过数据库同步。")
+        state.fingerprint.remember(result['page_digest'], result['list_digest'])
+    else:
+        result['changed'] = True
+        result['all_news'] = all_news
+    return state, result
+
+
+async def _sync_board(state: BoardState, result):
+    """将单个榜单的变化写入数据库，成功后记录指纹。返回 (事件列表, 新上榜话题)。"""
+    # 首轮（或上次同步失败后）从数据库加载旧快照作为比较基准
+    if state.previous_snapshot is None:
+        state.previous_snapshot = await db.get_hot_topics_snapshot(state.name)
+    try:
+        state.previous_snapshot, events, changes_to_log = await sync_snapshot(
+            state.name, state.previous_snapshot, result['all_news']
+        )
+    except Exception:
+        state.previous_snapshot = None
+        raise
+    state.fingerprint.remember(result['page_digest'], result['list_digest'])
+    state.board_size = len(result['all_news'])
+    logger.info(
+        f"[{state.name}] 成功同步 {state.board_size} 条话题，产生 {len(events)} 个变更事件，"
+        f"发现 {len(changes_to_log)} 条新话题待分析。"
+    )
+    return events, changes_to_log
+
+
+async def continuous_crawling_mode(session: HttpSession = None, archive: SnapshotArchive = None,
+                                   parser: ParseExecutor = None, pipeline=None):
+    """
+    连续爬取微博热搜的异步主循环。
+
+    每个周期在有界信号量下并发抓取所有已启用的榜单，哪个榜单先返回就先写入，
+    单个榜单响应缓慢不会拖慢其他榜单的同步。
+
+    参数:
+        session (HttpSession): 跨周期共享的爬虫会话；为None时在本循环内创建并负责关闭。
+        archive (SnapshotArchive): 指定时将每个抓取到的页面存档，供离线回放。
+        parser (ParseExecutor): 解析执行器；为None时在事件循环中解析。
+        pipeline (AnalysisPipeline): 进程内分析流水线；指定时新话题直接交给分析协程，
+            并等待其完成通知，不再轮询数据库中的未处理数量。
+    """
+    if session is None:
+        async with create_crawler_session() as own_session:
+            return await continuous_crawling_mode(own_session, archive, parser, pipeline)
+
+    boards = get_enabled_boards()
+    logger.info(f"启动连续爬取模式，榜单: {', '.join(boards)}")
+    scheduler = AdaptiveScheduler.from_env()
+    states = [BoardState(board) for board in boards]
+    semaphore = asyncio.Semaphore(env_int('CRAWL_BOARD_CONCURRENCY', 3))
+    lock = LeaseLock.from_env(PIPELINE_LOCK, 'crawler')
+    lock_wait = env_float('CRAWLER_LOCK_WAIT', 30)
+    partitions_checked_on = None
 
     while True:
         try:
             logger.info(f"\n--- 新一轮爬取周期开始于 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ---")
+            scheduler.start_cycle()
+
+            # 启动后及每天维护一次历史表的日分区，保证写入时总有当天及之后几天的分区
+            if datetime.now().date() != partitions_checked_on:
+                try:
+                    await db.maintain_history_partitions()
+                    partitions_checked_on = datetime.now().date()
+                except Exception as e:
+                    logger.error(f"维护历史表分区失败: {e}", exc_info=True)
             
-            status = await db.get_system_status()
-            if status and status.is_analyzing:
-                logger.info("分析器正在运行，等待其完成...")
-                await asyncio.sleep(3)
-                continue
-
-            # 在获取锁之前，记录当前有多少未处理的话题
-            initial_unprocessed_count = await db.get_unprocessed_changes_count()
-            changes_to_log = []
-
-            if not await db.acquire_crawler_lock():
-                logger.info("无法获取爬虫锁，跳过本轮周期。")
-                await asyncio.sleep(3)
-                continue
+            # 1. 并发抓取所有榜单，并用两级指纹判断榜单是否变化；未变化的榜单不解析、不写库
+            tasks = [asyncio.create_task(_fetch_board(state, session, semaphore, archive, parser)) for state in states]
+            succeeded = 0
+            changed_count = 0
+            synced = []  # (榜单状态, 新上榜话题)
+            batches = []  # 已提交给流水线的分析任务
+            lock_held = False
+            lock_failed = False
 
             try:
-                # 1. 爬取新话题
-                all_news = await crawl_weibo_hot()
-                if not all_news:
-                    logger.error("爬取热搜失败，跳过本轮周期。")
-                    continue
-
-                # 2. 获取旧话题的快照以复用分析结果
-                old_topics_map = await db.get_hot_topics_map()
-                
-                # 3. 在内存中准备数据
-                current_time = datetime.now()
-                topics_to_insert = []
-                
-                hot_news_items = list(all_news.items())
-
-                for i, (title, info) in enumerate(hot_news_items, 1):
-                    base_topic_data = {
-                        'rank_num': i,
-                        'title': title,
-                        'hot_value': info['热度'],
-                        'link': info['链接'],
-                        'fetch_time': current_time,
-                    }
-
-                    topic_to_insert_data = base_topic_data.copy()
-                    topic_to_insert_data['analysis_content'] = None
-                    topic_to_insert_data['analysis_time'] = None
-
-                    if title in old_topics_map:
-                        existing_analysis = old_topics_map[title]
-                        topic_to_insert_data['analysis_content'] = existing_analysis.get('analysis_content')
-                        topic_to_insert_data['analysis_time'] = existing_analysis.get('analysis_time')
-                    else:
-                        changes_to_log.append(base_topic_data)
-
-                    topics_to_insert.append(topic_to_insert_data)
-                
-                # 4. 原子化同步到数据库
-                await db.atomic_resync_hot_topics(topics_to_insert, changes_to_log)
-                logger.info(f"成功同步 {len(topics_to_insert)} 条话题，发现 {len(changes_to_log)} 条新话题待分析。")
-
+                for next_done in asyncio.as_completed(tasks):
+                    state, result = await next_done
+                    if not result['ok']:
+                        continue
+                    succeeded += 1
+                    if not result['changed']:
+                        continue
+
+                    # 2. 第一个发生变化的榜单返回时才获取锁，之后各榜单按完成顺序写入
+                    if not lock_held:
+                        # 在获取锁之前，记录当前有多少未处理的话题（流水线模式直接等待完成通知，不需要）
+                        if pipeline is None:
+                            initial_unprocessed_count = await db.get_unprocessed_changes_count()
+                        # 分析器持有锁时等待其释放（同一进程内释放时会立即被唤醒）
+                        if not await lock.acquire(timeout=lock_wait):
+                            lock_failed = True
+                            break
+                        lock_held = True
+
+                    # 3. 计算差异并只写入变化的行；单个榜单写入失败不影响其他榜单
+                    try:
+                        events, changes_to_log = await _sync_board(state, result)
+                    except Exception as e:
+                        logger.error(f"[{state.name}] 同步榜单失败: {e}", exc_info=True)
+                        continue
+                    changed_count += sum(1 for e in events if e.kind != snapshot_diff.HOT_CHANGED)
+                    synced.append((state, changes_to_log))
+                    if pipeline is not None and changes_to_log:
+                        # 写库后立即交给分析协程，不必等其他榜单同步完成；
+                        # 本周期等待分析的时间预算即发布截止时间，预计赶不上的靠后话题会被推迟
+                        deadline = time.monotonic() + scheduler.analysis_wait_budget()
+                        batches.append(pipeline.submit(changes_to_log, deadline=deadline))
             finally:
-                # 5. 关键：完成数据库操作后立即释放锁
-                await db.release_crawler_lock()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                # 4. 关键：完成数据库操作后立即释放锁
+                if lock_held:
+                    await lock.release()
+
+            if lock_failed:
+                # 抓取结果没有写库，指纹也未记录，下一轮会重新同步；至少等待最短间隔，避免持续抢锁失败时立即重新抓取
+                delay = max(scheduler.next_delay(), scheduler.min_interval)
+                logger.info(f"无法获取爬虫锁，跳过本轮周期。{delay:.0f} 秒后重试。")
+                await asyncio.sleep(delay)
+                continue
 
-            # 6. 在锁已释放的情况下，决定如何更新最终表
-            if not changes_to_log:
-                logger.info("本轮无新话题，立即更新最终结果表。")
-                await db.update_final_table()
-            else:
-                logger.info(f"发现 {len(changes_to_log)} 个新话题，等待分析完成以更新最终表...")
-                wait_timeout = 45  # 最长等待45秒
+            if not succeeded:
+                delay = scheduler.record_failure()
+                logger.error(f"所有榜单爬取失败，跳过本轮周期。{delay:.0f} 秒后重试（连续失败 {scheduler.consecutive_failures} 次）。")
+                await asyncio.sleep(delay)
+                continue
+
+            # 5. 在锁已释放的情况下，决定如何更新各榜单的最终表
+            # 先行发布的截断分析随后分析失败、已从主表清除的榜单需要重新发布
+            retracted = partial_analyses.take_retracted()
+            for state in states:
+                if state.name in retracted:
+                    state.final_table_stale = True
+            synced_names = {state.name for state, _ in synced}
+            for state in states:
+                if state.name not in synced_names and state.final_table_stale:
+                    logger.info(f"[{state.name}] 榜单未变化，但上一轮发布时仍有分析未完成，重新发布最终结果表。")
+                    await db.update_final_table(state.name)
+                    state.final_table_stale = False
+
+            waiting = []
+            for state, changes_to_log in synced:
+                if changes_to_log:
+                    waiting.append(state)
+                else:
+                    logger.info(f"[{state.name}] 本轮无新话题，立即更新最终结果表。")
+                    await db.update_final_table(state.name)
+                    state.final_table_stale = False
+
+            if waiting:
+                new_count = sum(len(changes) for _, changes in synced)
+                logger.info(f"发现 {new_count} 个新话题，等待分析完成以更新最终表...")
+                # 等待时间受调度器的时间预算约束，保证不会占用下一个周期
+                wait_timeout = scheduler.analysis_wait_budget()
                 start_wait = time.time()
+                timed_out = False
+
+                if pipeline is not None:
+                    try:
+                        await asyncio.wait_for(asyncio.gather(*(batch.wait() for batch in batches)), wait_timeout)
+                    except asyncio.TimeoutError:
+                        logger.warning(f"等待分析超时（超过 {wait_timeout:.0f} 秒），将使用当前数据更新最终表。")
+                        timed_out = True
 
-                while (await db.get_unprocessed_changes_count()) > initial_unprocessed_count:
+                while pipeline is None and (await db.get_unprocessed_changes_count()) > initial_unprocessed_count:
                     if time.time() - start_wait > wait_timeout:
-                        logger.warning(f"等待分析超时（超过 {wait_timeout} 秒），将使用当前数据更新最终表。")
+                        logger.warning(f"等待分析超时（超过 {wait_timeout:.0f} 秒），将使用当前数据更新最终表。")
+                        timed_out = True
                         break
                     await asyncio.sleep(2)  # 每2秒检查一次
                 
+                if timed_out:
+                    # 流式分析中已生成的部分先截断写入主表，完整分析在下一个周期重新发布
+                    await partial_analyses.publish()
                 logger.info("分析完成或等待超时，开始更新最终结果表。")
-                await db.update_final_table()
-
-            # 7. 等待下一个周期
-            next_run_time = datetime.now() + timedelta(minutes=cycle_minutes)
-            logger.info(f"爬取周期完成。等待 {cycle_minutes} 分钟。下一次运行时间: {next_run_time.strftime('%H:%M:%S')}")
-            await asyncio.sleep(cycle_minutes * 60)
+                for state in waiting:
+                    await db.update_final_table(state.name)
+                    state.final_table_stale = timed_out
+
+            for state in states:
+                stats = state.fingerprint.stats()
+                logger.info(
+                    f"[{state.name}] 指纹短路统计: 共 {stats['cycles']} 轮，页面未变跳过 {stats['skipped_html']} 轮，"
+                    f"榜单未变跳过 {stats['skipped_board']} 轮。"
+                )
+            if parser is not None:
+                logger.info(f"解析执行器统计: {parser.stats()}")
+            logger.info(f"爬虫锁竞争统计: {lock.metrics()}")
+            logger.info(f"分析缓存统计: {analysis_cache.stats()}")
+            if pipeline is not None:
+                logger.info(f"分析流水线统计: {pipeline.stats()}")
+
+            # 6. 根据所有榜单的变化程度调整间隔，等待下一个周期
+            scheduler.record_cycle(changed_count, sum(state.board_size for state in states))
+            delay = scheduler.next_delay()
+            next_run_time = datetime.now() + timedelta(seconds=delay)
+            logger.info(f"爬取周期完成。调度指标: {scheduler.metrics()}。等待 {delay:.0f} 秒，下一次运行时间: {next_run_time.strftime('%H:%M:%S')}")
+            await asyncio.sleep(delay)
 
         except asyncio.CancelledError:
             logger.info("爬取任务被取消。")
             break
         except Exception as e:
             logger.error(f"爬取循环中发生错误: {e}", exc_info=True)
-            logger.info("等待60秒后重试...")
-            await asyncio.sleep(60)
+            delay = scheduler.record_failure()
+            logger.info(f"等待{delay:.0f}秒后重试（连续失败 {scheduler.consecutive_failures} 次）...")
+            await asyncio.sleep(delay)
+
+async def replay_archive(archive: SnapshotArchive, speed: float = 0, boards: list = None, start=None, end=None,
+                         parser: ParseExecutor = None):
+    """
+    将存档的页面按时间顺序送入真实的 解析 -> 差异 -> 数据库 流程，不访问网络也不调用分析接口。
+
+    参数:
+        archive (SnapshotArchive): 页面存档。
+        speed (float): 回放倍速；0 表示不等待、尽可能快地回放，N 表示按原始时间间隔的 1/N 等待。
+        boards (list): 只回放指定榜单，默认存档中的全部榜单。
+        start / end (datetime): 回放的时间范围。
+        parser (ParseExecutor): 解析执行器；为None时在事件循环中解析。
+
+    返回值:
+        dict: 回放统计（页面数、跳过数、解析与写库耗时、吞吐量）。
+    """
+    states = {}
+    stats = {'pages': 0, 'skipped': 0, 'events': 0, 'new_topics': 0, 'parse_ms': 0.0, 'db_ms': 0.0}
+    previous_time = None
+    replay_start = time.perf_counter()
+
+    for fetch_time, board, path in archive.iter_entries(boards, start, end):
+        if speed > 0 and previous_time is not None:
+            await asyncio.sleep(max(0.0, (fetch_time - previous_time).total_seconds() / speed))
+        previous_time = fetch_time
+
+        if board not in states:
+            if board in BOARD_URLS:
+                states[board] = BoardState(board)
+                # 回放从空表开始，保证结果可复现
+                states[board].previous_snapshot = {}
+            else:
+                logger.warning(f"跳过未知榜单 {board} 的存档。")
+                states[board] = None
+        state = states[board]
+        if state is None:
+            continue
+
+        html = await asyncio.to_thread(archive.load, path)
+        stats['pages'] += 1
+        unchanged, page_digest = state.fingerprint.html_unchanged(html)
+        if unchanged:
+            stats['skipped'] += 1
+            continue
+
+        parse_start = time.perf_counter()
+        all_news = await parse_weibo_hot(html, board, parser)
+        stats['parse_ms'] += (time.perf_counter() - parse_start) * 1000
+        if not all_news:
+            continue
+        unchanged, list_digest = state.fingerprint.board_unchanged(all_news)
+        if unchanged:
+            state.fingerprint.remember(page_digest, list_digest)
+            stats['skipped'] += 1
+            continue
+
+        db_start = time.perf_counter()
+        state.previous_snapshot, events, changes_to_log = await sync_snapshot(
+            board, state.previous_snapshot, all_news, fetch_time
+        )
+        await db.update_final_table(board)
+        stats['db_ms'] += (time.perf_counter() - db_start) * 1000
+        state.fingerprint.remember(page_digest, list_digest)
+        stats['events'] += len(events)
+        stats['new_topics'] += len(changes_to_log)
+
+        if stats['pages'] % 100 == 0:
+            logger.info(f"已回放 {stats['pages']} 个页面（当前时间点 {fetch_time}）。")
+
+    stats['wall_s'] = time.perf_counter() - replay_start
+    stats['pages_per_s'] = stats['pages'] / stats['wall_s'] if stats['wall_s'] > 0 else 0.0
+    logger.info(
+        f"回放完成: {stats['pages']} 个页面，跳过 {stats['skipped']} 个未变化页面，"
+        f"共 {stats['events']} 个变更事件、{stats['new_topics']} 个新话题；"
+        f"解析 {stats['parse_ms']:.0f}ms，写库 {stats['db_ms']:.0f}ms，"
+        f"总耗时 {stats['wall_s']:.2f}秒，吞吐 {stats['pages_per_s']:.1f} 页/秒。"
+    )
+    return stats
+
 
 # The __main__ block has been removed.
 # A new central script (e.g., main.py) will be created to run the async tasks.
@@ -1,30 +1,50 @@
+import asyncio
 import os
 from contextlib import asynccontextmanager
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from typing import AsyncIterator
 
 from sqlalchemy import (
     Column,
     Integer,
+    SmallInteger,
+    BigInteger,
     String,
     DateTime,
     Text,
     Boolean,
+    insert,
     update,
     delete,
     func,
-    text
+    text,
+    literal,
+    bindparam,
+    inspect,
+    event,
+    or_,
+    case,
+    Index
 )
+from sqlalchemy.dialects import mysql, sqlite
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.future import select
 from sqlalchemy.exc import SQLAlchemyError
 
 from logger import setup_module_logger
+from env_config import env_int
+from topic_key import title_key
 
 logger = setup_module_logger('database_async')
 
 # --- 数据库配置 ---
+# 存储后端：mysql（默认）或 sqlite（单机部署和没有MySQL的测试/基准环境，使用WAL模式）
+DB_BACKEND = os.environ.get('DB_BACKEND', 'mysql').lower()
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'weibo_hot.db')
+if DB_BACKEND not in ('mysql', 'sqlite'):
+    raise ValueError(f"不支持的存储后端 DB_BACKEND={DB_BACKEND}，可选值: mysql、sqlite")
+
 DB_USER = os.environ.get('DB_USER', 'root')
 DB_PASSWORD = os.environ.get('DB_PASS', '123456')
 DB_HOST = os.environ.get('DB_HOST', 'localhost')
@@ -34,10 +54,46 @@ DB_NAME = os.environ.get('DB_NAME', 'weibo_hot')
 # 连接MySQL服务器的连接字符串（不指定数据库）
 SERVER_URL = f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}"
 # 连接应用数据库的连接字符串
-ASYNC_DATABASE_URL = f"{SERVER_URL}/{DB_NAME}?charset=utf8mb4"
+if DB_BACKEND == 'sqlite':
+    ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{SQLITE_PATH}"
+else:
+    ASYNC_DATABASE_URL = f"{SERVER_URL}/{DB_NAME}?charset=utf8mb4"
 
 # --- 引擎和会话设置 ---
-async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False, pool_recycle=3600)
+def _configure_sqlite(engine):
+    """
+    为SQLite引擎设置与MySQL等价的并发语义。
+
+    - WAL模式：读者（包括机器人进程）不会被写事务阻塞
+    - busy_timeout：写锁被占用时等待而不是立即报错
+    - BEGIN IMMEDIATE：事务开始时即获取写锁，代替 SELECT ... FOR UPDATE，
+      避免两个事务先读后写时在升级写锁阶段失败
+    """
+    @event.listens_for(engine.sync_engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        # 由SQLAlchemy的 begin 事件显式开启事务，不使用驱动自带的隐式事务
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f"PRAGMA busy_timeout={env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)}")
+        cursor.close()
+
+    @event.listens_for(engine.sync_engine, 'begin')
+    def _on_begin(conn):
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def make_async_engine(url: str, **kwargs):
+    """按连接字符串创建异步引擎；SQLite引擎会附加WAL等设置，MySQL连接定期回收。"""
+    if url.startswith('sqlite'):
+        engine = create_async_engine(url, echo=False, **kwargs)
+        _configure_sqlite(engine)
+        return engine
+    return create_async_engine(url, echo=False, pool_recycle=3600, **kwargs)
+
+
+async_engine = make_async_engine(ASYNC_DATABASE_URL)
 AsyncSessionFactory = sessionmaker(
     bind=async_engine,
     class_=AsyncSession,
@@ -46,13 +102,25 @@ AsyncSessionFactory = sessionmaker(
 Base = declarative_base()
 
 
+def database_name():
+    """当前使用的数据库：MySQL 为库名，SQLite 为数据库文件路径。"""
+    if async_engine.dialect.name == 'sqlite':
+        return async_engine.url.database
+    return DB_NAME
+
+# 默认榜单（实时热搜榜），旧数据和未指定榜单的查询都归属于它
+DEFAULT_BOARD = 'realtime'
+
+
 # --- ORM模型定义 ---
 class HotTopicMixin:
     """热搜主题表的通用字段"""
     id = Column(Integer, primary_key=True, autoincrement=True)
+    board = Column(String(32), nullable=False, default=DEFAULT_BOARD)
     rank_num = Column(Integer, nullable=False)
     title = Column(String(255), nullable=False, index=True)
-    hot_value = Column(String(255))
+    hot_value = Column(BigInteger, index=True)
+    hot_label = Column(String(32), index=True)
     link = Column(String(255))
     fetch_time = Column(DateTime, default=datetime.now)
     analysis_content = Column(Text)
@@ -60,41 +128,155 @@ class HotTopicMixin:
 
 class HotTop50(HotTopicMixin, Base):
     __tablename__ = 'hot_top50'
-    __table_args__ = {'mysql_charset': 'utf8mb4'}
+    __table_args__ = (
+        # 榜单内标题唯一，作为批量 upsert 的冲突键
+        Index('uq_hot_top50_board_title', 'board', 'title', unique=True),
+        {'mysql_charset': 'utf8mb4'},
+    )
 
 class HotTop50Final(Base):
     __tablename__ = 'hot_top50_final'
     # 明确定义所有列以保证顺序
     id = Column(Integer, primary_key=True, autoincrement=True)
+    board = Column(String(32), nullable=False, default=DEFAULT_BOARD)
+    # 所属的发布版本，只有 final_snapshot_pointer 指向的版本对读者可见
+    snapshot_id = Column(Integer, nullable=False)
     rank_num = Column(Integer, nullable=False)
     title = Column(String(255), nullable=False, index=True)
-    hot_value = Column(String(255))
+    hot_value = Column(BigInteger, index=True)
+    hot_label = Column(String(32), index=True)
     link = Column(String(255))
     fetch_time = Column(DateTime)
     analysis_content = Column(Text)
     analysis_time = Column(DateTime)
     update_time = Column(DateTime, default=datetime.now, onupdate=datetime.now)
-    __table_args__ = {'mysql_charset': 'utf8mb4'}
+    __table_args__ = (
+        Index('ix_hot_top50_final_board_snapshot_rank', 'board', 'snapshot_id', 'rank_num'),
+        {'mysql_charset': 'utf8mb4'},
+    )
 
 class HotChanges(Base):
     __tablename__ = 'hot_changes'
     id = Column(Integer, primary_key=True, autoincrement=True)
+    board = Column(String(32), nullable=False, default=DEFAULT_BOARD)
     rank_num = Column(Integer, nullable=False)
     title = Column(String(255), nullable=False)
-    hot_value = Column(String(255))
+    hot_value = Column(BigInteger, index=True)
+    hot_label = Column(String(32), index=True)
     link = Column(String(255))
     fetch_time = Column(DateTime, default=datetime.now)
-    is_processed = Column(Boolean, default=False, index=True)
+    # 不再需要分析：分析结果已写入，或多次失败后转为死信
+    is_processed = Column(Boolean, default=False)
+    process_time = Column(DateTime)
+    # 分析失败后的重试状态（见 retry_policy）：已尝试次数、下一次重试时间、最后一次错误和是否已转为死信
+    attempt_count = Column(Integer, nullable=False, default=0)
+    next_retry_at = Column(DateTime)
+    last_error = Column(String(255))
+    is_dead = Column(Boolean, nullable=False, default=False, index=True)
+    __table_args__ = (
+        # 未处理计数（attempt_count=0）和按 (attempt_count, id) 顺序取未处理变更都只扫描索引中 is_processed=0 的一小段，
+        # 计数不需要回表
+        Index('ix_hot_changes_pending', 'is_processed', 'attempt_count', 'id'),
+        # 归档任务沿已处理变更的ID顺序分批扫描
+        Index('ix_hot_changes_processed_id', 'is_processed', 'id'),
+        {'mysql_charset': 'utf8mb4'},
+    )
+
+class HotChangesArchive(Base):
+    """已处理且超过保留期的变更记录，由 archive_processed_changes 从 hot_changes 分批迁入"""
+    __tablename__ = 'hot_changes_archive'
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    board = Column(String(32), nullable=False)
+    rank_num = Column(Integer, nullable=False)
+    title = Column(String(255), nullable=False)
+    hot_value = Column(BigInteger)
+    hot_label = Column(String(32))
+    link = Column(String(255))
+    fetch_time = Column(DateTime, index=True)
+    is_processed = Column(Boolean)
     process_time = Column(DateTime)
+    attempt_count = Column(Integer)
+    last_error = Column(String(255))
+    is_dead = Column(Boolean)
+    archived_at = Column(DateTime)
     __table_args__ = {'mysql_charset': 'utf8mb4'}
 
-class SystemStatus(Base):
-    __tablename__ = 'system_status'
-    id = Column(Integer, primary_key=True)
-    is_updating = Column(Boolean, default=False)
-    is_analyzing = Column(Boolean, default=False)
-    last_update_time = Column(DateTime)
-    last_analysis_time = Column(DateTime)
+class AnalysisCache(Base):
+    """
+    分析结果缓存：按规范化标题的哈希保存最近的分析，话题掉榜后重新上榜时直接复用，不再调用分析接口。
+    """
+    __tablename__ = 'analysis_cache'
+    title_hash = Column(String(40), primary_key=True)
+    title = Column(String(255), nullable=False)
+    analysis_content = Column(Text, nullable=False)
+    # 分析生成的时间，超过缓存有效期后不再复用
+    analysis_time = Column(DateTime, nullable=False, index=True)
+    # 最近一次写入或命中的时间，超出容量时按它淘汰最久未使用的条目
+    last_used_at = Column(DateTime, nullable=False, index=True)
+    hit_count = Column(Integer, nullable=False, default=0)
+    __table_args__ = {'mysql_charset': 'utf8mb4'}
+
+class FinalSnapshot(Base):
+    """最终表的发布版本记录，每次发布分配一个新的版本号"""
+    __tablename__ = 'final_snapshots'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    board = Column(String(32), nullable=False, index=True)
+    row_count = Column(Integer)
+    created_at = Column(DateTime, default=datetime.now)
+    __table_args__ = {'mysql_charset': 'utf8mb4'}
+
+class FinalSnapshotPointer(Base):
+    """每个榜单当前对读者可见的最终表版本"""
+    __tablename__ = 'final_snapshot_pointer'
+    board = Column(String(32), primary_key=True)
+    snapshot_id = Column(Integer, nullable=False)
+    published_at = Column(DateTime)
+    __table_args__ = {'mysql_charset': 'utf8mb4'}
+
+class HotTopic(Base):
+    """话题维度表：每个榜单中的每个标题对应一个话题ID，历史表只存ID"""
+    __tablename__ = 'hot_topics'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    board = Column(String(32), nullable=False)
+    title = Column(String(255), nullable=False)
+    first_seen = Column(DateTime, nullable=False)
+    last_seen = Column(DateTime, nullable=False)
+    __table_args__ = (
+        Index('uq_hot_topics_board_title', 'board', 'title', unique=True),
+        {'mysql_charset': 'utf8mb4'},
+    )
+
+class HotTopicHistory(Base):
+    """
+    榜单历史时间序列：每次榜单变化时记录所有话题的排名和热度。
+
+    主键 (topic_id, snapshot_time) 使单个话题的轨迹查询成为主键范围扫描；
+    (board, snapshot_time, rank_num) 索引用于查询某一时刻的整个榜单。
+    MySQL 上按天做 RANGE 分区，分区由 maintain_history_partitions 维护。
+    """
+    __tablename__ = 'hot_topic_history'
+    topic_id = Column(Integer, primary_key=True, autoincrement=False)
+    snapshot_time = Column(DateTime, primary_key=True)
+    board = Column(String(32), nullable=False)
+    rank_num = Column(SmallInteger, nullable=False)
+    hot_value = Column(BigInteger)
+    __table_args__ = (
+        Index('ix_hot_topic_history_board_time', 'board', 'snapshot_time', 'rank_num'),
+        {'mysql_charset': 'utf8mb4'},
+    )
+
+class LockLease(Base):
+    """
+    带租约的锁：持有者需要在租约到期前续约，进程崩溃后锁会在租约到期时自动失效。
+    """
+    __tablename__ = 'lease_locks'
+    name = Column(String(64), primary_key=True)
+    owner = Column(String(128))
+    acquired_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    expires_at = Column(DateTime)
+    # 每次易主时递增，可作为防护令牌判断锁是否在期间被他人获取过
+    version = Column(Integer, nullable=False, default=0)
     __table_args__ = {'mysql_charset': 'utf8mb4'}
 
 
@@ -117,186 +299,901 @@ async def get_session() -> AsyncIterator[AsyncSession]:
 # --- 数据库初始化与状态 ---
 async def init_db():
     """初始化数据库，如果数据库或表不存在则创建它们。"""
-    engine = create_async_engine(SERVER_URL, echo=False)
-    async with engine.connect() as conn:
-        await conn.execute(text(f"CREATE DATABASE IF NOT EXISTS {DB_NAME} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci"))
-    await engine.dispose()
-    logger.info(f"数据库 '{DB_NAME}' 已检查或创建。")
+    if async_engine.dialect.name == 'mysql':
+        engine = create_async_engine(SERVER_URL, echo=False)
+        async with engine.connect() as conn:
+            await conn.execute(text(f"CREATE DATABASE IF NOT EXISTS {DB_NAME} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci"))
+        await engine.dispose()
+    # SQLite 数据库文件在第一次连接时自动创建
+    logger.info(f"数据库 '{database_name()}' 已检查或创建。")
 
     async with async_engine.begin() as conn:
+        await conn.run_sync(_drop_outdated_tables)
         await conn.run_sync(Base.metadata.create_all)
-    
-    async with get_session() as session:
-        result = await session.execute(select(SystemStatus).filter_by(id=1))
-        if not result.scalar_one_or_none():
-            session.add(SystemStatus(id=1))
-            logger.info("已初始化 system_status 表的默认值。")
+    await maintain_history_partitions()
+
+# 长期保存的历史表、归档表和分析缓存，--init 时不清空也不自动重建
+_PRESERVED_TABLES = {'hot_topics', 'hot_topic_history', 'hot_changes_archive', 'analysis_cache'}
+
+def _drop_outdated_tables(sync_conn):
+    """
+    删除列或索引结构与当前模型不一致的旧表，以便 create_all 按新结构重建。
+
+    只在 --init 时调用，此时热搜相关表本来就会被清空，不会丢失需要保留的数据。
+    """
+    inspector = inspect(sync_conn)
+    existing = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        columns = {col['name'] for col in inspector.get_columns(table.name)}
+        missing = [col.name for col in table.columns if col.name not in columns]
+        if table.name in _PRESERVED_TABLES:
+            # 历史数据不随 --init 清空，结构不一致时只提示，需要手动迁移
+            if missing:
+                logger.warning(f"需要保留的表 {table.name} 缺少列 {missing}，不会自动重建，请手动迁移，否则写入时会失败。")
+            continue
+        if missing:
+            logger.warning(f"表 {table.name} 缺少列 {missing}，将按新结构重建。")
+            table.drop(sync_conn)
+            continue
+        indexes = {idx['name']: bool(idx['unique']) for idx in inspector.get_indexes(table.name)}
+        missing = [idx.name for idx in table.indexes if indexes.get(idx.name) != bool(idx.unique)]
+        if missing:
+            logger.warning(f"表 {table.name} 缺少索引 {missing}，将按新结构重建。")
+            table.drop(sync_conn)
 
 async def clear_all_tables():
-    """清空所有相关表的数据并重置系统状态。"""
+    """清空所有相关表的数据并释放所有锁。"""
     async with get_session() as session:
-        for table in [HotTop50, HotChanges, HotTop50Final]:
+        for table in [HotTop50, HotChanges, HotTop50Final, FinalSnapshot, FinalSnapshotPointer]:
             await session.execute(delete(table))
+        # 锁记录保留，只清除持有者：运行中的 LeaseLock 已确认过记录存在，删除后将无法再获取锁
+        leases = LockLease.__table__
+        await session.execute(
+            update(leases).values(owner=None, acquired_at=None, heartbeat_at=None, expires_at=None,
+                                  version=leases.c.version + 1)
+        )
 
-        status = await session.get(SystemStatus, 1)
-        if status:
-            status.is_updating = False
-            status.is_analyzing = False
-        else:
-            session.add(SystemStatus(id=1))
-        
-        logger.info("所有表已被清空，系统状态已重置。")
+        logger.info("所有表已被清空，所有锁已释放。")
 
 
 # --- 锁管理 ---
-async def _acquire_lock(is_updating: bool, is_analyzing: bool):
-    """获取锁的内部函数。"""
+# 租约时间使用应用服务器的本地时钟，多台机器共用一个数据库时需要保证时钟同步。
+async def ensure_lease(name: str):
+    """确保锁记录存在（不存在时插入一条无人持有的记录）。"""
     async with get_session() as session:
-        stmt = (
-            update(SystemStatus)
-            .where(SystemStatus.id == 1, SystemStatus.is_updating == False, SystemStatus.is_analyzing == False)
-            .values(is_updating=is_updating, is_analyzing=is_analyzing, last_update_time=func.now() if is_updating else None, last_analysis_time=func.now() if is_analyzing else None)
-            .execution_options(synchronize_session=False)
+        await session.execute(_upsert_statement(
+            session.bind.dialect.name, LockLease.__table__, [{'name': name, 'version': 0}], ('name',), ('name',)
+        ))
+
+async def try_acquire_lease(name: str, owner: str, ttl: float):
+    """
+    尝试获取租约锁：锁无人持有、已过期或本来就由 owner 持有时获取成功。
+
+    返回值:
+        tuple: (是否获取成功, 之前的持有者, 当前租约到期时间)。
+        获取成功且之前的持有者是他人时，说明接管了一个过期的租约。
+    """
+    now = datetime.now()
+    table = LockLease.__table__
+    async with get_session() as session:
+        result = await session.execute(
+            select(table.c.owner, table.c.expires_at).where(table.c.name == name).with_for_update()
         )
-        result = await session.execute(stmt)
-        return result.rowcount > 0
+        row = result.one_or_none()
+        if row is None:
+            raise RuntimeError(f"锁记录 {name} 不存在，请先调用 ensure_lease")
+        if row.owner and row.owner != owner and row.expires_at and row.expires_at > now:
+            return False, row.owner, row.expires_at
 
-async def acquire_crawler_lock():
-    """如果分析器未运行，则获取爬虫锁。"""
-    if await _acquire_lock(is_updating=True, is_analyzing=False):
-        logger.info("爬虫锁获取成功。")
-        return True
-    logger.info("无法获取爬虫锁，另一个进程可能正在运行。")
-    return False
-
-async def acquire_analyzer_lock():
-    """如果爬虫未运行，则获取分析器锁。"""
-    if await _acquire_lock(is_updating=False, is_analyzing=True):
-        logger.info("分析器锁获取成功。")
-        return True
-    logger.info("无法获取分析器锁，另一个进程可能正在运行。")
-    return False
-
-async def _release_lock(for_crawler: bool):
-    """释放锁的内部函数。"""
+        expires_at = now + timedelta(seconds=ttl)
+        values = {'owner': owner, 'heartbeat_at': now, 'expires_at': expires_at}
+        if row.owner != owner:
+            values.update(acquired_at=now, version=table.c.version + 1)
+        # 条件更新再次检查持有者，防止不支持 FOR UPDATE 的数据库上出现并发获取
+        result = await session.execute(
+            update(table)
+            .where(table.c.name == name,
+                   (table.c.owner.is_(None)) | (table.c.owner == owner) | (table.c.expires_at <= now))
+            .values(**values)
+        )
+        if result.rowcount == 0:
+            return False, row.owner, row.expires_at
+        return True, row.owner, expires_at
+
+async def renew_lease(name: str, owner: str, ttl: float):
+    """续约。锁已不由 owner 持有（例如租约过期后被他人接管）时返回False。"""
+    now = datetime.now()
+    table = LockLease.__table__
     async with get_session() as session:
-        values = {'is_updating': False} if for_crawler else {'is_analyzing': False}
-        stmt = update(SystemStatus).where(SystemStatus.id == 1).values(**values)
-        await session.execute(stmt)
-
-async def release_crawler_lock():
-    """释放爬虫锁。"""
-    await _release_lock(for_crawler=True)
-    logger.info("爬虫锁已释放。")
-
-async def release_analyzer_lock():
-    """释放分析器锁。"""
-    await _release_lock(for_crawler=False)
-    logger.info("分析器锁已释放。")
-
-async def get_system_status():
-    """获取当前系统状态。"""
+        result = await session.execute(
+            update(table)
+            .where(table.c.name == name, table.c.owner == owner)
+            .values(heartbeat_at=now, expires_at=now + timedelta(seconds=ttl))
+        )
+        return result.rowcount > 0
+
+async def release_lease(name: str, owner: str):
+    """释放由 owner 持有的锁，返回是否确实释放了。"""
+    table = LockLease.__table__
     async with get_session() as session:
-        result = await session.execute(select(SystemStatus).filter_by(id=1))
-        return result.scalar_one_or_none()
+        result = await session.execute(
+            update(table).where(table.c.name == name, table.c.owner == owner).values(owner=None, expires_at=None)
+        )
+        return result.rowcount > 0
 
 # --- 数据操作 ---
 
-async def get_hot_topics_map():
-    """获取现有热搜话题及其分析内容的映射。"""
+async def get_hot_topics_snapshot(board: str = DEFAULT_BOARD):
+    """获取指定榜单在主表 `hot_top50` 中的当前快照，作为差异比较的基准。"""
     async with get_session() as session:
-        stmt = select(HotTop50.title, HotTop50.analysis_content, HotTop50.analysis_time)
+        stmt = (
+            select(HotTop50.rank_num, HotTop50.title, HotTop50.hot_value, HotTop50.hot_label, HotTop50.link)
+            .where(HotTop50.board == board)
+        )
         result = await session.execute(stmt)
         return {
             row.title: {
-                'analysis_content': row.analysis_content,
-                'analysis_time': row.analysis_time
+                'board': board,
+                'rank_num': row.rank_num,
+                'title': row.title,
+                'hot_value': row.hot_value,
+                'hot_label': row.hot_label,
+                'link': row.link,
             } for row in result.all()
         }
 
-async def atomic_resync_hot_topics(topics_to_insert: list, changes_to_log: list):
-    """以原子方式将数据库与最新的热搜话题同步。"""
+# upsert 时允许覆盖的列：分析结果不在其中，留在榜单上的话题保留原有分析
+_UPSERT_COLUMNS = ('rank_num', 'hot_value', 'hot_label', 'link', 'fetch_time')
+
+
+def _upsert_statement(dialect_name, table, rows, key_columns, update_columns):
+    """
+    构造单条多行 upsert 语句。
+
+    MySQL 使用 INSERT ... ON DUPLICATE KEY UPDATE，SQLite 使用 INSERT ... ON CONFLICT DO UPDATE，
+    两者都依赖 key_columns 上的唯一索引。
+    """
+    if dialect_name == 'mysql':
+        stmt = mysql.insert(table).values(rows)
+        return stmt.on_duplicate_key_update({col: stmt.inserted[col] for col in update_columns})
+    if dialect_name == 'sqlite':
+        stmt = sqlite.insert(table).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=list(key_columns),
+            set_={col: stmt.excluded[col] for col in update_columns},
+        )
+    raise NotImplementedError(f"不支持的数据库方言: {dialect_name}")
+
+
+async def upsert_hot_topics(session: AsyncSession, rows: list):
+    """
+    用一条多行 upsert 语句写入主表的新增和变化的行，以 (board, title) 唯一索引为冲突键。
+
+    参数:
+        session (AsyncSession): 当前事务的会话。
+        rows (list): build_snapshot 生成的行数据。
+    """
+    if not rows:
+        return
+    stmt = _upsert_statement(
+        session.bind.dialect.name, HotTop50.__table__, rows, ('board', 'title'), _UPSERT_COLUMNS
+    )
+    await session.execute(stmt)
+
+
+async def apply_snapshot_diff(board: str, inserts: list, updates: list, deletes: list, changes_to_log: list,
+                              cached: dict = None):
+    """
+    在一个事务中将某个榜单的快照差异应用到主表，只写入发生变化的行。
+
+    新增和变化的行合并为一条多行 upsert，掉榜的行用一条 DELETE 删除，
+    待分析的变更用一次 executemany 插入，全部绕过ORM的工作单元。
+
+    参数:
+        board (str): 榜单标识。
+        inserts (list): 新上榜话题的行数据。
+        updates (list): 排名或热度发生变化的话题的行数据（按榜单和标题定位）。
+        deletes (list): 掉出榜单的话题标题。
+        changes_to_log (list): 需要写入变更表等待分析的话题。
+        cached (dict): {标题: 缓存的分析}，命中分析缓存的新话题直接写入分析内容，不进入变更表。
+
+    返回值:
+        list: 写入变更表的行数据，每行附带变更ID（'id'），供进程内流水线直接分发给分析器。
+    """
+    table = HotTop50.__table__
     async with get_session() as session:
-        # 使用 TRUNCATE 来重置自增ID，保持id在1-50之间
-        await session.execute(text(f"TRUNCATE TABLE {HotTop50.__tablename__}"))
-        
-        if topics_to_insert:
-            session.add_all([HotTop50(**data) for data in topics_to_insert])
-            logger.info(f"已准备 {len(topics_to_insert)} 条话题用于主表。")
+        if deletes:
+            await session.execute(
+                delete(table).where(table.c.board == board, table.c.title.in_(deletes))
+            )
+
+        await upsert_hot_topics(session, inserts + updates)
+        if cached:
+            await _write_analyses(session, [
+                {'board': board, 'title': title, 'analysis': hit['analysis_content'], 'analysis_time': hit['analysis_time']}
+                for title, hit in cached.items()
+            ])
 
+        logged = []
         if changes_to_log:
-            session.add_all([HotChanges(**data) for data in changes_to_log])
-            logger.info(f"已准备 {len(changes_to_log)} 条新变更用于分析。")
-        return True
+            changes = HotChanges.__table__
+            await session.execute(insert(changes), changes_to_log)
+            # MySQL 的批量插入不返回自增ID：按榜单和标题回查未处理的变更，未处理索引使查询只涉及少量行。
+            # 不按抓取时间匹配：MySQL 的 DATETIME 列只保存到秒，带微秒的参数匹配不到任何行。
+            # 同一标题可能还有更早的未处理变更（例如等待重试），按ID倒序取最新插入的一条
+            result = await session.execute(
+                select(changes.c.id, changes.c.title).where(
+                    changes.c.is_processed == False,
+                    changes.c.board == board,
+                    changes.c.title.in_([row['title'] for row in changes_to_log]),
+                ).order_by(changes.c.id.desc())
+            )
+            ids = {}
+            for row in result.all():
+                ids.setdefault(row.title, row.id)
+            logged = [dict(row, id=ids.get(row['title'])) for row in changes_to_log]
+
+        logger.info(
+            f"[{board}] 主表增量同步: 新增 {len(inserts)} 条，更新 {len(updates)} 条，删除 {len(deletes)} 条；"
+            f"新变更 {len(changes_to_log)} 条待分析，复用缓存分析 {len(cached or {})} 条。"
+        )
+        return logged
+
+def _unanalyzed_topics_query(due_only=True):
+    stmt = select(HotChanges).where(HotChanges.is_processed == False)
+    if due_only:
+        stmt = stmt.where(or_(HotChanges.next_retry_at == None, HotChanges.next_retry_at <= datetime.now()))
+    # 新话题排在等待重试的话题之前，重试中的话题不会拖慢新话题的分析
+    return stmt.order_by(HotChanges.attempt_count, HotChanges.id)
 
-async def get_unanalyzed_topics():
-    """从变更表中获取所有未处理的话题。"""
+def _unprocessed_count_query():
+    return select(func.count()).select_from(HotChanges).where(
+        HotChanges.is_processed == False, HotChanges.attempt_count == 0
+    )
+
+async def get_unanalyzed_topics(due_only: bool = True):
+    """
+    从变更表中获取未处理的话题，新话题在前，等待重试的话题按已尝试次数排在后面。
+
+    参数:
+        due_only (bool): 只返回新话题和已到重试时间的话题；为False时也返回还未到重试时间的话题。
+    """
     async with get_session() as session:
-        stmt = select(HotChanges).where(HotChanges.is_processed == False).order_by(HotChanges.id)
-        result = await session.execute(stmt)
+        result = await session.execute(_unanalyzed_topics_query(due_only))
         return result.scalars().all()
 
-async def mark_change_processed(change_id: int, analysis: str):
-    """将变更标记为已处理，并更新主表中的相应分析。"""
+async def _write_analyses(session: AsyncSession, results: list):
+    """主表的分析内容各不相同，按 (board, title) 唯一键用一次 executemany 更新。"""
+    topics = HotTop50.__table__
+    await session.execute(
+        update(topics)
+        .where(topics.c.board == bindparam('b_board'), topics.c.title == bindparam('b_title'))
+        .values(analysis_content=bindparam('analysis'), analysis_time=bindparam('analysis_time')),
+        [
+            {
+                'b_board': item['board'],
+                'b_title': item['title'],
+                'analysis': item['analysis'],
+                'analysis_time': item['analysis_time'],
+            } for item in results
+        ],
+    )
+
+async def write_partial_analyses(partials: list):
+    """
+    把仍在生成中的分析（截断内容）写入主表，供最终表先行发布。
+
+    只更新还没有完整分析（analysis_time 为空）的行，已写入的完整分析不会被截断内容覆盖；
+    analysis_time 保持为空，完整分析写库时会覆盖这里的内容，分析失败时由 mark_changes_processed 清除。
+
+    参数:
+        partials (list): [{'board', 'title', 'analysis'}, ...]
+
+    返回值:
+        int: 更新的行数。
+    """
+    if not partials:
+        return 0
+    topics = HotTop50.__table__
     async with get_session() as session:
-        change = await session.get(HotChanges, change_id)
-        if not change:
-            logger.error(f"无法找到ID为 {change_id} 的变更以标记为已处理。")
-            return False
-            
-        change.is_processed = True
-        change.process_time = datetime.now()
-
-        # 同时更新主表中的分析结果
-        stmt = (
-            update(HotTop50)
-            .where(HotTop50.title == change.title)
-            .values(analysis_content=analysis, analysis_time=datetime.now())
-            .execution_options(synchronize_session=False)
+        result = await session.execute(
+            update(topics)
+            .where(topics.c.board == bindparam('b_board'), topics.c.title == bindparam('b_title'),
+                   topics.c.analysis_time == None)
+            .values(analysis_content=bindparam('analysis')),
+            [{'b_board': item['board'], 'b_title': item['title'], 'analysis': item['analysis']} for item in partials],
         )
-        await session.execute(stmt)
-        logger.info(f"变更ID {change_id} (话题: '{change.title}') 已标记为已处理。")
-        return True
+        return result.rowcount
+
+async def mark_changes_processed(results: list, failures: list = ()):
+    """
+    在一个事务中批量写入分析结果和分析失败的重试状态。
+
+    变更表用一条 UPDATE ... WHERE id IN (...) 标记为已处理；
+    主表的分析内容各不相同，按 (board, title) 唯一键用一次 executemany 更新；
+    成功的分析同时写入分析缓存，供之后重新上榜的同一话题复用。
+    失败的变更按ID用一次 executemany 更新尝试次数、下一次重试时间和错误信息，转为死信的同时标记为已处理；
+    主表中该话题先行发布的截断分析（analysis_time 为空）同时清除，不会一直留在最终表中。
+
+    参数:
+        results (list): [{'change_id', 'board', 'title', 'analysis', 'analysis_time'}, ...]
+        failures (list): [{'change_id', 'error', 'attempt_count', 'next_retry_at', 'is_dead'}, ...]
+
+    返回值:
+        int: 写入的结果数量（包括失败记录）。
+    """
+    if not results and not failures:
+        return 0
+    changes = HotChanges.__table__
+    now = datetime.now()
+    # 同一批中标题规范化后相同的只保留最后一条
+    cache_rows = {
+        title_key(item['title']): {
+            'title_hash': title_key(item['title']),
+            'title': item['title'],
+            'analysis_content': item['analysis'],
+            'analysis_time': item['analysis_time'],
+            'last_used_at': now,
+            'hit_count': 0,
+        } for item in results
+    }
+    async with get_session() as session:
+        if results:
+            await session.execute(
+                update(changes)
+                .where(changes.c.id.in_([item['change_id'] for item in results]))
+                .values(is_processed=True, process_time=now, next_retry_at=None)
+            )
+            await _write_analyses(session, results)
+        if failures:
+            await session.execute(
+                update(changes)
+                .where(changes.c.id == bindparam('b_id'))
+                .values(
+                    attempt_count=bindparam('b_attempts'), next_retry_at=bindparam('b_retry_at'),
+                    last_error=bindparam('b_error'), is_dead=bindparam('b_dead'),
+                    is_processed=bindparam('b_dead'), process_time=bindparam('b_process_time'),
+                ),
+                [
+                    {
+                        'b_id': item['change_id'],
+                        'b_attempts': item['attempt_count'],
+                        'b_retry_at': item['next_retry_at'],
+                        'b_error': item['error'][:255],
+                        'b_dead': item['is_dead'],
+                        'b_process_time': now if item['is_dead'] else None,
+                    } for item in failures
+                ],
+            )
+            topics = HotTop50.__table__
+            await session.execute(
+                update(topics)
+                .where(topics.c.board == bindparam('b_board'), topics.c.title == bindparam('b_title'),
+                       topics.c.analysis_time == None, topics.c.analysis_content != None)
+                .values(analysis_content=None),
+                [{'b_board': item['board'], 'b_title': item['title']} for item in failures],
+            )
+        if cache_rows:
+            await session.execute(_upsert_statement(
+                session.bind.dialect.name, AnalysisCache.__table__, list(cache_rows.values()),
+                ('title_hash',), ('title', 'analysis_content', 'analysis_time', 'last_used_at'),
+            ))
+    if failures:
+        logger.info(f"批量写入 {len(results)} 条分析结果，{len(failures)} 条分析失败记录。")
+    else:
+        logger.info(f"批量写入 {len(results)} 条分析结果。")
+    return len(results) + len(failures)
 
 async def get_unprocessed_changes_count():
-    """计算未处理的变更数量。"""
+    """计算等待首次分析的变更数量（分析失败后等待重试的变更不计入，见 get_retry_backlog）。"""
     async with get_session() as session:
-        stmt = select(func.count()).select_from(HotChanges).where(HotChanges.is_processed == False)
-        result = await session.execute(stmt)
+        result = await session.execute(_unprocessed_count_query())
         return result.scalar_one()
 
-async def get_hot_topics_count():
-    """计算主表 `hot_top50` 中的话题数量。"""
+async def get_retry_backlog():
+    """
+    统计分析重试队列的积压情况。
+
+    返回值:
+        dict: {'waiting': 等待重试的变更数, 'due': 其中已到重试时间的数量,
+               'dead': 变更表中的死信数量, 'next_retry_at': 最早的下一次重试时间}
+    """
+    now = datetime.now()
+    async with get_session() as session:
+        result = await session.execute(
+            select(
+                func.count(),
+                func.coalesce(func.sum(case((HotChanges.next_retry_at <= now, 1), else_=0)), 0),
+                func.min(HotChanges.next_retry_at),
+            ).where(HotChanges.is_processed == False, HotChanges.attempt_count > 0)
+        )
+        waiting, due, next_retry_at = result.one()
+        result = await session.execute(
+            select(func.count()).select_from(HotChanges).where(HotChanges.is_dead == True)
+        )
+        return {'waiting': waiting, 'due': int(due), 'dead': result.scalar_one(), 'next_retry_at': next_retry_at}
+
+async def get_hot_topics_count(board: str = None):
+    """计算主表 `hot_top50` 中的话题数量，可按榜单过滤。"""
     async with get_session() as session:
         stmt = select(func.count()).select_from(HotTop50)
+        if board:
+            stmt = stmt.where(HotTop50.board == board)
         result = await session.execute(stmt)
         return result.scalar_one()
 
-async def update_final_table():
-    """将 `hot_top50` 的当前状态复制到 `hot_top50_final`。"""
+async def _publish_board(session: AsyncSession, board: str):
+    """
+    为单个榜单发布一个新的最终表版本，返回 (版本号, 行数)。
+
+    新版本的行用一条 INSERT ... SELECT 在数据库内复制，然后更新该榜单的版本指针。
+    update_time 绑定 Python 端的本地时间：SQLite 的 CURRENT_TIMESTAMP 是UTC，会与其他时间列不一致。
+    两步在同一个事务中完成，提交前读者看到的始终是上一个完整版本。
+    """
+    result = await session.execute(insert(FinalSnapshot.__table__).values(board=board, created_at=datetime.now()))
+    snapshot_id = result.inserted_primary_key[0]
+
+    source = HotTop50.__table__
+    columns = ['board', 'rank_num', 'title', 'hot_value', 'hot_label', 'link',
+               'fetch_time', 'analysis_content', 'analysis_time']
+    stmt = insert(HotTop50Final.__table__).from_select(
+        ['snapshot_id'] + columns + ['update_time'],
+        select(literal(snapshot_id), *(source.c[name] for name in columns), literal(datetime.now(), DateTime))
+        .where(source.c.board == board, source.c.rank_num <= 50),
+    )
+    row_count = (await session.execute(stmt)).rowcount
+
+    await session.execute(
+        update(FinalSnapshot.__table__).where(FinalSnapshot.id == snapshot_id).values(row_count=row_count)
+    )
+    await session.execute(_upsert_statement(
+        session.bind.dialect.name, FinalSnapshotPointer.__table__,
+        [{'board': board, 'snapshot_id': snapshot_id, 'published_at': datetime.now()}],
+        ('board',), ('snapshot_id', 'published_at'),
+    ))
+    return snapshot_id, row_count
+
+async def _collect_old_snapshots(board: str, keep: int):
+    """
+    删除某个榜单中除最近 keep 个版本以外的旧版本。
+
+    保留上一个版本，使发布瞬间正在分多条语句读取旧版本的读者仍能读到完整数据。
+    """
+    async with get_session() as session:
+        result = await session.execute(
+            select(FinalSnapshot.id).where(FinalSnapshot.board == board)
+            .order_by(FinalSnapshot.id.desc()).offset(keep - 1).limit(1)
+        )
+        oldest_kept = result.scalar_one_or_none()
+        if oldest_kept is None:
+            return 0
+        result = await session.execute(
+            delete(HotTop50Final.__table__)
+            .where(HotTop50Final.board == board, HotTop50Final.snapshot_id < oldest_kept)
+        )
+        await session.execute(
+            delete(FinalSnapshot.__table__).where(FinalSnapshot.board == board, FinalSnapshot.id < oldest_kept)
+        )
+        return result.rowcount
+
+async def update_final_table(board: str = None):
+    """
+    将 `hot_top50` 的当前状态作为新版本发布到 `hot_top50_final`。
+
+    每次发布写入一个新的版本，并原子地切换 `final_snapshot_pointer` 中该榜单的当前版本，
+    读者通过指针读取，不会看到空表或写了一半的榜单。旧版本在切换后被回收，
+    保留的版本数由环境变量 FINAL_SNAPSHOT_KEEP 控制（默认2，即当前版本和上一个版本）。
+
+    参数:
+        board (str): 只更新指定榜单；为None时更新所有榜单。
+    """
+    if board:
+        boards = [board]
+    else:
+        async with get_session() as session:
+            result = await session.execute(select(HotTop50.board).distinct())
+            boards = [row.board for row in result.all()]
+
+    keep = max(1, env_int('FINAL_SNAPSHOT_KEEP', 2))
+    for board_name in boards:
+        async with get_session() as session:
+            snapshot_id, row_count = await _publish_board(session, board_name)
+        collected = await _collect_old_snapshots(board_name, keep)
+        logger.info(
+            f"成功更新最终表（榜单: {board_name}），发布版本 {snapshot_id}，包含 {row_count} 条话题，"
+            f"回收旧版本数据 {collected} 行。"
+        )
+
+    if not boards:
+        logger.info("最终表已更新，没有需要复制的话题。")
+    return True
+
+
+# --- 历史时间序列 ---
+
+# 话题ID缓存：(榜单, 标题) -> 话题ID，避免每个周期都回查维度表
+_topic_id_cache = {}
+_TOPIC_ID_CACHE_SIZE = 20000
+
+async def _resolve_topic_ids(session: AsyncSession, board: str, titles: list, seen_at: datetime):
+    """
+    返回 {标题: 话题ID}，不存在的话题会被创建，并刷新所有话题的 last_seen。
+    """
+    topics = HotTopic.__table__
+    await session.execute(_upsert_statement(
+        session.bind.dialect.name, topics,
+        [{'board': board, 'title': title, 'first_seen': seen_at, 'last_seen': seen_at} for title in titles],
+        ('board', 'title'), ('last_seen',),
+    ))
+    ids = {title: _topic_id_cache[(board, title)] for title in titles if (board, title) in _topic_id_cache}
+    missing = [title for title in titles if title not in ids]
+    if missing:
+        result = await session.execute(
+            select(topics.c.id, topics.c.title).where(topics.c.board == board, topics.c.title.in_(missing))
+        )
+        if len(_topic_id_cache) > _TOPIC_ID_CACHE_SIZE:
+            _topic_id_cache.clear()
+        for row in result.all():
+            ids[row.title] = row.id
+            _topic_id_cache[(board, row.title)] = row.id
+    return ids
+
+async def record_history(board: str, rows: list, snapshot_time: datetime):
+    """
+    将一次榜单快照写入历史表。
+
+    只在榜单发生变化的周期调用，未变化的周期不产生新行；
+    查询某一时刻的榜单时取不晚于该时刻的最近一次快照即可。
+    写入以 (topic_id, snapshot_time) 为键做 upsert，重复回放同一段存档不会出错。
+
+    参数:
+        board (str): 榜单标识。
+        rows (list): build_snapshot 生成的完整榜单行数据。
+        snapshot_time (datetime): 快照时间。
+    """
+    if not rows:
+        return 0
+    async with get_session() as session:
+        ids = await _resolve_topic_ids(session, board, [row['title'] for row in rows], snapshot_time)
+        history = [
+            {
+                'topic_id': ids[row['title']],
+                'snapshot_time': snapshot_time,
+                'board': board,
+                'rank_num': row['rank_num'],
+                'hot_value': row['hot_value'],
+            } for row in rows if row['title'] in ids
+        ]
+        await session.execute(_upsert_statement(
+            session.bind.dialect.name, HotTopicHistory.__table__, history,
+            ('topic_id', 'snapshot_time'), ('board', 'rank_num', 'hot_value'),
+        ))
+        return len(history)
+
+async def get_topic_trajectory(title: str, board: str = DEFAULT_BOARD, start: datetime = None, end: datetime = None):
+    """
+    查询话题的排名和热度轨迹。
+
+    先通过维度表的唯一索引找到话题ID和出现时间范围，再在历史表上做主键范围扫描；
+    时间范围同时用于分区裁剪。
+
+    返回值:
+        list: [{'snapshot_time', 'rank_num', 'hot_value'}, ...]，按时间顺序；话题不存在时为空列表。
+    """
+    async with get_session() as session:
+        result = await session.execute(
+            select(HotTopic.id, HotTopic.first_seen, HotTopic.last_seen)
+            .where(HotTopic.board == board, HotTopic.title == title)
+        )
+        topic = result.one_or_none()
+        if topic is None:
+            return []
+        start = max(start, topic.first_seen) if start else topic.first_seen
+        end = min(end, topic.last_seen) if end else topic.last_seen
+        history = HotTopicHistory.__table__
+        result = await session.execute(
+            select(history.c.snapshot_time, history.c.rank_num, history.c.hot_value)
+            .where(history.c.topic_id == topic.id, history.c.snapshot_time.between(start, end))
+            .order_by(history.c.snapshot_time)
+        )
+        return [dict(row._mapping) for row in result.all()]
+
+async def _board_snapshot_at(session: AsyncSession, board: str, at: datetime):
+    """返回 (快照时间, {标题: (排名, 热度)})，取不晚于 at 的最近一次快照。"""
+    history = HotTopicHistory.__table__
+    # 只在当天及之前一天的分区内查找最近的快照时间，避免扫描全部分区
+    result = await session.execute(
+        select(func.max(history.c.snapshot_time))
+        .where(history.c.board == board, history.c.snapshot_time <= at,
+               history.c.snapshot_time > at - timedelta(days=1))
+    )
+    snapshot_time = result.scalar_one_or_none()
+    if snapshot_time is None:
+        # 榜单超过一天没有变化（或该时间点之前没有数据）时，退回到不限下界的查找
+        result = await session.execute(
+            select(func.max(history.c.snapshot_time))
+            .where(history.c.board == board, history.c.snapshot_time <= at)
+        )
+        snapshot_time = result.scalar_one_or_none()
+    if snapshot_time is None:
+        return None, {}
+    result = await session.execute(
+        select(HotTopic.title, history.c.rank_num, history.c.hot_value)
+        .join(HotTopic, HotTopic.id == history.c.topic_id)
+        .where(history.c.board == board, history.c.snapshot_time == snapshot_time)
+        .order_by(history.c.rank_num)
+    )
+    return snapshot_time, {row.title: (row.rank_num, row.hot_value) for row in result.all()}
+
+async def get_board_at(at: datetime, board: str = DEFAULT_BOARD):
+    """
+    查询某一时刻的榜单。
+
+    返回值:
+        list: [{'rank_num', 'title', 'hot_value', 'snapshot_time'}, ...]，按排名排序。
+    """
+    async with get_session() as session:
+        snapshot_time, topics = await _board_snapshot_at(session, board, at)
+    return [
+        {'rank_num': rank, 'title': title, 'hot_value': hot_value, 'snapshot_time': snapshot_time}
+        for title, (rank, hot_value) in topics.items()
+    ]
+
+async def get_top_movers(start: datetime, end: datetime, board: str = DEFAULT_BOARD, limit: int = 10):
+    """
+    查询时间窗口内排名上升最多的话题。
+
+    只读取窗口起点和终点两个时刻的榜单，与窗口长度无关。
+    窗口起点时不在榜单上的话题按"榜单长度 + 1"计算原排名。
+
+    返回值:
+        list: [{'title', 'rank_num', 'old_rank_num', 'rank_change', 'hot_value', 'hot_change'}, ...]，
+        按排名上升幅度降序排列。
+    """
     async with get_session() as session:
-        # 使用 TRUNCATE 来重置自增ID
-        await session.execute(text(f"TRUNCATE TABLE {HotTop50Final.__tablename__}"))
-        
-        topics = await session.execute(select(HotTop50).order_by(HotTop50.rank_num).limit(50))
-        
-        final_topics = []
-        for topic in topics.scalars().all():
-            final_topics.append(HotTop50Final(
-                id=None,  # 让数据库自动处理自增ID
-                rank_num=topic.rank_num,
-                title=topic.title,
-                hot_value=topic.hot_value,
-                link=topic.link,
-                fetch_time=topic.fetch_time,
-                analysis_content=topic.analysis_content,
-                analysis_time=topic.analysis_time,
-                # update_time 会自动设置
+        _, before = await _board_snapshot_at(session, board, start)
+        _, after = await _board_snapshot_at(session, board, end)
+    floor_rank = len(before) + 1
+    movers = []
+    for title, (rank, hot_value) in after.items():
+        old_rank, old_hot = before.get(title, (None, None))
+        movers.append({
+            'title': title,
+            'rank_num': rank,
+            'old_rank_num': old_rank,
+            'rank_change': (old_rank or floor_rank) - rank,
+            'hot_value': hot_value,
+            'hot_change': hot_value - old_hot if hot_value is not None and old_hot is not None else None,
+        })
+    movers.sort(key=lambda m: (-m['rank_change'], m['rank_num']))
+    return movers[:limit]
+
+def _partition_name(day: date):
+    return f"p{day.strftime('%Y%m%d')}"
+
+async def maintain_history_partitions(days_ahead: int = None, retention_days: int = None):
+    """
+    维护历史表的按天分区（仅MySQL）。
+
+    - 首次调用时把表转换为 RANGE (TO_DAYS(snapshot_time)) 分区表，只含一个 p_future 分区
+    - 从 p_future 中拆分出今天起 days_ahead 天的日分区
+    - retention_days 大于0时删除早于该天数的日分区（DROP PARTITION，不逐行删除）
+
+    参数默认取环境变量 HISTORY_PARTITION_DAYS_AHEAD（7）和 HISTORY_RETENTION_DAYS（0，永久保留）。
+    """
+    if async_engine.dialect.name != 'mysql':
+        return
+    days_ahead = env_int('HISTORY_PARTITION_DAYS_AHEAD', 7) if days_ahead is None else days_ahead
+    retention_days = env_int('HISTORY_RETENTION_DAYS', 0) if retention_days is None else retention_days
+    table = HotTopicHistory.__tablename__
+
+    async with async_engine.begin() as conn:
+        result = await conn.execute(
+            text("SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+                 "WHERE TABLE_SCHEMA = :schema AND TABLE_NAME = :table"),
+            {'schema': DB_NAME, 'table': table},
+        )
+        names = [row.PARTITION_NAME for row in result.all() if row.PARTITION_NAME]
+        if not names:
+            await conn.execute(text(
+                f"ALTER TABLE {table} PARTITION BY RANGE (TO_DAYS(snapshot_time)) "
+                f"(PARTITION p_future VALUES LESS THAN MAXVALUE)"
+            ))
+            logger.info(f"已将 {table} 转换为按天分区的表。")
+            names = ['p_future']
+
+        days = sorted(datetime.strptime(name[1:], '%Y%m%d').date() for name in names if name != 'p_future')
+        today = date.today()
+        # 新分区只能追加在已有日分区之后
+        first_new = max(today, days[-1] + timedelta(days=1)) if days else today
+        new_days = [first_new + timedelta(days=i) for i in range((today + timedelta(days=days_ahead) - first_new).days + 1)]
+        if new_days:
+            definitions = ', '.join(
+                f"PARTITION {_partition_name(day)} VALUES LESS THAN (TO_DAYS('{day + timedelta(days=1)}'))"
+                for day in new_days
+            )
+            await conn.execute(text(
+                f"ALTER TABLE {table} REORGANIZE PARTITION p_future INTO "
+                f"({definitions}, PARTITION p_future VALUES LESS THAN MAXVALUE)"
+            ))
+            logger.info(f"已为 {table} 新增 {len(new_days)} 个日分区（至 {new_days[-1]}）。")
+
+        if retention_days > 0:
+            expired = [day for day in days if day < today - timedelta(days=retention_days)]
+            if expired:
+                await conn.execute(text(
+                    f"ALTER TABLE {table} DROP PARTITION {', '.join(_partition_name(day) for day in expired)}"
+                ))
+                logger.info(f"已删除 {table} 中 {len(expired)} 个过期的日分区（早于 {retention_days} 天）。")
+
+
+# --- 变更表保留与归档 ---
+async def archive_processed_changes(retention_days: int = None, chunk_size: int = None, pause: float = 0.1):
+    """
+    把已处理（包括死信）且超过保留期的变更从 hot_changes 分批迁入 hot_changes_archive。
+
+    每批按ID顺序取 chunk_size 行，在一个事务中 INSERT ... SELECT 到归档表并从原表删除，
+    批与批之间暂停 pause 秒，避免长事务和长时间锁表影响爬虫和分析器的写入。
+
+    参数默认取环境变量 CHANGES_RETENTION_DAYS（7，0表示不归档）和 CHANGES_ARCHIVE_CHUNK（1000）。
+
+    返回值:
+        int: 迁移的行数。
+    """
+    retention_days = env_int('CHANGES_RETENTION_DAYS', 7) if retention_days is None else retention_days
+    chunk_size = env_int('CHANGES_ARCHIVE_CHUNK', 1000) if chunk_size is None else chunk_size
+    if retention_days <= 0:
+        return 0
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    changes = HotChanges.__table__
+    archive = HotChangesArchive.__table__
+    # 重试时间只对未处理的变更有意义，不归档
+    columns = [col.name for col in changes.columns if col.name in archive.c]
+
+    moved = 0
+    last_id = 0
+    while True:
+        async with get_session() as session:
+            # 沿 (is_processed, id) 索引从上一批结束处继续扫描，不会重复扫描已迁移的范围
+            result = await session.execute(
+                select(changes.c.id)
+                .where(changes.c.is_processed == True, changes.c.id > last_id,
+                       func.coalesce(changes.c.process_time, changes.c.fetch_time) < cutoff)
+                .order_by(changes.c.id)
+                .limit(chunk_size)
+            )
+            ids = result.scalars().all()
+            if not ids:
+                break
+            await session.execute(archive.insert().from_select(
+                columns + ['archived_at'],
+                select(*[changes.c[name] for name in columns], literal(datetime.now())).where(changes.c.id.in_(ids)),
             ))
+            await session.execute(delete(changes).where(changes.c.id.in_(ids)))
+        moved += len(ids)
+        last_id = ids[-1]
+        if len(ids) < chunk_size:
+            break
+        await asyncio.sleep(pause)
 
-        if final_topics:
-            session.add_all(final_topics)
-            logger.info(f"成功更新最终表，包含 {len(final_topics)} 条话题。")
-        else:
-            logger.info("最终表已更新，没有需要复制的话题。")
-        return True
\ No newline at end of file
+    if moved:
+        logger.info(f"已将 {moved} 条超过 {retention_days} 天的已处理变更迁入 {archive.name}。")
+    return moved
+
+async def get_table_stats(tables: list):
+    """
+    返回各表的行数和占用空间。
+
+    MySQL 读取 information_schema.TABLES（行数为估算值）；其他数据库只统计行数。
+
+    返回值:
+        list: [{'table', 'rows', 'data_bytes', 'index_bytes'}, ...]
+    """
+    async with get_session() as session:
+        if session.bind.dialect.name == 'mysql':
+            result = await session.execute(
+                text("SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES "
+                     "WHERE TABLE_SCHEMA = :schema AND TABLE_NAME IN :tables")
+                .bindparams(bindparam('tables', expanding=True)),
+                {'schema': DB_NAME, 'tables': list(tables)},
+            )
+            return [
+                {'table': row.TABLE_NAME, 'rows': row.TABLE_ROWS,
+                 'data_bytes': row.DATA_LENGTH, 'index_bytes': row.INDEX_LENGTH}
+                for row in result.all()
+            ]
+        stats = []
+        for name in tables:
+            result = await session.execute(select(func.count()).select_from(Base.metadata.tables[name]))
+            stats.append({'table': name, 'rows': result.scalar_one(), 'data_bytes': None, 'index_bytes': None})
+        return stats
+
+async def explain_query(stmt):
+    """
+    返回查询的执行计划（MySQL 使用 EXPLAIN，SQLite 使用 EXPLAIN QUERY PLAN），每行一个字典。
+    """
+    async with get_session() as session:
+        dialect = session.bind.dialect
+        sql = str(stmt.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+        prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+        result = await session.execute(text(prefix + sql))
+        return [dict(row._mapping) for row in result.all()]
+
+# 启动检查中需要查看执行计划的高频查询
+HOT_QUERIES = {
+    'unprocessed_count': _unprocessed_count_query,
+    'unanalyzed_topics': _unanalyzed_topics_query,
+}
+
+
+# --- 分析缓存 ---
+async def lookup_analysis_cache(keys: dict, ttl_seconds: float):
+    """
+    按缓存键查询分析缓存，只返回生成时间在有效期内的条目，并更新命中条目的使用时间和命中次数。
+
+    参数:
+        keys (dict): {标题: 缓存键}，精确匹配时为标题自己的 title_key，近似匹配时为相似标题的键。
+
+    返回值:
+        dict: {标题: {'analysis_content', 'analysis_time'}}，只包含命中的标题。
+    """
+    if not keys:
+        return {}
+    cache = AnalysisCache.__table__
+    now = datetime.now()
+    async with get_session() as session:
+        result = await session.execute(
+            select(cache.c.title_hash, cache.c.analysis_content, cache.c.analysis_time)
+            .where(cache.c.title_hash.in_(set(keys.values())),
+                   cache.c.analysis_time >= now - timedelta(seconds=ttl_seconds))
+        )
+        entries = {row.title_hash: row for row in result.all()}
+        if entries:
+            await session.execute(
+                update(cache)
+                .where(cache.c.title_hash.in_(list(entries)))
+                .values(last_used_at=now, hit_count=cache.c.hit_count + 1)
+            )
+    return {
+        title: {'analysis_content': entries[key].analysis_content, 'analysis_time': entries[key].analysis_time}
+        for title, key in keys.items() if key in entries
+    }
+
+async def load_analysis_cache_titles(since: datetime):
+    """返回分析生成时间不早于 since 的缓存条目 [(缓存键, 标题, 分析时间)]，用于增量构建近似标题索引。"""
+    cache = AnalysisCache.__table__
+    async with get_session() as session:
+        result = await session.execute(
+            select(cache.c.title_hash, cache.c.title, cache.c.analysis_time)
+            .where(cache.c.analysis_time >= since)
+            .order_by(cache.c.analysis_time)
+        )
+        return [tuple(row) for row in result.all()]
+
+async def prune_analysis_cache(ttl_seconds: float, max_entries: int):
+    """
+    删除过期的缓存条目；条目数仍超过 max_entries 时按最近使用时间淘汰最久未使用的条目。
+
+    返回值:
+        int: 删除的条目数。
+    """
+    cache = AnalysisCache.__table__
+    async with get_session() as session:
+        result = await session.execute(
+            delete(cache).where(cache.c.analysis_time < datetime.now() - timedelta(seconds=ttl_seconds))
+        )
+        removed = result.rowcount or 0
+        total = (await session.execute(select(func.count()).select_from(cache))).scalar_one()
+        if total > max_entries:
+            # MySQL 不允许 DELETE 的子查询引用同一张表，先查出需要淘汰的键
+            result = await session.execute(
+                select(cache.c.title_hash).order_by(cache.c.last_used_at).limit(total - max_entries)
+            )
+            evicted = result.scalars().all()
+            await session.execute(delete(cache).where(cache.c.title_hash.in_(evicted)))
+            removed += len(evicted)
+    if removed:
+        logger.info(f"分析缓存已清理 {removed} 条过期或最久未使用的条目。")
+    return removed
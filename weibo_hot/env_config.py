@@ -0,0 +1,34 @@
+"""
+环境变量配置读取工具
+各模块的可调参数都通过环境变量设置，值无效时记录警告并使用默认值
+"""
+import os
+from logger import setup_module_logger
+
+logger = setup_module_logger('env_config')
+
+
+def env_float(name, default):
+    """从环境变量读取浮点数配置，无效时使用默认值。"""
+    try:
+        return float(os.environ.get(name, default))
+    except (ValueError, TypeError):
+        logger.warning(f"环境变量 {name} 的值无效，将使用默认值 {default}。")
+        return float(default)
+
+
+def env_int(name, default):
+    """从环境变量读取整数配置，无效时使用默认值。"""
+    try:
+        return int(os.environ.get(name, default))
+    except (ValueError, TypeError):
+        logger.warning(f"环境变量 {name} 的值无效，将使用默认值 {default}。")
+        return int(default)
+
+
+def env_bool(name, default):
+    """从环境变量读取布尔配置（1/true/yes/on 视为真）。"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
@@ -0,0 +1,81 @@
+import hashlib
+
+
+def _table_region(html):
+    """
+    截取热搜表格所在的HTML片段。
+
+    页面头部含有服务器时间、随机令牌等每次请求都会变化的内容，
+    只对表格区域做哈希才能让"榜单未变"的页面得到相同的指纹。
+    找不到表格时退回整页。
+    """
+    first_cell = html.find('td-02')
+    if first_cell == -1:
+        return html
+    start = html.rfind('<tbody', 0, first_cell)
+    end = html.find('</tbody>', first_cell)
+    if start == -1 or end == -1:
+        return html
+    return html[start:end]
+
+
+def html_digest(html):
+    """计算原始页面（表格区域）的哈希值。"""
+    return hashlib.sha1(_table_region(html).encode('utf-8')).hexdigest()
+
+
+def board_digest(all_news):
+    """计算规范化后的热搜列表（按排名顺序的 标题/热度/标签/链接）的哈希值。"""
+    h = hashlib.sha1()
+    for title, info in all_news.items():
+        h.update(f"{title}\x1f{info['热度']}\x1f{info['标签']}\x1f{info['链接']}\x1e".encode('utf-8'))
+    return h.hexdigest()
+
+
+class PageFingerprint:
+    """
+    两级内容指纹，用于让未变化的周期提前结束。
+
+    第一级对抓取到的HTML做哈希，相同则跳过解析；
+    第二级对解析后的规范化列表做哈希，相同则跳过数据库同步和最终表更新。
+    指纹只在本周期的数据库写入成功后通过 remember() 更新，
+    避免写入失败后后续周期被错误跳过。
+    """
+
+    def __init__(self):
+        self.last_html_digest = None
+        self.last_board_digest = None
+        self.cycles = 0
+        self.skipped_html = 0
+        self.skipped_board = 0
+
+    def html_unchanged(self, html):
+        """检查页面是否与上次成功同步时相同，返回 (是否未变, 页面指纹)。"""
+        self.cycles += 1
+        digest = html_digest(html)
+        if digest == self.last_html_digest:
+            self.skipped_html += 1
+            return True, digest
+        return False, digest
+
+    def board_unchanged(self, all_news):
+        """检查解析结果是否与上次成功同步时相同，返回 (是否未变, 榜单指纹)。"""
+        digest = board_digest(all_news)
+        if digest == self.last_board_digest:
+            self.skipped_board += 1
+            return True, digest
+        return False, digest
+
+    def remember(self, page_digest, list_digest):
+        """在数据库写入成功后记录本周期的指纹。"""
+        self.last_html_digest = page_digest
+        self.last_board_digest = list_digest
+
+    def stats(self):
+        """返回各级跳过次数的统计。"""
+        return {
+            'cycles': self.cycles,
+            'skipped_html': self.skipped_html,
+            'skipped_board': self.skipped_board,
+            'processed': self.cycles - self.skipped_html - self.skipped_board,
+        }
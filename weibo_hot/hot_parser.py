@@ -0,0 +1,202 @@
+"""
+微博热搜页面解析模块
+提供可插拔的解析后端，所有后端输出相同的 {标题: {'热度': ..., '标签': ..., '链接': ...}} 结构
+其中热度为整数（页面上没有数字时为None），标签为热度前的分类文字（如"综艺"，没有时为None）
+
+可用后端：
+1. bs4    - 基于 BeautifulSoup 的参考实现，构建整页DOM树
+2. stream - 定向流式解析，只对 td-02 单元格做词法分析（默认）
+3. lxml   - 基于 lxml 的解析（需要安装 lxml）
+"""
+import os
+import re
+import time
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+from logger import setup_module_logger
+
+# 创建日志记录器 - 用于记录解析模块的日志信息
+logger = setup_module_logger('hot_parser')
+
+try:
+    import lxml.html
+except ImportError:  # lxml 为可选依赖
+    lxml = None
+
+DEFAULT_BACKEND = os.environ.get('HOT_PARSER_BACKEND', 'stream')
+
+# 热度文本形如 "123456" 或 "综艺 123456"：数字前的非数字部分为标签
+_HOT_TEXT_RE = re.compile(r'^(\D*?)\s*(\d+)')
+# 标签的最大长度，与数据库中 hot_label 列的长度一致
+HOT_LABEL_MAX_LENGTH = 32
+
+# 单元格中的 <a> 没有 href 属性时各后端传给 _build_item 的标记（没有 <a> 时传空字符串）
+_MISSING_HREF = object()
+
+# 匹配 class 中包含 td-02 的单元格，只截取这些单元格交给分词器处理
+_TD02_CELL_RE = re.compile(
+    r'<td\b[^>]*\bclass\s*=\s*(["\'])(?:(?!\1).)*\btd-02\b(?:(?!\1).)*\1[^>]*>.*?</td\s*>',
+    re.S | re.I,
+)
+
+
+def parse_hot_text(hot_text):
+    """
+    将热度文本拆分为整数热度和分类标签。
+
+    返回值:
+        tuple: (热度, 标签)。例如 "综艺 123456" -> (123456, '综艺')，"123456" -> (123456, None)，
+        没有数字的文本整体作为标签，热度为None。
+    """
+    match = _HOT_TEXT_RE.match(hot_text)
+    if not match:
+        return None, hot_text[:HOT_LABEL_MAX_LENGTH] or None
+    return int(match.group(2)), match.group(1).strip()[:HOT_LABEL_MAX_LENGTH] or None
+
+
+def _build_item(cell_text, href):
+    """
+    将单元格文本和链接转换为 (标题, 信息) 二元组。
+
+    所有后端共用此函数，保证输出一致。单元格不含热度时返回None；
+    结构异常时抛出 IndexError / KeyError，由调用方记录并跳过。
+    """
+    lines = cell_text.split('\n')
+    text = lines[1].strip()
+    if href is _MISSING_HREF:
+        raise KeyError('href')
+    link = href or ''
+    if not link.startswith('http'):
+        link = 'https://s.weibo.com' + link
+
+    if len(lines) < 3 or not lines[2].strip():
+        return None
+
+    hot, label = parse_hot_text(lines[2].strip())
+    return text, {'热度': hot, '标签': label, '链接': link}
+
+
+def _collect(cells):
+    """遍历 (单元格文本, 链接) 序列，跳过表头后组装结果。"""
+    all_news = {}
+    for cell_text, href in cells[1:]:  # 跳过表头
+        try:
+            item = _build_item(cell_text, href)
+        except (IndexError, KeyError) as e:
+            logger.warning(f"解析某个热搜项失败: {e}。 原始文本: {cell_text.strip()}")
+            continue
+        if item:
+            all_news[item[0]] = item[1]
+    return all_news
+
+
+def parse_with_bs4(html):
+    """参考实现：构建完整的 BeautifulSoup 树后提取 td-02 单元格。"""
+    soup = BeautifulSoup(html, 'html.parser')
+    cells = []
+    for news in soup.find_all('td', class_='td-02'):
+        a = news.find('a')
+        # 保留原实现的语义：<a> 缺少 href 时视为解析失败
+        href = (a['href'] if a.has_attr('href') else _MISSING_HREF) if a else ''
+        cells.append((news.text, href))
+    return _collect(cells)
+
+
+class _CellTokenizer(HTMLParser):
+    """只处理单个 td-02 单元格的分词器，累积文本并记录第一个 <a> 的 href。"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.href = ''
+        self._seen_a = False
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip += 1
+        elif tag == 'a' and not self._seen_a:
+            self._seen_a = True
+            self.href = dict(attrs).get('href', _MISSING_HREF)
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style') and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        # 与 BeautifulSoup 的 .text 一致：不包含脚本和样式内容
+        if not self._skip:
+            self.parts.append(data)
+
+
+def parse_with_stream(html):
+    """定向流式解析：先用正则定位 td-02 单元格，再只对这些片段做分词。"""
+    cells = []
+    for match in _TD02_CELL_RE.finditer(html):
+        tokenizer = _CellTokenizer()
+        tokenizer.feed(match.group(0))
+        tokenizer.close()
+        cells.append((''.join(tokenizer.parts), tokenizer.href))
+    return _collect(cells)
+
+
+def parse_with_lxml(html):
+    """基于 lxml 的解析实现。"""
+    if lxml is None:
+        raise RuntimeError("未安装 lxml，无法使用 lxml 解析后端")
+    doc = lxml.html.fromstring(html)
+    cells = []
+    for news in doc.xpath("//td[contains(concat(' ', normalize-space(@class), ' '), ' td-02 ')]"):
+        links = news.xpath('.//a')
+        href = links[0].get('href', _MISSING_HREF) if links else ''
+        cells.append((news.text_content(), href))
+    return _collect(cells)
+
+
+BACKENDS = {
+    'bs4': parse_with_bs4,
+    'stream': parse_with_stream,
+}
+if lxml is not None:
+    BACKENDS['lxml'] = parse_with_lxml
+
+
+def parse_hot_list(html, backend=None):
+    """
+    解析热搜页面。
+
+    参数:
+        html (str): 热搜页面HTML。
+        backend (str): 解析后端名称，默认取环境变量 HOT_PARSER_BACKEND（stream）。
+
+    返回值:
+        dict: {标题: {'热度': 整数热度, '标签': 分类标签, '链接': 链接}}
+    """
+    name = backend or DEFAULT_BACKEND
+    parse = BACKENDS.get(name)
+    if parse is None:
+        logger.warning(f"未知的解析后端 '{name}'，将使用参考实现 bs4。")
+        parse = parse_with_bs4
+    return parse(html)
+
+
+def parse_compact(html, backend=None):
+    """
+    解析热搜页面并返回紧凑的记录列表，供进程池/线程池中的解析阶段调用。
+
+    这是模块级函数，可以被 pickle 后发送到子进程。返回元组列表而不是嵌套字典，
+    减少跨进程传回结果时的序列化开销。
+
+    返回值:
+        tuple: ([(标题, 热度, 标签, 链接), ...], 解析耗时毫秒)
+    """
+    start = time.perf_counter()
+    all_news = parse_hot_list(html, backend)
+    records = [(title, info['热度'], info['标签'], info['链接']) for title, info in all_news.items()]
+    return records, (time.perf_counter() - start) * 1000
+
+
+def expand_records(records):
+    """将 parse_compact 返回的记录还原为 parse_hot_list 的输出结构（保持排名顺序）。"""
+    return {title: {'热度': hot, '标签': label, '链接': link} for title, hot, label, link in records}
@@ -0,0 +1,183 @@
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+
+import httpx
+from logger import setup_module_logger
+from env_config import env_bool, env_float, env_int
+
+# 创建日志记录器 - 用于记录HTTP会话模块的日志信息
+logger = setup_module_logger('http_session')
+
+
+def _http2_available():
+    """HTTP/2 需要安装 h2 包（httpx[http2]）。"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HttpSession:
+    """
+    长连接的异步HTTP会话。
+
+    在多个周期之间复用同一个 httpx.AsyncClient，持有连接池并协商HTTP/2，
+    避免每次请求都重新进行TCP+TLS握手。同时记录每个请求的连接、首字节(TTFB)
+    和下载耗时，用于观察连接复用带来的收益。
+    """
+
+    def __init__(self, name, headers=None, timeout=30.0, connect_timeout=10.0,
+                 max_connections=10, max_keepalive_connections=5, keepalive_expiry=120.0,
+                 http2=True, trust_env=False, history_size=100):
+        self.name = name
+        if http2 and not _http2_available():
+            logger.warning(f"[{name}] 未安装 h2 包，HTTP/2 不可用，回退到 HTTP/1.1。")
+            http2 = False
+        self.http2 = http2
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            http2=http2,
+            trust_env=trust_env,
+        )
+        self.timings = deque(maxlen=history_size)
+        self.request_count = 0
+        self.new_connection_count = 0
+        logger.info(
+            f"[{name}] HTTP会话已创建: HTTP/2={'开启' if http2 else '关闭'}, "
+            f"超时={timeout}秒, 最大连接数={max_connections}, 保活连接数={max_keepalive_connections}"
+        )
+
+    @classmethod
+    def from_env(cls, name, prefix, headers=None, **defaults):
+        """
+        根据环境变量创建会话。
+
+        支持的环境变量（以 prefix 为前缀）：
+        _HTTP2, _TIMEOUT, _CONNECT_TIMEOUT, _MAX_CONNECTIONS,
+        _MAX_KEEPALIVE, _KEEPALIVE_EXPIRY
+        """
+        return cls(
+            name,
+            headers=headers,
+            http2=env_bool(f'{prefix}_HTTP2', defaults.get('http2', True)),
+            timeout=env_float(f'{prefix}_TIMEOUT', defaults.get('timeout', 30.0)),
+            connect_timeout=env_float(f'{prefix}_CONNECT_TIMEOUT', defaults.get('connect_timeout', 10.0)),
+            max_connections=env_int(f'{prefix}_MAX_CONNECTIONS', defaults.get('max_connections', 10)),
+            max_keepalive_connections=env_int(f'{prefix}_MAX_KEEPALIVE', defaults.get('max_keepalive_connections', 5)),
+            keepalive_expiry=env_float(f'{prefix}_KEEPALIVE_EXPIRY', defaults.get('keepalive_expiry', 120.0)),
+            trust_env=defaults.get('trust_env', False),
+        )
+
+    @staticmethod
+    def _traced(kwargs):
+        """在请求参数中加入 trace 扩展，返回记录各阶段时间点的字典。"""
+        marks = {}
+
+        async def trace(event_name, info):
+            # httpcore 的事件名形如 "connection.connect_tcp.started"、"http11.receive_response_headers.complete"
+            marks.setdefault(event_name.split('.', 1)[-1], time.perf_counter())
+
+        extensions = dict(kwargs.get('extensions') or {})
+        extensions['trace'] = trace
+        kwargs['extensions'] = extensions
+        return marks
+
+    async def request(self, method, url, **kwargs):
+        """发送请求并记录本次请求的分阶段耗时。"""
+        marks = self._traced(kwargs)
+        start = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        end = time.perf_counter()
+        self._record(marks, start, end, response)
+        return response
+
+    @asynccontextmanager
+    async def stream(self, method, url, **kwargs):
+        """以流式方式发送请求（与 httpx.AsyncClient.stream 相同），响应关闭时记录分阶段耗时。"""
+        marks = self._traced(kwargs)
+        start = time.perf_counter()
+        async with self.client.stream(method, url, **kwargs) as response:
+            try:
+                yield response
+            finally:
+                self._record(marks, start, time.perf_counter(), response)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    def _record(self, marks, start, end, response):
+        """根据 trace 事件计算连接、首字节和下载耗时。"""
+        def span(begin, finish):
+            if begin in marks and finish in marks:
+                return (marks[finish] - marks[begin]) * 1000
+            return 0.0
+
+        reused = 'connect_tcp.started' not in marks
+        connect_end = 'start_tls.complete' if 'start_tls.complete' in marks else 'connect_tcp.complete'
+        send_started = next((k for k in ('send_request_headers.started', 'send_connection_init.started') if k in marks), None)
+        timing = {
+            'url': str(response.request.url),
+            'status_code': response.status_code,
+            'http_version': response.http_version,
+            'reused': reused,
+            'connect_ms': span('connect_tcp.started', connect_end),
+            'ttfb_ms': span(send_started, 'receive_response_headers.complete') if send_started else 0.0,
+            'download_ms': span('receive_response_body.started', 'receive_response_body.complete'),
+            'total_ms': (end - start) * 1000,
+        }
+        self.timings.append(timing)
+        self.request_count += 1
+        if not reused:
+            self.new_connection_count += 1
+        logger.info(
+            f"[{self.name}] {timing['http_version']} {timing['status_code']} "
+            f"连接: {timing['connect_ms']:.1f}ms, 首字节: {timing['ttfb_ms']:.1f}ms, "
+            f"下载: {timing['download_ms']:.1f}ms, 总计: {timing['total_ms']:.1f}ms, "
+            f"复用连接: {'是' if reused else '否'}"
+        )
+
+    def stats(self):
+        """返回会话累计统计，用于比较新建连接与复用连接的耗时。"""
+        def avg(items, key):
+            return round(sum(t[key] for t in items) / len(items), 1) if items else 0.0
+
+        reused = [t for t in self.timings if t['reused']]
+        fresh = [t for t in self.timings if not t['reused']]
+        return {
+            'requests': self.request_count,
+            'new_connections': self.new_connection_count,
+            'reuse_ratio': round(1 - self.new_connection_count / self.request_count, 3) if self.request_count else 0.0,
+            'avg_total_ms_reused': avg(reused, 'total_ms'),
+            'avg_total_ms_new': avg(fresh, 'total_ms'),
+            'avg_connect_ms': avg(fresh, 'connect_ms'),
+            'avg_ttfb_ms': avg(self.timings, 'ttfb_ms'),
+            'http_versions': dict(Counter(t['http_version'] for t in self.timings)),
+        }
+
+    async def aclose(self):
+        """关闭连接池并输出统计信息。"""
+        if self.client.is_closed:
+            return
+        stats = self.stats()
+        logger.info(
+            f"[{self.name}] 正在关闭HTTP会话。共 {stats['requests']} 次请求，"
+            f"新建连接 {stats['new_connections']} 次，复用率 {stats['reuse_ratio']:.0%}。"
+        )
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
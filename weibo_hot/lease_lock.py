@@ -0,0 +1,190 @@
+"""
+租约锁模块
+用带持有者和到期时间的租约代替 system_status 表中的布尔标志，协调爬虫和分析器对数据的访问
+
+- 持有者在后台定期续约，进程崩溃后锁在租约到期时自动失效，不再需要 --init 清理
+- 同一进程内释放锁时直接唤醒等待者，不必轮询；其他进程持有的锁按到期时间和轮询间隔重试
+- 统计等待时间、持有时间、接管过期租约（steal）和租约丢失的次数
+"""
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+
+import database as db
+from logger import setup_module_logger
+from env_config import env_float
+
+# 创建日志记录器 - 用于记录租约锁模块的日志信息
+logger = setup_module_logger('lease_lock')
+
+# 爬虫写库和分析器更新结果共用的锁
+PIPELINE_LOCK = 'pipeline'
+
+# 锁名 -> 本进程内等待该锁释放的事件
+_release_events = {}
+
+
+def _release_event(name):
+    event = _release_events.get(name)
+    if event is None:
+        event = _release_events[name] = asyncio.Event()
+    return event
+
+
+def _notify_released(name):
+    event = _release_events.pop(name, None)
+    if event is not None:
+        event.set()
+
+
+async def wait_released(name, timeout):
+    """等待本进程内的某个持有者释放锁，最多等待 timeout 秒。返回是否被唤醒。"""
+    try:
+        await asyncio.wait_for(_release_event(name).wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+class LeaseLock:
+    """
+    基于 lease_locks 表的租约锁。
+
+    同一个锁名可以被多个角色（如 crawler、analyzer）竞争，每个实例有唯一的持有者ID。
+    """
+
+    def __init__(self, name, role, ttl=30.0, heartbeat_interval=None, poll_interval=5.0):
+        self.name = name
+        self.role = role
+        self.owner = f"{role}@{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval or ttl / 3
+        self.poll_interval = poll_interval
+        self.held = False
+        self._ensured = False
+        self._acquired_at = None
+        self._heartbeat_task = None
+
+        self.acquisitions = 0
+        self.failures = 0
+        self.contended = 0        # 需要等待才获取到的次数
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.total_hold_ms = 0.0
+        self.max_hold_ms = 0.0
+        self.steals = 0           # 接管他人过期租约的次数
+        self.lost = 0             # 自己的租约被他人接管的次数
+
+    @classmethod
+    def from_env(cls, name, role):
+        """
+        根据环境变量创建租约锁。
+
+        LOCK_LEASE_TTL: 租约时长（秒），持有者每隔三分之一租约时长续约一次
+        LOCK_POLL_INTERVAL: 锁由其他进程持有时重试的最长间隔（秒）
+        """
+        return cls(
+            name,
+            role,
+            ttl=env_float('LOCK_LEASE_TTL', 30),
+            poll_interval=env_float('LOCK_POLL_INTERVAL', 5),
+        )
+
+    async def acquire(self, timeout=0.0):
+        """
+        获取锁，最多等待 timeout 秒。
+
+        返回值:
+            bool: 是否获取成功。
+        """
+        if not self._ensured:
+            await db.ensure_lease(self.name)
+            self._ensured = True
+
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+        while True:
+            acquired, previous_owner, expires_at = await db.try_acquire_lease(self.name, self.owner, self.ttl)
+            if acquired:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.failures += 1
+                self._record_wait(start)
+                logger.info(f"[{self.role}] 未能在 {timeout:.0f} 秒内获取锁 {self.name}，当前持有者: {previous_owner}")
+                return False
+            waited = True
+            # 本进程内的持有者释放时会立即唤醒；其他进程的持有者只能等到其租约到期或下一次重试
+            until_expiry = max(0.0, (expires_at - datetime.now()).total_seconds()) if expires_at else remaining
+            await wait_released(self.name, min(remaining, self.poll_interval, until_expiry + 0.05))
+
+        self.held = True
+        self.acquisitions += 1
+        if waited:
+            self.contended += 1
+        self._record_wait(start)
+        if previous_owner and previous_owner != self.owner:
+            self.steals += 1
+            logger.warning(f"[{self.role}] 锁 {self.name} 的持有者 {previous_owner} 租约已过期，已接管。")
+        self._acquired_at = time.monotonic()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        logger.info(f"[{self.role}] 锁 {self.name} 获取成功。")
+        return True
+
+    async def release(self):
+        """释放锁并唤醒本进程内的等待者。"""
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+        if self._acquired_at is not None:
+            hold_ms = (time.monotonic() - self._acquired_at) * 1000
+            self.total_hold_ms += hold_ms
+            self.max_hold_ms = max(self.max_hold_ms, hold_ms)
+            self._acquired_at = None
+        if self.held:
+            self.held = False
+            if not await db.release_lease(self.name, self.owner):
+                logger.warning(f"[{self.role}] 释放锁 {self.name} 时发现其已不由本实例持有。")
+            else:
+                logger.info(f"[{self.role}] 锁 {self.name} 已释放。")
+        _notify_released(self.name)
+
+    async def _heartbeat(self):
+        """定期续约；续约失败说明租约已被他人接管。"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                renewed = await db.renew_lease(self.name, self.owner, self.ttl)
+            except Exception as e:
+                logger.error(f"[{self.role}] 续约锁 {self.name} 失败: {e}", exc_info=True)
+                continue
+            if not renewed:
+                self.held = False
+                self.lost += 1
+                logger.error(f"[{self.role}] 锁 {self.name} 的租约已丢失，可能因续约不及时被其他进程接管。")
+                return
+
+    def _record_wait(self, start):
+        wait_ms = (time.monotonic() - start) * 1000
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def metrics(self):
+        """返回锁竞争统计。"""
+        attempts = self.acquisitions + self.failures
+        return {
+            'acquisitions': self.acquisitions,
+            'failures': self.failures,
+            'contended': self.contended,
+            'avg_wait_ms': round(self.total_wait_ms / attempts, 1) if attempts else 0.0,
+            'max_wait_ms': round(self.max_wait_ms, 1),
+            'avg_hold_ms': round(self.total_hold_ms / self.acquisitions, 1) if self.acquisitions else 0.0,
+            'max_hold_ms': round(self.max_hold_ms, 1),
+            'steals': self.steals,
+            'lost': self.lost,
+        }
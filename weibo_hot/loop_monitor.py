@@ -0,0 +1,108 @@
+"""
+事件循环延迟监控模块
+周期性地测量事件循环的调度延迟，用于发现阻塞事件循环的同步代码（如在协程中解析HTML）
+"""
+import asyncio
+import time
+from collections import deque
+
+from logger import setup_module_logger
+from env_config import env_bool, env_float
+
+# 创建日志记录器 - 用于记录事件循环监控模块的日志信息
+logger = setup_module_logger('loop_monitor')
+
+
+class LoopLagMonitor:
+    """
+    事件循环延迟监控器。
+
+    后台任务每隔 interval 秒醒来一次，实际醒来时间比预期晚多少即为事件循环延迟。
+    延迟超过 stall_threshold_ms 的记为一次卡顿并输出警告；
+    每隔 report_interval 秒输出一次窗口内的延迟分布。
+    """
+
+    def __init__(self, interval=0.1, stall_threshold_ms=100.0, report_interval=60.0, window_size=600):
+        self.interval = interval
+        self.stall_threshold_ms = stall_threshold_ms
+        self.report_interval = report_interval
+        self.samples = deque(maxlen=window_size)
+        self.stall_count = 0
+        self.max_lag_ms = 0.0
+        self._task = None
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建监控器。
+
+        LOOP_LAG_INTERVAL: 采样间隔（秒）
+        LOOP_LAG_STALL_MS: 判定为卡顿的延迟阈值（毫秒）
+        LOOP_LAG_REPORT_INTERVAL: 输出统计的间隔（秒）
+        """
+        return cls(
+            interval=env_float('LOOP_LAG_INTERVAL', 0.1),
+            stall_threshold_ms=env_float('LOOP_LAG_STALL_MS', 100),
+            report_interval=env_float('LOOP_LAG_REPORT_INTERVAL', 60),
+        )
+
+    @staticmethod
+    def enabled():
+        """是否启用监控，由环境变量 LOOP_LAG_MONITOR 控制，默认启用。"""
+        return env_bool('LOOP_LAG_MONITOR', True)
+
+    def start(self):
+        """在当前事件循环中启动监控任务。"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self):
+        """停止监控任务并输出最终统计。"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._report()
+
+    async def _run(self):
+        last_report = time.monotonic()
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.record((now - expected) * 1000)
+            if now - last_report >= self.report_interval:
+                self._report()
+                last_report = now
+
+    def record(self, lag_ms):
+        """记录一次延迟采样。"""
+        lag_ms = max(0.0, lag_ms)
+        self.samples.append(lag_ms)
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        if lag_ms >= self.stall_threshold_ms:
+            self.stall_count += 1
+            logger.warning(f"事件循环卡顿: 延迟 {lag_ms:.0f}ms（阈值 {self.stall_threshold_ms:.0f}ms）。")
+
+    def metrics(self):
+        """返回最近窗口内的延迟分位数，以及累计的最大延迟和卡顿次数。"""
+        ordered = sorted(self.samples)
+
+        def percentile(p):
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+        return {
+            'samples': len(ordered),
+            'p50_ms': round(percentile(0.5), 1),
+            'p99_ms': round(percentile(0.99), 1),
+            'window_max_ms': round(ordered[-1] if ordered else 0.0, 1),
+            'max_ms': round(self.max_lag_ms, 1),
+            'stalls': self.stall_count,
+        }
+
+    def _report(self):
+        logger.info(f"事件循环延迟统计: {self.metrics()}")
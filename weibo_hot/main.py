@@ -4,7 +4,10 @@ import argparse
 import signal
 from logger import setup_module_logger
 import crawler
-import analysis
+from archive import SnapshotArchive
+from parse_pool import ParseExecutor
+from loop_monitor import LoopLagMonitor
+import maintenance
 
 logger = setup_module_logger('main')
 
@@ -31,16 +34,59 @@ async def main():
         action='store_true',
         help="对所有未处理的话题运行一次分析，然后退出。"
     )
+    parser.add_argument(
+        '--record',
+        metavar='DIR',
+        help="持续运行时将每个抓取到的页面压缩存档到指定目录，供离线回放。"
+    )
+    parser.add_argument(
+        '--replay',
+        metavar='DIR',
+        help="清空数据表后，将存档目录中的页面送入 解析/差异/数据库 流程回放，然后退出。不访问网络，也不调用分析接口。"
+    )
+    parser.add_argument(
+        '--replay-speed',
+        type=float,
+        default=0,
+        help="回放倍速：0（默认）表示尽可能快，N 表示按原始时间间隔的 1/N 等待。"
+    )
+    parser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help="持续运行时使用进程内分析流水线：新话题通过队列直接交给分析协程，不再轮询数据库协调爬虫和分析器。"
+    )
     
     args = parser.parse_args()
     max_workers = get_max_analysis_workers()
+    # 爬虫的长连接会话在整个进程生命周期内共享，退出时统一关闭
+    crawler_session = crawler.create_crawler_session()
+    # HTML解析在进程池/线程池中执行，避免阻塞同一事件循环中的分析任务
+    parse_executor = ParseExecutor.from_env()
+    # 监控事件循环延迟，用于确认爬取周期中不再出现长时间卡顿
+    lag_monitor = LoopLagMonitor.from_env() if LoopLagMonitor.enabled() else None
+    if lag_monitor:
+        lag_monitor.start()
+    pipeline = None
+    analysis_session = None
 
     try:
+        if args.replay:
+            logger.warning(f"回放模式将清空数据库 '{crawler.db.database_name()}' 中的热搜数据表，请确认使用的是测试库。")
+            await crawler.db.init_db()
+            await crawler.db.clear_all_tables()
+            await crawler.replay_archive(SnapshotArchive(args.replay), speed=args.replay_speed, parser=parse_executor)
+            return
+
+        # 分析模块在导入时要求配置 DEEPSEEK_API_KEY，回放模式不需要它
+        import analysis
+        # 分析接口的长连接会话在各轮分析（以及流水线）之间共享，退出时统一关闭
+        analysis_session = analysis.create_analysis_session()
+
         if args.init:
             logger.info("启动系统初始化程序...")
-            if await crawler.initialize_system():
+            if await crawler.initialize_system(crawler_session, parse_executor):
                 logger.info("初始数据爬取完成。现在开始分析所有话题...")
-                await analysis.wait_for_initialization(max_workers)
+                await analysis.wait_for_initialization(max_workers, analysis_session)
                 logger.info("系统初始化完成。")
             else:
                 logger.error("在爬取阶段，系统初始化失败。")
@@ -48,12 +94,13 @@ async def main():
 
         if args.one_time_analysis:
             logger.info("启动一次性分析程序...")
-            await analysis.one_time_analysis_mode(max_workers)
+            await analysis.one_time_analysis_mode(max_workers, analysis_session)
             logger.info("一次性分析执行完毕。")
             return
 
         # 默认模式：持续运行
         logger.info("启动持续运行模式...")
+        await maintenance.report_table_health()
         print("系统已启动，爬虫和分析程序正在后台持续运行。按 Ctrl+C 退出。")
         
         loop = asyncio.get_running_loop()
@@ -70,10 +117,19 @@ async def main():
             loop.add_signal_handler(signal.SIGINT, stop.set_result, True)
             loop.add_signal_handler(signal.SIGTERM, stop.set_result, True)
 
-        crawler_task = asyncio.create_task(crawler.continuous_crawling_mode())
-        analyzer_task = asyncio.create_task(analysis.continuous_analysis_mode(max_workers))
-        
-        tasks = [crawler_task, analyzer_task]
+        if args.pipeline:
+            # 流水线模式：分析协程由流水线管理，爬虫提交新话题后等待完成通知
+            from pipeline import AnalysisPipeline
+            pipeline = AnalysisPipeline.from_env(max_workers, analysis_session)
+            await pipeline.start()
+
+        crawler_task = asyncio.create_task(crawler.continuous_crawling_mode(
+            crawler_session, SnapshotArchive(args.record) if args.record else None, parse_executor, pipeline
+        ))
+        # 后台保留任务定期把已处理的旧变更迁入归档表
+        tasks = [crawler_task, asyncio.create_task(maintenance.retention_loop())]
+        if pipeline is None:
+            tasks.append(asyncio.create_task(analysis.continuous_analysis_mode(max_workers, analysis_session)))
         
         try:
             await stop
@@ -92,6 +148,16 @@ async def main():
     except Exception as e:
         logger.critical(f"主程序遇到无法恢复的错误: {e}", exc_info=True)
     finally:
+        if pipeline:
+            await pipeline.aclose()
+        if lag_monitor:
+            await lag_monitor.stop()
+        parse_executor.shutdown()
+        logger.info("正在关闭爬虫HTTP会话...")
+        await crawler_session.aclose()
+        if analysis_session:
+            logger.info("正在关闭分析接口HTTP会话...")
+            await analysis_session.aclose()
         # 这是关闭数据库连接池的唯一、可靠的地方。
         logger.info("正在安全关闭数据库连接池...")
         await crawler.db.async_engine.dispose()
@@ -0,0 +1,73 @@
+"""
+数据库维护模块
+- 启动检查：输出热搜相关表的行数和空间占用、分析重试队列的积压，以及高频查询的执行计划
+- 后台保留任务：定期把已处理且超过保留期的变更从 hot_changes 迁入归档表，防止变更表无限增长，
+  并清理分析缓存中过期和超出容量的条目
+"""
+import asyncio
+
+import database as db
+from analysis_cache import analysis_cache
+from logger import setup_module_logger
+from env_config import env_float
+
+# 创建日志记录器 - 用于记录数据库维护模块的日志信息
+logger = setup_module_logger('maintenance')
+
+# 启动检查中统计大小的表
+REPORT_TABLES = ['hot_changes', 'hot_changes_archive', 'hot_top50', 'hot_top50_final', 'hot_topic_history', 'analysis_cache']
+# 高频查询应当使用的索引
+EXPECTED_INDEX = 'ix_hot_changes_pending'
+
+
+def _format_bytes(size):
+    if size is None:
+        return '未知'
+    return f"{size / 1024 / 1024:.1f}MB"
+
+
+async def report_table_health():
+    """
+    输出各表的大小和高频查询的执行计划。
+
+    未处理计数和未分析话题查询每个周期都会执行，执行计划中没有使用 (is_processed, attempt_count, id) 索引时输出警告，
+    通常说明表是旧结构，需要运行 --init 重建。检查失败只记录日志，不影响启动。
+    """
+    try:
+        for stats in await db.get_table_stats(REPORT_TABLES):
+            logger.info(
+                f"表 {stats['table']}: 约 {stats['rows']} 行，数据 {_format_bytes(stats['data_bytes'])}，"
+                f"索引 {_format_bytes(stats['index_bytes'])}。"
+            )
+        backlog = await db.get_retry_backlog()
+        logger.info(f"分析重试队列: 等待重试 {backlog['waiting']} 条（已到期 {backlog['due']} 条），死信 {backlog['dead']} 条。")
+        for name, build_query in db.HOT_QUERIES.items():
+            plan = await db.explain_query(build_query())
+            logger.info(f"查询 {name} 的执行计划: {plan}")
+            if EXPECTED_INDEX not in str(plan):
+                logger.warning(f"查询 {name} 未使用索引 {EXPECTED_INDEX}，变更表增长后会越来越慢，请运行 --init 按新结构重建。")
+    except Exception as e:
+        logger.error(f"数据库启动检查失败: {e}", exc_info=True)
+
+
+async def retention_loop(interval: float = None):
+    """
+    后台保留任务：每隔 interval 秒（默认取环境变量 CHANGES_RETENTION_INTERVAL，3600）归档一次已处理的旧变更，
+    并清理分析缓存。
+    """
+    interval = env_float('CHANGES_RETENTION_INTERVAL', 3600) if interval is None else interval
+    logger.info(f"启动变更表保留任务，间隔 {interval:.0f} 秒。")
+    while True:
+        try:
+            await db.archive_processed_changes()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"归档已处理变更失败: {e}", exc_info=True)
+        try:
+            await analysis_cache.prune()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"清理分析缓存失败: {e}", exc_info=True)
+        await asyncio.sleep(interval)
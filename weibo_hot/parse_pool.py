@@ -0,0 +1,124 @@
+"""
+热搜页面解析执行器
+将CPU密集的HTML解析移出事件循环，避免解析期间分析任务的HTTP回调和数据库I/O被阻塞
+
+执行方式（环境变量 PARSE_EXECUTOR）：
+1. process - 在进程池中解析（默认），不受GIL限制，事件循环完全不被占用
+2. thread  - 在线程池中解析，开销小，但纯Python解析仍会与事件循环争用GIL
+3. inline  - 在事件循环中直接解析（原有行为）
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import hot_parser
+from logger import setup_module_logger
+from env_config import env_int
+
+# 创建日志记录器 - 用于记录解析执行器模块的日志信息
+logger = setup_module_logger('parse_pool')
+
+MODES = ('process', 'thread', 'inline')
+
+
+class ParseExecutor:
+    """
+    基于进程池或线程池的解析阶段。
+
+    子进程只接收HTML文本、返回紧凑的记录列表（见 hot_parser.parse_compact），
+    主进程再还原为字典。进程池意外损坏时会重建，本次请求退回到事件循环中解析。
+    """
+
+    def __init__(self, mode='process', workers=2, backend=None):
+        if mode not in MODES:
+            logger.warning(f"未知的解析执行方式 '{mode}'，可选值: {', '.join(MODES)}，将使用 process。")
+            mode = 'process'
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.backend = backend
+        self._pool = None
+        self.parse_count = 0
+        self.parse_ms = 0.0      # 解析函数本身的耗时
+        self.wall_ms = 0.0       # 从提交到拿到结果的总耗时（含排队和序列化）
+        self.fallback_count = 0
+        logger.info(f"解析执行器已创建: 方式={mode}, 工作者数={self.workers}")
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建解析执行器。
+
+        PARSE_EXECUTOR: process / thread / inline
+        PARSE_WORKERS: 进程池或线程池的工作者数量
+        """
+        return cls(
+            mode=os.environ.get('PARSE_EXECUTOR', 'process').strip().lower(),
+            workers=env_int('PARSE_WORKERS', 2),
+        )
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.mode == 'process':
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='parse')
+        return self._pool
+
+    async def parse(self, html):
+        """
+        解析热搜页面。
+
+        返回值:
+            dict: 与 hot_parser.parse_hot_list 相同的结构。
+        """
+        start = time.perf_counter()
+        if self.mode == 'inline':
+            records, parse_ms = hot_parser.parse_compact(html, self.backend)
+        else:
+            loop = asyncio.get_running_loop()
+            try:
+                records, parse_ms = await loop.run_in_executor(
+                    self._get_pool(), hot_parser.parse_compact, html, self.backend
+                )
+            except BrokenProcessPool:
+                # 子进程被杀死等情况下进程池不可再用：重建进程池，本次在事件循环中解析
+                logger.error("解析进程池已损坏，将重建进程池，本次在事件循环中解析。", exc_info=True)
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+                self.fallback_count += 1
+                records, parse_ms = hot_parser.parse_compact(html, self.backend)
+
+        self.parse_count += 1
+        self.parse_ms += parse_ms
+        self.wall_ms += (time.perf_counter() - start) * 1000
+        return hot_parser.expand_records(records)
+
+    def stats(self):
+        """返回累计解析次数和平均耗时；wall 与 parse 的差值即为调度与序列化开销。"""
+        count = self.parse_count
+        return {
+            'mode': self.mode,
+            'parses': count,
+            'avg_parse_ms': self.parse_ms / count if count else 0.0,
+            'avg_wall_ms': self.wall_ms / count if count else 0.0,
+            'fallbacks': self.fallback_count,
+        }
+
+    def shutdown(self):
+        """关闭工作池并输出统计信息。"""
+        if self._pool is not None:
+            stats = self.stats()
+            logger.info(
+                f"正在关闭解析执行器。共解析 {stats['parses']} 次，平均解析 {stats['avg_parse_ms']:.1f}ms，"
+                f"平均总耗时 {stats['avg_wall_ms']:.1f}ms。"
+            )
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
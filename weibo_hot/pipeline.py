@@ -0,0 +1,317 @@
+"""
+进程内分析流水线模块
+爬虫和分析器在同一个事件循环中运行时，用异步队列直接把新上榜的话题交给分析协程，
+分析结果写库后再通知爬虫，不再通过轮询数据库来协调
+
+- 数据库只负责持久化：变更仍写入 hot_changes，分析结果仍由批量写入器更新
+- 启动时把数据库中遗留的未处理变更放入队列，保证重启前未完成的分析不会丢失
+- 分析失败的话题按重试策略（见 retry_policy）在到期后重新入队，新话题总是优先于重试的话题
+- 同一优先级内按排名分析；预计赶不上爬虫发布截止时间的靠后话题推迟分析（见 analysis_scheduler）
+- 统计排队等待时间以及从入队到结果落库的端到端延迟
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime
+from dataclasses import dataclass, field
+
+import analysis
+import database as db
+from analysis_writer import AnalysisBatchWriter
+from logger import setup_module_logger
+from streaming import partial_analyses
+
+# 创建日志记录器 - 用于记录流水线模块的日志信息
+logger = setup_module_logger('pipeline')
+
+# 队列中的优先级：新话题、被推迟到发布截止时间之后的话题、等待重试的话题
+TIER_FRESH, TIER_DEFERRED, TIER_RETRY = 0, 1, 2
+
+
+class PipelineBatch:
+    """一次提交的一组分析任务，全部完成（写库成功或失败）后 wait() 返回。"""
+
+    def __init__(self, count):
+        self.remaining = count
+        self._done = asyncio.Event()
+        if count == 0:
+            self._done.set()
+
+    def _complete(self):
+        self.remaining -= 1
+        if self.remaining <= 0:
+            self._done.set()
+
+    async def wait(self):
+        await self._done.wait()
+
+
+@dataclass
+class AnalysisJob:
+    """队列中的一条待分析话题，字段与写入器需要的变更记录属性一致。"""
+    id: int
+    board: str
+    title: str
+    rank_num: int
+    hot_value: int
+    attempt_count: int = 0
+    batch: PipelineBatch = field(default=None, repr=False)
+    deadline: float = None  # 爬虫发布最终表的截止时间（time.monotonic()）
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class AnalysisPipeline:
+    """
+    爬虫与分析器之间的进程内队列。
+
+    爬虫同步完一个榜单后调用 submit() 提交新话题，workers 个分析协程立即开始分析，
+    结果交给 AnalysisBatchWriter 合并写库；写入完成后对应的 PipelineBatch 计数减一。
+    分析失败的话题不会阻塞 PipelineBatch：失败记录写库后即算完成，到重试时间后以较低优先级重新入队。
+    预计在截止时间之前完成不了的靠后话题同样先算作完成，以较低优先级重新入队，爬虫不必等待它们。
+    """
+
+    def __init__(self, workers=10, writer=None, scheduler=None, session=None):
+        self.workers = max(1, workers)
+        self.writer = writer or AnalysisBatchWriter()
+        self.scheduler = scheduler or analysis.rank_scheduler
+        # (优先级, 排名, 序号, 任务)：同优先级按排名，再按入队顺序
+        self._queue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._retries = []  # 等待重试的任务堆：(重试时间戳, 序号, 任务)
+        self._retry_wakeup = asyncio.Event()
+        self._tasks = []
+        # 分析接口的会话：由 main.py 传入时与其他分析模式共享，否则在 start() 中创建并由 aclose() 关闭
+        self.session = session
+        self._owns_session = session is None
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.dead = 0
+        self.picked = 0
+        self.total_queue_ms = 0.0
+        self.max_queue_ms = 0.0
+        self.total_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    @classmethod
+    def from_env(cls, max_workers, session=None):
+        """根据环境变量创建流水线，分析结果的批量写入参数见 AnalysisBatchWriter.from_env。"""
+        return cls(workers=max_workers, writer=AnalysisBatchWriter.from_env(), session=session)
+
+    async def start(self):
+        """启动写入器和分析协程，并把数据库中遗留的未处理变更放入队列。"""
+        if self._tasks:
+            return
+        self.writer.start()
+        if self.session is None:
+            self.session = analysis.create_analysis_session()
+        backlog = await db.get_unanalyzed_topics(due_only=False)
+        if backlog:
+            now = datetime.now()
+            due = [c for c in backlog if c.next_retry_at is None or c.next_retry_at <= now]
+            for c in backlog:
+                if c.next_retry_at is not None and c.next_retry_at > now:
+                    self._schedule_retry(self._job(c), c.next_retry_at)
+            logger.info(
+                f"数据库中有 {len(backlog)} 条遗留的未分析话题，{len(due)} 条已放入分析队列，"
+                f"{len(backlog) - len(due)} 条等待重试时间。"
+            )
+            for c in due:
+                self._put(self._job(c))
+            self.submitted += len(due)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._retry_loop()))
+        logger.info(f"分析流水线已启动，分析协程数: {self.workers}")
+
+    def submit(self, changes, deadline=None):
+        """
+        提交一组已写入变更表的新话题。
+
+        参数:
+            changes (list): 带变更ID的行数据（db.apply_snapshot_diff 的返回值）。
+            deadline (float): 爬虫发布最终表的截止时间（time.monotonic()），为None表示不限。
+
+        返回值:
+            PipelineBatch: 这组话题全部处理完成后 wait() 返回。
+        """
+        missing = [row['title'] for row in changes if row.get('id') is None]
+        if missing:
+            # 没有变更ID的话题无法写回分析结果，仍留在变更表中，由下次启动时的遗留变更加载分析
+            logger.warning(f"{len(missing)} 条新话题没有回查到变更ID，未放入分析队列: {missing[:5]}")
+        changes = [row for row in changes if row.get('id') is not None]
+        batch = PipelineBatch(len(changes))
+        for row in changes:
+            self._put(AnalysisJob(
+                id=row['id'], board=row['board'], title=row['title'],
+                rank_num=row['rank_num'], hot_value=row['hot_value'], batch=batch, deadline=deadline,
+            ))
+        self.submitted += len(changes)
+        return batch
+
+    @staticmethod
+    def _job(change):
+        return AnalysisJob(
+            id=change.id, board=change.board, title=change.title, rank_num=change.rank_num,
+            hot_value=change.hot_value, attempt_count=change.attempt_count or 0,
+        )
+
+    def _put(self, job, tier=None):
+        if tier is None:
+            tier = TIER_RETRY if job.attempt_count else TIER_FRESH
+        self._queue.put_nowait((tier, self.scheduler.priority(job.rank_num), next(self._seq), job))
+
+    def _defer(self, job):
+        """
+        推迟预计赶不上截止时间的任务：对爬虫来说算作已完成，任务去掉截止时间后以较低优先级重新入队，
+        排在所有新话题之后（没有其他任务时仍会立即分析）。返回是否推迟。
+        """
+        if not self.scheduler.should_defer(job.rank_num, job.deadline, time.monotonic()):
+            return False
+        self.scheduler.deferred += 1
+        logger.info(f"[{job.board}] 排名 {job.rank_num} 的话题预计赶不上本轮发布，推迟分析: {job.title}")
+        if job.batch is not None:
+            job.batch._complete()
+        job.batch = None
+        job.deadline = None
+        self._put(job, TIER_DEFERRED)
+        return True
+
+    def _schedule_retry(self, job, retry_at):
+        heapq.heappush(self._retries, (retry_at.timestamp(), next(self._seq), job))
+        self._retry_wakeup.set()
+
+    async def _retry_loop(self):
+        """到重试时间后把任务放回分析队列。"""
+        while True:
+            delay = self._retries[0][0] - time.time() if self._retries else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._retry_wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._retry_wakeup.clear()
+                continue
+            _, _, job = heapq.heappop(self._retries)
+            job.enqueued_at = time.monotonic()
+            self.retried += 1
+            self._put(job)
+
+    async def _worker(self, index):
+        while True:
+            job = (await self._queue.get())[-1]
+            if self._defer(job):
+                self._queue.task_done()
+                continue
+            # ANALYSIS_BATCH_SIZE 大于1时把队列中已有的话题一起取出，合并成一个请求
+            jobs = [job]
+            while len(jobs) < analysis.BATCH_SIZE and not self._queue.empty():
+                extra = self._queue.get_nowait()[-1]
+                if self._defer(extra):
+                    self._queue.task_done()
+                else:
+                    jobs.append(extra)
+            pending = list(jobs)
+            try:
+                now = time.monotonic()
+                for job in jobs:
+                    queue_ms = (now - job.enqueued_at) * 1000
+                    self.picked += 1
+                    self.total_queue_ms += queue_ms
+                    self.max_queue_ms = max(self.max_queue_ms, queue_ms)
+                    logger.info(f"分析协程 {index} 开始分析 [{job.board}] 排名 {job.rank_num} 的话题: {job.title}")
+                started = time.monotonic()
+                try:
+                    results = await analysis.analyze_changes(jobs, self.session)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"分析 {len(jobs)} 个话题时发生异常: {e}", exc_info=True)
+                    results = [e] * len(jobs)
+                finished = time.monotonic()
+                for job, result in zip(jobs, results):
+                    self.scheduler.observe(job.rank_num, finished - started)
+                    if not isinstance(result, BaseException):
+                        self.scheduler.record_latency(job.rank_num, (finished - job.enqueued_at) * 1000)
+                    if isinstance(result, BaseException):
+                        if not isinstance(result, analysis.AnalysisError):
+                            logger.error(f"分析话题 {job.title} 时发生异常: {result}", exc_info=result)
+                        written = await self._fail(job, result)
+                        written.add_done_callback(lambda future, job=job: self._finish(job, False))
+                    else:
+                        written = await self.writer.add(job, result)
+                        written.add_done_callback(lambda future, job=job: self._finish(job, future.result()))
+                    pending.remove(job)
+            except asyncio.CancelledError:
+                for job in pending:
+                    self._finish(job, False)
+                raise
+            except Exception as e:
+                # 变更保持未处理状态，下次启动时会重新放入队列
+                logger.error(f"处理话题 {job.title} 时发生异常: {e}", exc_info=True)
+                for job in pending:
+                    self._finish(job, False)
+            finally:
+                for _ in jobs:
+                    self._queue.task_done()
+
+    async def _fail(self, job, error):
+        """记录一次分析失败；未转为死信时在重试时间到达后重新入队。"""
+        written, retry_at = await analysis.record_failure(self.writer, job, error)
+        if retry_at is None:
+            self.dead += 1
+        else:
+            self._schedule_retry(
+                AnalysisJob(id=job.id, board=job.board, title=job.title, rank_num=job.rank_num,
+                            hot_value=job.hot_value, attempt_count=job.attempt_count + 1),
+                retry_at,
+            )
+        return written
+
+    def _finish(self, job, written):
+        if written:
+            self.completed += 1
+            latency_ms = (time.monotonic() - job.enqueued_at) * 1000
+            self.total_latency_ms += latency_ms
+            self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        else:
+            self.failed += 1
+        if job.batch is not None:
+            job.batch._complete()
+
+    def stats(self):
+        """返回提交/完成数量、重试积压、排队等待时间、入队到落库的延迟、各排名区间的分析延迟、分析接口用量、限流器状态和连接复用情况。"""
+        return {
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'queued': self._queue.qsize(),
+            'retry_waiting': len(self._retries),
+            'retried': self.retried,
+            'dead': self.dead,
+            'avg_queue_ms': round(self.total_queue_ms / self.picked, 1) if self.picked else 0.0,
+            'max_queue_ms': round(self.max_queue_ms, 1),
+            'avg_latency_ms': round(self.total_latency_ms / self.completed, 1) if self.completed else 0.0,
+            'max_latency_ms': round(self.max_latency_ms, 1),
+            'scheduling': self.scheduler.metrics(),
+            'usage': dict(analysis.usage_stats),
+            'streaming': partial_analyses.metrics(),
+            'limiter': analysis.limiter.metrics(),
+            'http': self.session.stats() if self.session is not None else {},
+        }
+
+    async def aclose(self):
+        """停止分析协程，写入已完成的分析结果；会话由流水线自己创建时一并关闭。"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.writer.aclose()
+        # 写入完成的回调通过 call_soon 调度，让出一次事件循环使统计包含最后一批结果
+        await asyncio.sleep(0)
+        logger.info(f"分析流水线统计: {self.stats()}")
+        if self._owns_session and self.session is not None:
+            await self.session.aclose()
+            self.session = None
@@ -0,0 +1,279 @@
+"""
+分析接口限流模块
+在 DeepSeek 调用之前统一控制请求速率、token用量和并发数：
+
+- 令牌桶：每秒请求数（DEEPSEEK_RPS）和每分钟 token 数（DEEPSEEK_TPM）两个预算，请求前按预估 token 数预留，
+  响应返回后按实际用量退还多预留的部分
+- AIMD 并发控制：请求成功且延迟低于目标时并发上限缓慢增加（每个上限窗口加1），
+  延迟超过目标时小幅下降，收到 429/5xx 或请求超时时成倍下降
+- 收到 429 时遵守 Retry-After，在该时间之前所有请求暂停发出
+- 统计当前并发上限、在途请求数、限流和服务端错误次数以及排队等待时间
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from logger import setup_module_logger
+from env_config import env_float, env_int
+
+# 创建日志记录器 - 用于记录限流模块的日志信息
+logger = setup_module_logger('rate_limiter')
+
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒的速度补充，最多积累 capacity 个。"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount=1):
+        """取出 amount 个令牌，不足时等待补充；超过桶容量的请求按容量计算，避免永远等不到。"""
+        amount = min(amount, self.capacity)
+        # 按到达顺序排队，避免大请求一直被小请求插队
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def refund(self, amount):
+        """退还多预留的令牌（amount 为负数时补扣）。"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 头（秒数或HTTP日期），返回需要等待的秒数；无法解析时返回None。"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+# 请求过程中抛出时视为服务端过载的异常：httpx 的传输、超时和状态码异常
+_OVERLOAD_ERRORS = (httpx.HTTPError, asyncio.TimeoutError)
+
+
+class _Permit:
+    """一次请求的许可，请求结束后通过 observe() 把结果反馈给限流器。"""
+
+    def __init__(self, limiter, reserved_tokens):
+        self.limiter = limiter
+        self.reserved_tokens = reserved_tokens
+        self.started = None
+        self.observed = False
+
+    async def __aenter__(self):
+        await self.limiter._acquire(self.reserved_tokens)
+        self.started = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None and not self.observed and issubclass(exc_type, _OVERLOAD_ERRORS):
+            # 超时、连接失败等传输层异常与服务端过载一样需要降低并发；
+            # 解析失败、取消等其他异常与服务端负载无关，只释放许可，不调整并发
+            self.limiter._on_failure(f"请求异常: {exc_type.__name__}")
+        await self.limiter._release()
+
+    def observe(self, response, used_tokens=None):
+        """
+        根据响应的状态码、延迟和 token 用量调整限流器。
+
+        流式响应在读完之后调用，并通过 used_tokens 传入最后一个数据块中的用量；
+        否则从响应体的 usage 字段读取。
+        """
+        self.observed = True
+        latency = time.monotonic() - self.started
+        status = response.status_code
+        if status == 429:
+            self.limiter._on_throttle(parse_retry_after(response.headers.get('Retry-After')))
+        elif status >= 500:
+            self.limiter._on_failure(f"服务端错误 {status}")
+        elif status < 400:
+            used = used_tokens
+            if used is None:
+                try:
+                    used = response.json().get('usage', {}).get('total_tokens')
+                except (ValueError, AttributeError, RuntimeError):
+                    # 流式响应没有可读取的响应体（httpx.ResponseNotRead 是 RuntimeError 的子类）
+                    pass
+            self.limiter._on_success(latency, self.reserved_tokens, used)
+
+
+class AdaptiveLimiter:
+    """
+    速率预算加 AIMD 并发控制的限流器。
+
+    用法:
+        async with limiter.permit(estimated_tokens) as permit:
+            response = await client.post(...)
+            permit.observe(response)
+    """
+
+    def __init__(self, max_concurrency=10, min_concurrency=1, initial_concurrency=None,
+                 requests_per_second=5.0, tokens_per_minute=0, latency_target=20.0,
+                 decrease_factor=0.5, default_retry_after=5.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        initial = initial_concurrency or max(self.min_concurrency, self.max_concurrency // 2)
+        self.limit = float(min(self.max_concurrency, max(self.min_concurrency, initial)))
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.default_retry_after = default_retry_after
+        self._requests = TokenBucket(requests_per_second, max(1.0, requests_per_second)) if requests_per_second > 0 else None
+        # token 预算允许积累10秒的用量作为突发
+        self._tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute / 6) if tokens_per_minute > 0 else None
+        self._condition = asyncio.Condition()
+        self._paused_until = 0.0
+        self.in_flight = 0
+
+        self.requests = 0
+        self.successes = 0
+        self.throttles = 0
+        self.failures = 0
+        self.total_latency = 0.0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.min_limit_seen = self.limit
+        self.max_limit_seen = self.limit
+
+    @classmethod
+    def from_env(cls, max_concurrency=None):
+        """
+        根据环境变量创建限流器。
+
+        MAX_ANALYSIS_WORKERS: 并发上限的最大值（未指定 max_concurrency 时）
+        ANALYSIS_MIN_CONCURRENCY: 并发上限的最小值
+        DEEPSEEK_RPS: 每秒请求数预算，0 表示不限制
+        DEEPSEEK_TPM: 每分钟 token 预算，0 表示不限制
+        ANALYSIS_LATENCY_TARGET: 目标延迟（秒），超过时降低并发
+        ANALYSIS_RETRY_AFTER_DEFAULT: 429 响应没有 Retry-After 时暂停的秒数
+        """
+        return cls(
+            max_concurrency=max_concurrency or env_int('MAX_ANALYSIS_WORKERS', 10),
+            min_concurrency=env_int('ANALYSIS_MIN_CONCURRENCY', 1),
+            requests_per_second=env_float('DEEPSEEK_RPS', 5),
+            tokens_per_minute=env_int('DEEPSEEK_TPM', 0),
+            latency_target=env_float('ANALYSIS_LATENCY_TARGET', 20),
+            default_retry_after=env_float('ANALYSIS_RETRY_AFTER_DEFAULT', 5),
+        )
+
+    def permit(self, estimated_tokens=0):
+        """返回一次请求的许可（异步上下文管理器），进入时按并发上限、暂停时间和速率预算等待。"""
+        return _Permit(self, estimated_tokens)
+
+    def cap(self, max_concurrency):
+        """调整并发上限的最大值（例如调用方的工作协程数变化时）。"""
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = min(self.limit, self.max_concurrency)
+
+    async def _acquire(self, reserved_tokens):
+        start = time.monotonic()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            await self._wait_paused()
+            if self._requests is not None:
+                await self._requests.acquire(1)
+            if self._tokens is not None and reserved_tokens:
+                await self._tokens.acquire(reserved_tokens)
+            # 等待预算期间可能收到了新的 429
+            await self._wait_paused()
+        except BaseException:
+            await self._release()
+            raise
+        self.requests += 1
+        wait_ms = (time.monotonic() - start) * 1000
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    async def _release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    async def _wait_paused(self):
+        while True:
+            remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+
+    def _set_limit(self, limit):
+        old = int(self.limit)
+        self.limit = min(float(self.max_concurrency), max(float(self.min_concurrency), limit))
+        self.min_limit_seen = min(self.min_limit_seen, self.limit)
+        self.max_limit_seen = max(self.max_limit_seen, self.limit)
+        if int(self.limit) != old:
+            logger.info(f"分析接口并发上限调整: {old} -> {int(self.limit)}")
+            # 上限提高时唤醒等待者（由事件循环调度，不在这里等待锁）
+            asyncio.ensure_future(self._notify())
+
+    async def _notify(self):
+        async with self._condition:
+            self._condition.notify_all()
+
+    def _on_success(self, latency, reserved_tokens, used_tokens):
+        self.successes += 1
+        self.total_latency += latency
+        if self._tokens is not None and used_tokens is not None:
+            self._tokens.refund(reserved_tokens - used_tokens)
+        if latency > self.latency_target:
+            self._set_limit(self.limit * 0.9)
+        else:
+            # 加性增加：每个上限窗口的请求都成功时上限加1
+            self._set_limit(self.limit + 1 / self.limit)
+
+    def _on_throttle(self, retry_after):
+        self.throttles += 1
+        delay = self.default_retry_after if retry_after is None else retry_after
+        now = time.monotonic()
+        # 同一暂停窗口内的多个 429 来自同一次过载，只降低一次并发
+        if now >= self._paused_until:
+            self._set_limit(self.limit * self.decrease_factor)
+        self._paused_until = max(self._paused_until, now + delay)
+        logger.warning(
+            f"分析接口返回 429，暂停 {delay:.1f} 秒后再发送请求，当前并发上限 {int(self.limit)}（累计限流 {self.throttles} 次）。"
+        )
+
+    def _on_failure(self, reason):
+        self.failures += 1
+        self._set_limit(self.limit * self.decrease_factor)
+        logger.warning(f"分析接口{reason}，并发上限降至 {int(self.limit)}。")
+
+    def metrics(self):
+        """返回当前并发上限、在途请求数、限流/失败次数、平均延迟和排队等待时间。"""
+        return {
+            'limit': int(self.limit),
+            'limit_range': [int(self.min_limit_seen), int(self.max_limit_seen)],
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'throttles': self.throttles,
+            'failures': self.failures,
+            'paused_s': round(max(0.0, self._paused_until - time.monotonic()), 1),
+            'avg_latency_s': round(self.total_latency / self.successes, 2) if self.successes else 0.0,
+            'avg_wait_ms': round(self.total_wait_ms / self.requests, 1) if self.requests else 0.0,
+            'max_wait_ms': round(self.max_wait_ms, 1),
+        }
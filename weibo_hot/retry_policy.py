@@ -0,0 +1,57 @@
+"""
+分析重试策略模块
+分析失败的变更保留在 hot_changes 中，按指数退避加随机抖动安排下一次重试，
+超过最大尝试次数后标记为死信（is_dead），不再重试也不再写入错误信息作为分析内容
+"""
+import random
+from datetime import datetime, timedelta
+
+from env_config import env_float, env_int
+
+
+class RetryPolicy:
+    """
+    指数退避重试策略。
+
+    第 n 次失败后等待 base_delay * 2^(n-1) 秒（不超过 max_delay），再在 [一半, 全部] 之间随机抖动，
+    避免同一时刻失败的一批话题在同一时刻重试。
+    """
+
+    def __init__(self, max_attempts=5, base_delay=30.0, max_delay=3600.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建重试策略。
+
+        ANALYSIS_MAX_ATTEMPTS: 最多尝试分析的次数，之后标记为死信
+        ANALYSIS_RETRY_BASE_DELAY: 第一次重试前等待的秒数
+        ANALYSIS_RETRY_MAX_DELAY: 重试间隔的上限（秒）
+        """
+        return cls(
+            max_attempts=env_int('ANALYSIS_MAX_ATTEMPTS', 5),
+            base_delay=env_float('ANALYSIS_RETRY_BASE_DELAY', 30),
+            max_delay=env_float('ANALYSIS_RETRY_MAX_DELAY', 3600),
+        )
+
+    def delay(self, attempts):
+        """第 attempts 次失败后到下一次重试的等待秒数（含抖动）。"""
+        delay = min(self.max_delay, self.base_delay * 2 ** max(0, attempts - 1))
+        return random.uniform(delay / 2, delay)
+
+    def on_failure(self, attempts):
+        """
+        计算一次失败后的状态。
+
+        参数:
+            attempts (int): 包括本次在内已经尝试的次数。
+
+        返回值:
+            tuple: (是否转为死信, 下一次重试时间；死信时为None)
+        """
+        if attempts >= self.max_attempts:
+            return True, None
+        return False, datetime.now() + timedelta(seconds=self.delay(attempts))
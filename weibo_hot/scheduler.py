@@ -0,0 +1,125 @@
+import random
+import time
+from logger import setup_module_logger
+from env_config import env_float
+
+# 创建日志记录器 - 用于记录调度模块的日志信息
+logger = setup_module_logger('scheduler')
+
+
+class AdaptiveScheduler:
+    """
+    根据榜单变化程度自适应调整爬取间隔的调度器。
+
+    - 榜单变化剧烈时缩短间隔，平稳时逐步放宽，始终限制在 [min_interval, max_interval] 内
+    - 每次等待叠加随机抖动，避免固定节奏请求
+    - 连续失败时按指数退避，退避时间有上限
+    - 为"爬取 + 等待分析"分配时间预算，保证不会占用下一个周期的时间
+    """
+
+    def __init__(self, min_interval=20.0, max_interval=60.0, initial_interval=60.0,
+                 churn_saturation=0.2, smoothing=0.3, jitter=0.1,
+                 failure_base_delay=30.0, max_failure_delay=600.0,
+                 analysis_wait_timeout=45.0, publish_reserve=3.0):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.interval = min(max(initial_interval, self.min_interval), self.max_interval)
+        self.churn_saturation = churn_saturation
+        self.smoothing = smoothing
+        self.jitter = jitter
+        self.failure_base_delay = failure_base_delay
+        self.max_failure_delay = max_failure_delay
+        self.analysis_wait_timeout = analysis_wait_timeout
+        self.publish_reserve = publish_reserve
+
+        self.churn_rate = None  # 榜单变化率的指数移动平均
+        self.last_churn = 0.0
+        self.consecutive_failures = 0
+        self.cycle_start = time.monotonic()
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建调度器。
+
+        CRAWL_MIN_INTERVAL / CRAWL_MAX_INTERVAL / CRAWL_INITIAL_INTERVAL: 间隔范围与初始值（秒）
+        CRAWL_CHURN_SATURATION: 变化率达到该值时使用最短间隔
+        CRAWL_JITTER: 抖动比例
+        CRAWL_FAILURE_DELAY / CRAWL_MAX_FAILURE_DELAY: 失败退避的基数与上限（秒）
+        ANALYSIS_WAIT_TIMEOUT: 每轮等待分析完成的最长时间（秒）
+        """
+        return cls(
+            min_interval=env_float('CRAWL_MIN_INTERVAL', 20),
+            max_interval=env_float('CRAWL_MAX_INTERVAL', 60),
+            initial_interval=env_float('CRAWL_INITIAL_INTERVAL', 60),
+            churn_saturation=env_float('CRAWL_CHURN_SATURATION', 0.2),
+            jitter=env_float('CRAWL_JITTER', 0.1),
+            failure_base_delay=env_float('CRAWL_FAILURE_DELAY', 30),
+            max_failure_delay=env_float('CRAWL_MAX_FAILURE_DELAY', 600),
+            analysis_wait_timeout=env_float('ANALYSIS_WAIT_TIMEOUT', 45),
+        )
+
+    def start_cycle(self):
+        """标记一个新周期的开始时间，作为时间预算的起点。"""
+        self.cycle_start = time.monotonic()
+
+    def record_cycle(self, changed_count, board_size):
+        """
+        记录一次成功周期的榜单变化情况，并据此调整下一次的间隔。
+
+        参数:
+            changed_count (int): 上榜、掉榜和排名变化的话题数。
+            board_size (int): 榜单长度。
+        """
+        self.consecutive_failures = 0
+        self.last_churn = changed_count / board_size if board_size else 0.0
+        if self.churn_rate is None:
+            self.churn_rate = self.last_churn
+        else:
+            self.churn_rate += self.smoothing * (self.last_churn - self.churn_rate)
+
+        # 变化率越高，间隔越接近最短间隔；变化率为0时接近最长间隔
+        pressure = min(1.0, self.churn_rate / self.churn_saturation) if self.churn_saturation > 0 else 1.0
+        target = self.max_interval - (self.max_interval - self.min_interval) * pressure
+        # 缩短立即生效，放宽则逐步进行，避免一次平稳周期就大幅拉长间隔
+        if target < self.interval:
+            self.interval = target
+        else:
+            self.interval += self.smoothing * (target - self.interval)
+
+    def record_failure(self):
+        """记录一次失败，返回退避等待的秒数。"""
+        self.consecutive_failures += 1
+        exponent = min(self.consecutive_failures - 1, 10)
+        delay = min(self.max_failure_delay, self.failure_base_delay * (2 ** exponent))
+        return self._with_jitter(delay)
+
+    def analysis_wait_budget(self):
+        """
+        本周期还可以用于等待分析完成的秒数。
+
+        不超过 analysis_wait_timeout，并为发布最终表预留 publish_reserve 秒，
+        保证整个周期不会超出下一次爬取的时间点。
+        """
+        elapsed = time.monotonic() - self.cycle_start
+        remaining = self.interval - elapsed - self.publish_reserve
+        return max(0.0, min(self.analysis_wait_timeout, remaining))
+
+    def next_delay(self):
+        """距离下一个周期开始还需要等待的秒数（含抖动）。"""
+        elapsed = time.monotonic() - self.cycle_start
+        return max(0.0, self._with_jitter(self.interval) - elapsed)
+
+    def _with_jitter(self, delay):
+        if self.jitter <= 0:
+            return delay
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def metrics(self):
+        """返回当前间隔与近期榜单变化率等指标。"""
+        return {
+            'interval': round(self.interval, 1),
+            'churn_rate': round(self.churn_rate or 0.0, 3),
+            'last_churn': round(self.last_churn, 3),
+            'consecutive_failures': self.consecutive_failures,
+        }
@@ -0,0 +1,120 @@
+"""
+热搜快照差异引擎
+比较相邻两次热搜快照，生成类型化的变更事件
+
+事件类型：
+1. entered     - 新上榜话题
+2. exited      - 掉出榜单的话题
+3. rank_moved  - 排名变化
+4. hot_changed - 热度变化
+"""
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+ENTERED = 'entered'
+EXITED = 'exited'
+RANK_MOVED = 'rank_moved'
+HOT_CHANGED = 'hot_changed'
+
+
+@dataclass(frozen=True)
+class SnapshotEvent:
+    """单个话题在两次快照之间的一项变化。"""
+    kind: str
+    title: str
+    rank_num: Optional[int] = None
+    old_rank_num: Optional[int] = None
+    hot_value: Optional[int] = None
+    old_hot_value: Optional[int] = None
+
+
+def build_snapshot(all_news, fetch_time, board):
+    """
+    将解析结果转换为按排名排列的快照行。
+
+    参数:
+        all_news (dict): {标题: {'热度': ..., '标签': ..., '链接': ...}}，按排名顺序。
+        fetch_time (datetime): 本次抓取时间。
+        board (str): 榜单标识。
+
+    返回值:
+        list: 每项为 hot_top50 表的一行数据（不含分析字段）。
+    """
+    return [
+        {
+            'board': board,
+            'rank_num': i,
+            'title': title,
+            'hot_value': info['热度'],
+            'hot_label': info['标签'],
+            'link': info['链接'],
+            'fetch_time': fetch_time,
+        }
+        for i, (title, info) in enumerate(all_news.items(), 1)
+    ]
+
+
+def diff_snapshots(old_snapshot, new_rows):
+    """
+    比较旧快照和新快照，生成变更事件列表。
+
+    参数:
+        old_snapshot (dict): {标题: {'rank_num', 'hot_value', 'link', ...}}，上一次的快照。
+        new_rows (list): build_snapshot 生成的新快照行。
+
+    返回值:
+        list[SnapshotEvent]: 按新排名顺序排列的事件，掉榜事件排在最后。
+    """
+    events = []
+    new_titles = set()
+    for row in new_rows:
+        title = row['title']
+        new_titles.add(title)
+        old = old_snapshot.get(title)
+        if old is None:
+            events.append(SnapshotEvent(ENTERED, title, rank_num=row['rank_num'], hot_value=row['hot_value']))
+            continue
+        if old['rank_num'] != row['rank_num']:
+            events.append(SnapshotEvent(RANK_MOVED, title, rank_num=row['rank_num'], old_rank_num=old['rank_num']))
+        # 标签变化（如"综艺"标签出现或消失）同样视为热度变化
+        if old['hot_value'] != row['hot_value'] or old.get('hot_label') != row['hot_label']:
+            events.append(SnapshotEvent(HOT_CHANGED, title, hot_value=row['hot_value'], old_hot_value=old['hot_value']))
+
+    for title, old in old_snapshot.items():
+        if title not in new_titles:
+            events.append(SnapshotEvent(EXITED, title, old_rank_num=old['rank_num'], old_hot_value=old['hot_value']))
+    return events
+
+
+def plan_writes(events, new_rows):
+    """
+    将事件转换为数据库写入计划。
+
+    返回值:
+        tuple: (待插入的行, 待更新的行, 待删除的标题列表)。
+        同一话题同时发生排名和热度变化时只产生一次更新。
+    """
+    rows_by_title = {row['title']: row for row in new_rows}
+    inserts, updates, deletes = [], [], []
+    updated_titles = set()
+    for event in events:
+        if event.kind == ENTERED:
+            inserts.append(rows_by_title[event.title])
+        elif event.kind == EXITED:
+            deletes.append(event.title)
+        elif event.title not in updated_titles:
+            updated_titles.add(event.title)
+            updates.append(rows_by_title[event.title])
+    return inserts, updates, deletes
+
+
+def snapshot_from_rows(rows):
+    """将快照行转换为以标题为键的字典，作为下一次比较的旧快照。"""
+    return {row['title']: row for row in rows}
+
+
+def summarize(events):
+    """统计各类型事件的数量，用于日志输出。"""
+    counts = Counter(event.kind for event in events)
+    return {kind: counts.get(kind, 0) for kind in (ENTERED, EXITED, RANK_MOVED, HOT_CHANGED)}
@@ -0,0 +1,185 @@
+"""
+流式分析模块
+ANALYSIS_STREAM 开启时，单话题分析请求以 SSE 流式返回，边生成边记录已收到的内容：
+
+- 统计首个 token 的到达时间（TTFT）和完整生成时间
+- 爬虫等待分析超时、即将发布最终表时，可以把仍在生成中的分析截断后先写入主表（analysis_time 保持为空），
+  最终表不再显示空白的 AI 总结；完整分析写库时覆盖截断内容，该榜单在下一个周期重新发布
+- 截断发布的话题随后分析失败时，主表中的截断内容在记录失败时清除，爬虫在下一个周期重新发布该榜单
+- 只有与爬虫运行在同一进程中的分析（默认持续模式或 --pipeline）才能提前发布
+"""
+import json
+import time
+from collections import deque
+
+import database as db
+from analysis_scheduler import percentiles
+from logger import setup_module_logger
+from env_config import env_bool, env_int
+
+# 创建日志记录器 - 用于记录流式分析模块的日志信息
+logger = setup_module_logger('streaming')
+
+# 截断发布的分析末尾追加的标记
+PARTIAL_SUFFIX = '…'
+
+
+async def read_sse(response, on_delta):
+    """
+    读取对话补全接口的 SSE 响应。
+
+    参数:
+        response (httpx.Response): 以 stream 方式发出的请求的响应。
+        on_delta (callable): 每收到一段内容时调用，参数为该段文本。
+
+    返回值:
+        tuple: (完整内容, 用量字典；接口没有返回用量时为空字典)
+
+    异常:
+        ValueError: 数据行不是合法的JSON。
+    """
+    parts = []
+    usage = {}
+    async for line in response.aiter_lines():
+        if not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            break
+        chunk = json.loads(data)
+        if chunk.get('usage'):
+            usage = chunk['usage']
+        for choice in chunk.get('choices') or []:
+            delta = (choice.get('delta') or {}).get('content')
+            if delta:
+                parts.append(delta)
+                on_delta(delta)
+    return ''.join(parts), usage
+
+
+class StreamProgress:
+    """一次流式请求的进度，由 PartialAnalyses.track() 创建。"""
+
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+        self.started = time.monotonic()
+        self.first_token_at = None
+        self.parts = []
+
+    def append(self, delta):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+            self.registry._record_ttft((self.first_token_at - self.started) * 1000)
+        self.parts.append(delta)
+
+    def text(self):
+        return ''.join(self.parts).strip()
+
+    def __enter__(self):
+        if self.key is not None:
+            self.registry._active[self.key] = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.key is not None and self.registry._active.get(self.key) is self:
+            del self.registry._active[self.key]
+        if exc_type is None:
+            self.registry._record_total((time.monotonic() - self.started) * 1000)
+
+
+class PartialAnalyses:
+    """
+    进程内正在生成的分析。
+
+    track((榜单, 标题)) 返回的 StreamProgress 在请求期间登记在这里；
+    publish() 把长度达到 min_chars 的部分内容截断写入主表。
+    """
+
+    def __init__(self, publish_enabled=True, min_chars=20, max_samples=1000):
+        self.publish_enabled = publish_enabled
+        self.min_chars = min_chars
+        self._active = {}
+        self._published = set()  # 已截断发布、还没有结果的 (榜单, 标题)
+        self._retracted = set()  # 截断发布后分析失败、需要重新发布最终表的榜单
+        self._ttft_ms = deque(maxlen=max_samples)
+        self._total_ms = deque(maxlen=max_samples)
+        self.streams = 0
+        self.published = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建。
+
+        ANALYSIS_PUBLISH_PARTIAL: 爬虫等待分析超时时是否先发布截断的分析
+        ANALYSIS_PARTIAL_MIN_CHARS: 生成内容至少达到多少字才提前发布
+        """
+        return cls(
+            publish_enabled=env_bool('ANALYSIS_PUBLISH_PARTIAL', True),
+            min_chars=env_int('ANALYSIS_PARTIAL_MIN_CHARS', 20),
+        )
+
+    def track(self, key=None):
+        """返回一次流式请求的进度（上下文管理器）；key 为 (榜单, 标题)，为None时只统计耗时。"""
+        self.streams += 1
+        return StreamProgress(self, key)
+
+    def _record_ttft(self, ms):
+        self._ttft_ms.append(ms)
+
+    def _record_total(self, ms):
+        self._total_ms.append(ms)
+
+    async def publish(self):
+        """
+        把正在生成的分析截断写入主表中还没有完整分析的话题，返回写入的条数。
+        写入失败只记录日志，不影响最终表的发布。
+        """
+        if not self.publish_enabled or not self._active:
+            return 0
+        partials = [
+            {'board': board, 'title': title, 'analysis': progress.text() + PARTIAL_SUFFIX}
+            for (board, title), progress in list(self._active.items())
+            if len(progress.text()) >= self.min_chars
+        ]
+        if not partials:
+            return 0
+        try:
+            written = await db.write_partial_analyses(partials)
+        except Exception as e:
+            logger.error(f"写入截断的分析失败: {e}", exc_info=True)
+            return 0
+        self.published += written
+        self._published.update((item['board'], item['title']) for item in partials)
+        logger.info(f"已先发布 {written} 条仍在生成中的分析（截断），完整分析将在下一个周期发布。")
+        return written
+
+    def settle(self, key, failed):
+        """
+        话题得到分析结果或分析失败时调用；key 为 (榜单, 标题)。
+        截断发布过的话题分析失败时，主表中的截断内容会被清除，记下该榜单等待重新发布。
+        """
+        if key in self._published:
+            self._published.discard(key)
+            if failed:
+                self._retracted.add(key[0])
+
+    def take_retracted(self):
+        """返回并清空截断内容已被撤回、需要重新发布最终表的榜单。"""
+        boards, self._retracted = self._retracted, set()
+        return boards
+
+    def metrics(self):
+        """返回流式请求数、首个 token 到达时间和完整生成时间的分位数（毫秒）以及提前发布的条数。"""
+        return {
+            'streams': self.streams,
+            'in_progress': len(self._active),
+            'ttft_ms': percentiles(self._ttft_ms),
+            'total_ms': percentiles(self._total_ms),
+            'published_partial': self.published,
+        }
+
+
+# 分析协程和爬虫共享的实例
+partial_analyses = PartialAnalyses.from_env()
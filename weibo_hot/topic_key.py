@@ -0,0 +1,30 @@
+"""
+话题标题规范化模块
+同一个话题重新上榜时标题常有细微差别（全角/半角、大小写、空格、#号和标点），
+规范化后再取哈希作为分析缓存的键
+"""
+import hashlib
+import re
+import unicodedata
+
+# 规范化时去掉的字符：空白、话题#号以及常见的中英文标点
+_IGNORED_CHARS = re.compile(r"[\s#＃·•\-_—~～!！?？,，.。:：;；'\"“”‘’()（）\[\]【】《》<>「」『』、/\\|]+")
+
+
+def normalize_title(title):
+    """
+    规范化话题标题：NFKC（全角转半角等）、转小写并去掉空白和标点。
+
+    参数:
+        title (str): 原始标题。
+
+    返回值:
+        str: 规范化后的标题；去掉标点后为空时退回到去掉首尾空白的原标题。
+    """
+    text = unicodedata.normalize('NFKC', title or '').lower()
+    return _IGNORED_CHARS.sub('', text) or text.strip()
+
+
+def title_key(title):
+    """返回规范化标题的 SHA-1 十六进制摘要，作为分析缓存的主键。"""
+    return hashlib.sha1(normalize_title(title).encode('utf-8')).hexdigest()
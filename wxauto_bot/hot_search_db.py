@@ -2,26 +2,51 @@
 微博热搜数据访问模块
 专门用于访问hot_top50_final表的只读操作
 
+hot_top50_final 中可能同时存在同一榜单的多个发布版本，
+所有查询都通过 final_snapshot_pointer 只读取当前版本，因此不会读到正在发布的半成品榜单
+
+支持两种存储后端，与 weibo_hot 的 DB_BACKEND 环境变量保持一致：
+- mysql（默认）：通过 pymysql 连接
+- sqlite：直接读取 weibo_hot 写入的 SQLite 数据库文件（WAL模式下读取不会阻塞写入）
+
 主要功能：
 1. 提供数据库连接
 2. 查询热搜数据
 3. 按排名获取热搜
 4. 检查热搜更新
 """
-import pymysql  # MySQL数据库连接库
 import datetime
+import os
+import sqlite3
+
+# 默认查询的榜单（实时热搜榜），与 weibo_hot 中的榜单标识一致
+# 可选值：realtime / social / entertainment / sport / game
+DEFAULT_BOARD = 'realtime'
+
+# 存储后端：mysql 或 sqlite；sqlite 时读取 SQLITE_PATH 指定的数据库文件
+DB_BACKEND = os.environ.get('DB_BACKEND', 'mysql').lower()
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'weibo_hot.db')
+
+# SQLite 中时间以文本保存，查询结果中需要转换为 datetime 的字段
+DATETIME_FIELDS = ('fetch_time', 'analysis_time', 'update_time', 'last_update')
 
 
 def get_db_connection():
     """
     获取数据库连接
     
-    创建并返回一个到MySQL数据库的连接对象
+    根据 DB_BACKEND 创建并返回一个到MySQL或SQLite数据库的连接对象
     所有数据库操作都通过此连接进行
     
     Returns:
-        pymysql.Connection: MySQL数据库连接对象
+        pymysql.Connection 或 sqlite3.Connection: 数据库连接对象
     """
+    if DB_BACKEND == 'sqlite':
+        conn = sqlite3.connect(SQLITE_PATH)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    import pymysql  # MySQL数据库连接库，只在使用MySQL时需要
     return pymysql.connect(
         host='localhost',  # 数据库服务器地址
         user='root',       # 数据库用户名
@@ -32,7 +57,52 @@ def get_db_connection():
     )
 
 
-def get_top_hot_searches(limit=10):
+
+def _to_dict(row):
+    """把SQLite的查询结果行转换为与pymysql DictCursor相同的字典，时间字段转换为datetime。"""
+    if row is None:
+        return None
+    item = dict(row)
+    for field in DATETIME_FIELDS:
+        if isinstance(item.get(field), str):
+            item[field] = datetime.datetime.fromisoformat(item[field])
+    return item
+
+
+def _query(sql, params, fetch_one=False):
+    """
+    执行只读查询并以字典形式返回结果
+
+    SQL 统一使用 %s 占位符，SQLite 下转换为 ? 占位符，datetime 参数转换为与库中相同格式的文本
+    
+    Args:
+        sql: 查询语句
+        params: 查询参数
+        fetch_one: 是否只返回第一行
+        
+    Returns:
+        list 或 dict: 查询结果
+    """
+    conn = get_db_connection()
+    try:
+        if DB_BACKEND == 'sqlite':
+            params = tuple(str(p) if isinstance(p, datetime.datetime) else p for p in params)
+            cursor = conn.execute(sql.replace('%s', '?'), params)
+            if fetch_one:
+                return _to_dict(cursor.fetchone())
+            return [_to_dict(row) for row in cursor.fetchall()]
+
+        import pymysql
+        # 使用DictCursor，结果会以字典形式返回，而不是元组
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone() if fetch_one else cursor.fetchall()
+    finally:
+        # 确保连接被关闭
+        conn.close()
+
+
+def get_top_hot_searches(limit=10, board=DEFAULT_BOARD):
     """
     获取排名前N的热搜
     
@@ -40,6 +110,7 @@ def get_top_hot_searches(limit=10):
     
     Args:
         limit: 获取的热搜数量，默认10条
+        board: 榜单标识，默认实时热搜榜
         
     Returns:
         list: 热搜列表，每项为包含热搜信息的字典
@@ -47,32 +118,26 @@ def get_top_hot_searches(limit=10):
     字典字段说明：
     - rank_num: 排名
     - title: 标题
-    - hot_value: 热度值
+    - hot_value: 热度值（整数，可能为空）
+    - hot_label: 热搜标签（如"综艺"、"剧集"，可能为空）
     - link: 链接
     - analysis_content: AI分析内容
     - fetch_time: 抓取时间
     - analysis_time: 分析时间
     - update_time: 更新时间
     """
-    conn = get_db_connection()
-    try:
-        # 使用DictCursor，结果会以字典形式返回，而不是元组
-        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-            sql = """
-            SELECT rank_num, title, hot_value, link, 
-                   analysis_content, fetch_time, analysis_time, update_time
-            FROM hot_top50_final
-            WHERE rank_num <= %s
-            ORDER BY rank_num
-            """
-            cursor.execute(sql, (limit,))
-            return cursor.fetchall()
-    finally:
-        # 确保连接被关闭
-        conn.close()
+    sql = """
+    SELECT rank_num, title, hot_value, hot_label, link, 
+           analysis_content, fetch_time, analysis_time, update_time
+    FROM hot_top50_final f
+    JOIN final_snapshot_pointer p ON p.board = f.board AND p.snapshot_id = f.snapshot_id
+    WHERE f.board = %s AND rank_num <= %s
+    ORDER BY rank_num
+    """
+    return _query(sql, (board, limit))
 
 
-def get_all_hot_searches(limit=50):
+def get_all_hot_searches(limit=50, board=DEFAULT_BOARD):
     """
     获取所有热搜（最多50条）
     
@@ -80,27 +145,23 @@ def get_all_hot_searches(limit=50):
     
     Args:
         limit: 获取的热搜数量上限，默认50条
+        board: 榜单标识，默认实时热搜榜
         
     Returns:
         list: 热搜列表，每项为包含热搜信息的字典
     """
-    conn = get_db_connection()
-    try:
-        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-            sql = """
-            SELECT rank_num, title, hot_value, link, 
-                   analysis_content, fetch_time, analysis_time, update_time
-            FROM hot_top50_final
-            WHERE rank_num <= %s
-            ORDER BY rank_num
-            """
-            cursor.execute(sql, (limit,))
-            return cursor.fetchall()
-    finally:
-        conn.close()
+    sql = """
+    SELECT rank_num, title, hot_value, hot_label, link, 
+           analysis_content, fetch_time, analysis_time, update_time
+    FROM hot_top50_final f
+    JOIN final_snapshot_pointer p ON p.board = f.board AND p.snapshot_id = f.snapshot_id
+    WHERE f.board = %s AND rank_num <= %s
+    ORDER BY rank_num
+    """
+    return _query(sql, (board, limit))
 
 
-def get_hot_search_by_rank(rank):
+def get_hot_search_by_rank(rank, board=DEFAULT_BOARD):
     """
     根据排名获取单条热搜
     
@@ -108,31 +169,30 @@ def get_hot_search_by_rank(rank):
     
     Args:
         rank: 热搜排名
+        board: 榜单标识，默认实时热搜榜
         
     Returns:
         dict: 热搜数据，如果不存在则返回None
     """
-    conn = get_db_connection()
-    try:
-        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-            sql = """
-            SELECT rank_num, title, hot_value, link, 
-                   analysis_content, fetch_time, analysis_time, update_time
-            FROM hot_top50_final
-            WHERE rank_num = %s
-            """
-            cursor.execute(sql, (rank,))
-            return cursor.fetchone()  # 返回单条结果或None
-    finally:
-        conn.close()
+    sql = """
+    SELECT rank_num, title, hot_value, hot_label, link, 
+           analysis_content, fetch_time, analysis_time, update_time
+    FROM hot_top50_final f
+    JOIN final_snapshot_pointer p ON p.board = f.board AND p.snapshot_id = f.snapshot_id
+    WHERE f.board = %s AND rank_num = %s
+    """
+    return _query(sql, (board, rank), fetch_one=True)  # 返回单条结果或None
 
 
-def check_hot_search_updates():
+def check_hot_search_updates(board=DEFAULT_BOARD):
     """
     检查热搜是否有更新
     
     通过比较最新更新时间来判断热搜是否有更新
     
+    Args:
+        board: 榜单标识，默认实时热搜榜
+    
     Returns:
         tuple: (是否有更新, 更新的热搜列表)
         
@@ -141,39 +201,34 @@ def check_hot_search_updates():
     2. 检查是否在最近5分钟内有更新
     3. 如有更新，返回更新的热搜列表
     """
-    conn = get_db_connection()
-    try:
-        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-            # 获取最近更新的时间
-            sql = """
-            SELECT MAX(update_time) as last_update
-            FROM hot_top50_final
-            WHERE rank_num <= 10
-            """
-            cursor.execute(sql)
-            result = cursor.fetchone()
-            last_update = result['last_update'] if result and result['last_update'] else None
-            
-            if not last_update:
-                return False, []
-            
-            # 检查是否在最近5分钟内有更新
-            now = datetime.datetime.now()
-            five_minutes_ago = now - datetime.timedelta(minutes=5)
-            
-            if last_update > five_minutes_ago:
-                # 获取最近更新的热搜
-                sql = """
-                SELECT rank_num, title, hot_value, link, 
-                       analysis_content, fetch_time, analysis_time, update_time
-                FROM hot_top50_final
-                WHERE rank_num <= 10 AND update_time >= %s
-                ORDER BY rank_num
-                """
-                cursor.execute(sql, (five_minutes_ago,))
-                updated_hot_searches = cursor.fetchall()
-                return True, updated_hot_searches
-            
-            return False, []
-    finally:
-        conn.close() 
\ No newline at end of file
+    # 获取最近更新的时间
+    sql = """
+    SELECT MAX(update_time) as last_update
+    FROM hot_top50_final f
+    JOIN final_snapshot_pointer p ON p.board = f.board AND p.snapshot_id = f.snapshot_id
+    WHERE f.board = %s AND rank_num <= 10
+    """
+    result = _query(sql, (board,), fetch_one=True)
+    last_update = result['last_update'] if result and result['last_update'] else None
+    
+    if not last_update:
+        return False, []
+    
+    # 检查是否在最近5分钟内有更新
+    now = datetime.datetime.now()
+    five_minutes_ago = now - datetime.timedelta(minutes=5)
+    
+    if last_update > five_minutes_ago:
+        # 获取最近更新的热搜
+        sql = """
+        SELECT rank_num, title, hot_value, hot_label, link, 
+               analysis_content, fetch_time, analysis_time, update_time
+        FROM hot_top50_final f
+        JOIN final_snapshot_pointer p ON p.board = f.board AND p.snapshot_id = f.snapshot_id
+        WHERE f.board = %s AND rank_num <= 10 AND update_time >= %s
+        ORDER BY rank_num
+        """
+        updated_hot_searches = _query(sql, (board, five_minutes_ago))
+        return True, updated_hot_searches
+    
+    return False, [] 
\ No newline at end of file
@@ -11,6 +11,18 @@
 import time
 
 
+def format_hot_value(hot):
+    """
+    格式化热度显示，带标签时显示为"综艺 12345678"
+
+    热度为空（如置顶或广告条目）时只显示标签，两者都没有时显示"-"
+    """
+    value = hot.get('hot_value')
+    label = hot.get('hot_label')
+    parts = [part for part in (label, None if value is None else str(value)) if part]
+    return ' '.join(parts) if parts else '-'
+
+
 def format_top_hot_searches(hot_searches):
     """
     格式化前10热搜，包含完整信息
@@ -46,7 +58,7 @@ def format_top_hot_searches(hot_searches):
     # 遍历每条热搜，添加到结果文本中
     for hot in hot_searches:
         result_text += f"【{hot['rank_num']}】{hot['title']}\n"
-        result_text += f"热度：{hot['hot_value']}\n"
+        result_text += f"热度：{format_hot_value(hot)}\n"
         result_text += f"链接：{hot['link']}\n"
         if hot['analysis_content']:
             result_text += f"AI总结：{hot['analysis_content']}\n"
@@ -92,7 +104,7 @@ def format_all_hot_searches(hot_searches):
     
     # 遍历每条热搜，只添加排名、标题和热度
     for hot in hot_searches:
-        result_text += f"{hot['rank_num']}. {hot['title']} - 热度: {hot['hot_value']}\n"
+        result_text += f"{hot['rank_num']}. {hot['title']} - 热度: {format_hot_value(hot)}\n"
     
     # 添加更新时间
     update_time = hot_searches[0]['update_time'] if hot_searches[0]['update_time'] else time.strftime('%Y-%m-%d %H:%M:%S')
@@ -135,7 +147,7 @@ def format_single_hot_search(hot):
     
     # 添加热搜详细信息
     result_text += f"【{hot['rank_num']}】{hot['title']}\n"
-    result_text += f"热度：{hot['hot_value']}\n"
+    result_text += f"热度：{format_hot_value(hot)}\n"
     result_text += f"链接：{hot['link']}\n"
     if hot['analysis_content']:
         result_text += f"AI总结：{hot['analysis_content']}\n"
@@ -189,7 +201,7 @@ def format_top_five_hot_searches(hot_searches):
     # 遍历前5条热搜，添加到结果文本中
     for hot in top_five:
         result_text += f"【{hot['rank_num']}】{hot['title']}\n"
-        result_text += f"热度：{hot['hot_value']}\n"
+        result_text += f"热度：{format_hot_value(hot)}\n"
         result_text += f"链接：{hot['link']}\n"
         if hot['analysis_content']:
             result_text += f"AI总结：{hot['analysis_content']}\n"